@@ -1,86 +1,290 @@
-from flask import Flask, request, send_file, jsonify, make_response
+from flask import Flask, Request, Response, g, request, send_file, jsonify, make_response, stream_with_context, url_for
 from flask_cors import CORS
+import io
 import os
+import re
+import json
+import time
 import uuid
-import threading
+from urllib.parse import urlencode
 from werkzeug.utils import secure_filename
 
 from utils.youtube import download_youtube_mp3
+from utils.warmup import memory_usage
+from utils.preview import preview_store, PREVIEW_TTL, PREVIEW_MIN_WIDTH, PREVIEW_MAX_WIDTH
 from utils.generate import generate_qr_code
 from utils.merge import merge_pdfs
-from utils.split import split_pdf_ranges
-from utils.compress import compress_pdf
+from utils.split import split_pdf_ranges, iter_split_pdf_ranges, parse_ranges
+from utils.compress import compress_pdf, COMPRESSION_MODES, IMAGE_SETTINGS
+from utils.pdfdocx import parse_page_ranges
 from utils.convert import (
     docx_to_pdf as docx_to_pdf_func,
     pdf_to_word as pdf_to_word_func,
     images_to_pdf,
+    PAGE_SIZES,
     pdf_to_images,
+    iter_pdf_images,
     pptx_to_pdf,
     pdf_to_pptx,
+    PPTX_FORMATS,
     xlsx_to_pdf,
     pdf_to_xlsx,
+    TABLE_LAYOUTS,
     zip_files
 )
 from utils.remover import remove_background
-from utils.imgTools import image_to_text, compress_image, upscale_image, to_jpg
+from utils.imgTools import (
+    image_to_text,
+    get_reader,
+    compress_image,
+    upscale_image,
+    upscaled_extension,
+    UpscaleTooLarge,
+    UPSCALE_FORMATS,
+    to_jpg,
+    open_image,
+    parse_image_ops,
+    check_image_ops,
+    iter_image_batch,
+    COMPRESSION_LEVELS,
+    OCR_LANGUAGES,
+    IMAGE_BATCH_MAX_FILES
+)
+from utils.ocr import iter_ocr, pdf_inputs, image_inputs, searchable_pdf
+from utils.pipeline import (
+    parse_steps,
+    open_input,
+    run_document_steps,
+    split_entries,
+    image_entries,
+    PipelineError,
+    FINAL_OPERATIONS
+)
+from utils import jobs
+from utils.models import registry as model_registry
+from utils.scheduler import scheduler, SchedulerBusy
+from utils.zipstream import stream_zip
+from utils.cache import result_cache, hash_upload, make_key, RESULT_RETENTION
+from utils.storage import storage
+from utils.render import open_pdf
+from utils import metrics
+from utils.uploads import (
+    SpooledUpload,
+    UploadTooLarge,
+    check_upload,
+    persist_upload,
+    upload_source,
+    is_pdf_upload,
+    MAX_UPLOAD_MB,
+    MAX_PDF_PAGES,
+    MB
+)
 
-import time
+class UploadRequest(Request):
+    def _get_file_stream(self, total_content_length, content_type, filename=None, content_length=None):
+        # Hash and size uploads while they stream in; small ones never touch disk
+        return SpooledUpload()
 
 app = Flask(__name__)
+app.request_class = UploadRequest
+app.config["MAX_CONTENT_LENGTH"] = MAX_UPLOAD_MB * MB
 CORS(app, resources={r"/*": {"origins": "*"}})
 
-TEMP_DIR = "temp"
-os.makedirs(TEMP_DIR, exist_ok=True)
-
-COMPRESSION_LEVELS = {
-    "high": 30,     # maximum compression (lowest quality)
-    "medium": 60,   # good balance
-    "low": 85       # least compression (highest quality)
+# Tighter limits for the heaviest converters: endpoint -> (max MB, max PDF pages)
+UPLOAD_LIMITS = {
+    "pdf_to_word_route": (50, 300),
+    "pdf_to_pptx_route": (100, 300),
+    "pdf_to_xlsx_route": (100, MAX_PDF_PAGES),
+    "remove_bg_route": (25, None),
+    "image_to_text_route": (25, None),
+    "ocr_route": (100, 200),
+    "upscale_route": (25, None),
 }
 
-def start_temp_cleanup(interval=60, max_age=300):
-    def cleanup():
-        now = time.time()
-        for fname in os.listdir(TEMP_DIR):
-            fpath = os.path.join(TEMP_DIR, fname)
+def request_scratch():
+    """Working directory for the current request, removed once the response is sent."""
+    if "scratch" not in g:
+        g.scratch = storage.scratch_dir()
+    return g.scratch
+
+# -------------------- METRICS --------------------
+
+FORM_MIMETYPES = ("multipart/form-data", "application/x-www-form-urlencoded")
+
+@app.before_request
+def start_request_metrics():
+    metrics.start_request(request.endpoint, request.content_length)
+
+@app.before_request
+def receive_uploads():
+    """Spool and check uploads before any route work starts."""
+    if request.mimetype in FORM_MIMETYPES:
+        max_mb, max_pages = UPLOAD_LIMITS.get(request.endpoint, (MAX_UPLOAD_MB, MAX_PDF_PAGES))
+        if request.content_length and request.content_length > max_mb * MB:
+            return jsonify({"error": f"Upload is larger than {max_mb} MB"}), 413
+
+        # Parsing the form here makes spooling show up as the "receive" stage
+        with metrics.stage("receive"):
+            request.files
+        try:
+            for _, file in request.files.items(multi=True):
+                check_upload(file, max_mb=max_mb, max_pages=max_pages)
+        except UploadTooLarge as e:
+            return jsonify({"error": str(e)}), 413
+    g.view_started = time.perf_counter()
+
+@app.after_request
+def record_request_metrics(response):
+    timer = metrics.current()
+    if timer is None:
+        return response
+
+    view_seconds = time.perf_counter() - g.pop("view_started", timer.started)
+    timer.add_stage("convert", max(0.0, view_seconds - timer.stages.get("persist", 0)))
+    response.headers["Server-Timing"] = timer.server_timing()
+    expose_headers(response, "Server-Timing")
+
+    status = response.status_code
+    respond_started = time.perf_counter()
+
+    def finish():
+        timer.add_stage("respond", time.perf_counter() - respond_started)
+        timer.finish(status)
+
+    if response.direct_passthrough:
+        # send_file: the WSGI server closes the file wrapper once it is sent,
+        # and on-close callbacks are skipped for passthrough bodies
+        timer.output_bytes = response.content_length or 0
+        body = response.response
+        close = getattr(body, "close", None)
+
+        def close_and_finish():
             try:
-                if os.path.isfile(fpath) and now - os.path.getmtime(fpath) > max_age:
-                    os.remove(fpath)
-                    print(f"[Cleanup] Deleted expired file: {fpath}")
-                elif os.path.isdir(fpath):
-                    # Check if any file inside is older than max_age
-                    expired = all(now - os.path.getmtime(os.path.join(fpath, f)) > max_age
-                                  for f in os.listdir(fpath))
-                    if expired:
-                        for f in os.listdir(fpath):
-                            os.remove(os.path.join(fpath, f))
-                        os.rmdir(fpath)
-                        print(f"[Cleanup] Deleted expired folder: {fpath}")
-            except Exception as e:
-                print(f"[Cleanup Error] {e}")
-        threading.Timer(interval, cleanup).start()
-
-    cleanup()
+                if close:
+                    close()
+            finally:
+                finish()
+
+        try:
+            body.close = close_and_finish
+        except AttributeError:
+            finish()
+    elif response.is_streamed:
+        def counted(chunks):
+            for chunk in chunks:
+                timer.output_bytes += len(chunk)
+                yield chunk
+
+        response.response = counted(response.response)
+        response.call_on_close(finish)
+    else:
+        timer.output_bytes = response.content_length or 0
+        response.call_on_close(finish)
+    return response
+
+@app.after_request
+def release_scratch(response):
+    scratch = g.pop("scratch", None)
+    if not scratch:
+        return response
+    if response.direct_passthrough:
+        # send_file already holds its file open and skips on-close callbacks,
+        # so the scratch space can go right away
+        storage.release(scratch)
+    else:
+        response.call_on_close(lambda: storage.release(scratch))
+    return response
 
 def save_temp_file(file, prefix=""):
+    """Save an upload into the request's scratch directory."""
     filename = secure_filename(file.filename)
-    temp_name = f"{prefix}{uuid.uuid4()}_{filename}"
-    temp_path = os.path.join(TEMP_DIR, temp_name)
-    file.save(temp_path)
+    temp_path = os.path.join(request_scratch(), f"{prefix}{uuid.uuid4()}_{filename}")
+    with metrics.stage("persist"):
+        persist_upload(file, temp_path)
+    storage.account(temp_path)
     return temp_path, os.path.splitext(filename)[0]
 
 
-def send_named_file(path, filename):
+def base_name_of(file):
+    return os.path.splitext(secure_filename(file.filename))[0]
+
+
+def cache_key(operation, files, **params):
+    return make_key(operation, [hash_upload(f) for f in files], params)
+
+
+def expose_headers(response, *names):
+    response.headers["Access-Control-Expose-Headers"] = ", ".join(
+        filter(None, [response.headers.get("Access-Control-Expose-Headers"), *names])
+    )
+
+
+def output_location(key, filename):
+    return f"{url_for('output_route', key=key)}?{urlencode({'name': filename})}"
+
+
+def send_named_file(path, filename, key=None):
+    """
+    Send a file as an attachment. With a cache key, the stored entry for
+    the key is sent instead of path (entries are write-once, so this is the
+    copy every other request sees); the key is the ETag and Content-Location
+    points at /outputs/<key>, where the same bytes can be fetched again with
+    Range/If-Range or If-None-Match for RESULT_RETENTION seconds. If nothing
+    is stored under the key, path is sent without advertising it.
+    """
+    stored = result_cache.stored(key) if key else None
+    key = key if stored else None
+    path = stored or path
+    storage.account(path)
     response = make_response(send_file(
         path,
         as_attachment=True,
         download_name=filename,
-        mimetype="application/pdf" if filename.endswith(".pdf") else None
+        mimetype="application/pdf" if filename.endswith(".pdf") else None,
+        etag=key or True,
+        max_age=RESULT_RETENTION if key else None
     ))
     response.headers["Access-Control-Allow-Origin"] = "*"
-    response.headers["Access-Control-Expose-Headers"] = "Content-Disposition"
+    expose_headers(response, "Content-Disposition", "Content-Length", "Content-Range", "Accept-Ranges", "ETag")
+    if key:
+        response.headers["Content-Location"] = output_location(key, filename)
+        response.cache_control.public = False
+        response.cache_control.private = True
+        expose_headers(response, "Content-Location")
     return response
 
+
+def send_zip_stream(entries, filename, key=None):
+    """
+    Send (name, data) entries as a ZIP that is built while it is being downloaded.
+    With a cache key, the archive is also stored in the result cache and can
+    be resumed from Content-Location, even if this download is cut short.
+    Only the one stream that claims the key stores and advertises it.
+    """
+    chunks = stream_zip(entries)
+    claimed = bool(key) and result_cache.claim(key)
+    if claimed:
+        chunks = result_cache.tee(key, chunks)
+    response = Response(stream_with_context(chunks), mimetype="application/zip")
+    response.headers["Content-Disposition"] = f'attachment; filename="{secure_filename(filename)}"'
+    response.headers["Access-Control-Allow-Origin"] = "*"
+    expose_headers(response, "Content-Disposition")
+    if claimed:
+        response.set_etag(key)
+        response.headers["Content-Location"] = output_location(key, filename)
+        expose_headers(response, "ETag", "Content-Location")
+    return response
+
+
+def busy_response(error):
+    response = jsonify({"error": str(error)})
+    response.headers["Retry-After"] = str(error.retry_after)
+    return response, 503
+
+
+def wants_stream():
+    return request.form.get('stream', 'true').lower() not in ("0", "false", "no")
+
 # -------------------- ROUTES --------------------
 
 @app.route('/merge', methods=['POST'])
@@ -89,37 +293,50 @@ def merge():
     if not files:
         return jsonify({"error": "No files provided"}), 400
 
-    paths = []
-    base_name = None
-    for f in files:
-        path, name = save_temp_file(f)
-        if not base_name:
-            base_name = name
-        paths.append(path)
+    output_name = f"{base_name_of(files[0])}_merged.pdf"
+    key = cache_key("merge", files)
+    cached = result_cache.get(key)
+    if cached:
+        return send_named_file(cached, output_name, key=key)
 
-    output_name = f"{base_name}_merged.pdf"
-    output_path = os.path.join(TEMP_DIR, output_name)
-    merge_pdfs(paths, output_path)
+    # Spooled uploads are opened from their files in place, nothing is saved first
+    output_path = os.path.join(request_scratch(), output_name)
+    try:
+        merge_pdfs((upload_source(f) for f in files), output_path)
+    except Exception as e:
+        return jsonify({"error": f"Merge failed: {str(e)}"}), 500
+    result_cache.put(key, output_path)
 
-    return send_named_file(output_path, output_name)
+    return send_named_file(output_path, output_name, key=key)
 
 @app.route('/compress', methods=['POST'])
 def compress_route():
     file = request.files.get('file')
-    power = request.form.get('power', "medium")
+    power = request.form.get('power', "medium").lower()
+    mode = request.form.get('mode', "auto").lower()
     if not file:
         return jsonify({"error": "No file uploaded"}), 400
+    if power not in IMAGE_SETTINGS:
+        return jsonify({"error": "Invalid power. Choose low, medium, or high."}), 400
+    if mode not in COMPRESSION_MODES:
+        return jsonify({"error": "Invalid mode. Choose auto, images, or rasterize."}), 400
 
-    input_path, base_name = save_temp_file(file)
-    output_name = f"{base_name}_compressed.pdf"
-    output_path = os.path.join(TEMP_DIR, output_name)
+    output_name = f"{base_name_of(file)}_compressed.pdf"
+    key = cache_key("compress", [file], power=power, mode=mode)
+    cached = result_cache.get(key)
+    if cached:
+        return send_named_file(cached, output_name, key=key)
+
+    source = upload_source(file)
+    output_path = os.path.join(request_scratch(), output_name)
 
     try:
-        compress_pdf(input_path, output_path, power=power)
+        compress_pdf(source, output_path, power=power, mode=mode)
     except Exception as e:
         return jsonify({"error": f"Compression failed: {str(e)}"}), 500
+    result_cache.put(key, output_path)
 
-    return send_named_file(output_path, output_name)
+    return send_named_file(output_path, output_name, key=key)
 
 @app.route('/split', methods=['POST'])
 def split_route():
@@ -129,42 +346,50 @@ def split_route():
     if not file or not ranges:
         return jsonify({"error": "File and page ranges are required"}), 400
 
-    def parse_ranges(r):
-        parts = r.split(",")
-        result = []
-        for part in parts:
-            part = part.strip()
-            if "-" in part:
-                a, b = map(int, part.split("-"))
-                result.append((a, b))
-            else:
-                page = int(part)
-                result.append((page, page))
-        return result
+    try:
+        ranges_parsed = parse_ranges(ranges)
+    except ValueError:
+        return jsonify({"error": "Invalid page ranges"}), 400
+
+    output_name = f"{base_name_of(file)}_split.zip"
+    key = cache_key("split", [file], ranges=ranges_parsed)
+    cached = result_cache.get(key)
+    if cached:
+        return send_named_file(cached, output_name, key=key)
+
+    if wants_stream():
+        try:
+            parts = iter_split_pdf_ranges(upload_source(file), ranges_parsed)
+        except ValueError as e:
+            return jsonify({"error": str(e)}), 400
+        return send_zip_stream(parts, output_name, key=key)
 
     try:
         # Save
         filename = secure_filename(file.filename)
         ext = os.path.splitext(filename)[1]
         unique_name = f"{uuid.uuid4()}{ext}"
-        input_path = os.path.join(TEMP_DIR, unique_name)
-        file.save(input_path)
+        input_path = os.path.join(request_scratch(), unique_name)
+        with metrics.stage("persist"):
+            persist_upload(file, input_path)
 
         # Output dir
         base_name = os.path.splitext(filename)[0]
-        split_dir = os.path.join(TEMP_DIR, f"split_{uuid.uuid4().hex}")
+        split_dir = os.path.join(request_scratch(), f"split_{uuid.uuid4().hex}")
         os.makedirs(split_dir, exist_ok=True)
 
         # Split
-        ranges_parsed = parse_ranges(ranges)
         split_paths = split_pdf_ranges(input_path, split_dir, ranges_parsed)
 
         # Zip
-        zip_path = os.path.join(TEMP_DIR, f"{base_name}_split.zip")
+        zip_path = os.path.join(request_scratch(), f"{base_name}_split.zip")
         zip_files(split_paths, zip_path)
+        result_cache.put(key, zip_path)
 
-        return send_named_file(zip_path, os.path.basename(zip_path))
+        return send_named_file(zip_path, os.path.basename(zip_path), key=key)
 
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
     except Exception as e:
         import traceback
         traceback.print_exc()
@@ -174,22 +399,56 @@ def split_route():
 @app.route('/docx-to-pdf', methods=['POST'])
 def docx_to_pdf_route():
     file = request.files.get('file')
+    output_name = f"{base_name_of(file)}.pdf"
+    key = cache_key("docx-to-pdf", [file])
+    cached = result_cache.get(key)
+    if cached:
+        return send_named_file(cached, output_name, key=key)
+
     input_path, base_name = save_temp_file(file)
-    output_path = os.path.join(TEMP_DIR, f"{base_name}.pdf")
+    output_path = os.path.join(request_scratch(), output_name)
 
     docx_to_pdf_func(input_path, output_path)
+    result_cache.put(key, output_path)
 
-    return send_named_file(output_path, f"{base_name}.pdf")
+    return send_named_file(output_path, output_name, key=key)
 
 @app.route('/pdf-to-docx', methods=['POST'])
 def pdf_to_word_route():
     file = request.files.get('file')
-    input_path, base_name = save_temp_file(file)
-    output_path = os.path.join(TEMP_DIR, f"{base_name}.docx")
+    pages = request.form.get('pages', '').replace(' ', '')
+    if not file:
+        return jsonify({"error": "No file uploaded"}), 400
+
+    source = upload_source(file)
+    if pages:
+        # Checked against the page count before anything is cached or converted
+        try:
+            doc = open_pdf(source)
+            page_count = doc.page_count
+            doc.close()
+        except Exception as e:
+            return jsonify({"error": f"Could not read upload: {str(e)}"}), 400
+        try:
+            parse_page_ranges(pages, page_count)
+        except ValueError as e:
+            return jsonify({"error": str(e)}), 400
+
+    output_name = f"{base_name_of(file)}.docx"
+    key = cache_key("pdf-to-docx", [file], pages=pages)
+    cached = result_cache.get(key)
+    if cached:
+        return send_named_file(cached, output_name, key=key)
+
+    output_path = os.path.join(request_scratch(), output_name)
 
-    pdf_to_word_func(input_path, output_path)
+    try:
+        pdf_to_word_func(source, output_path, pages=pages)
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    result_cache.put(key, output_path)
 
-    return send_named_file(output_path, f"{base_name}.docx")
+    return send_named_file(output_path, output_name, key=key)
 
 @app.route('/images-to-pdf', methods=['POST'])
 def images_to_pdf_route():
@@ -197,6 +456,22 @@ def images_to_pdf_route():
     if not files:
         return jsonify({"error": "No images uploaded"}), 400
 
+    page_size = request.form.get('page_size', '').lower() or None
+    if page_size and page_size not in PAGE_SIZES:
+        return jsonify({"error": f"Invalid page size. Choose one of: {', '.join(PAGE_SIZES)}."}), 400
+    try:
+        dpi = int(request.form['dpi']) if request.form.get('dpi') else None
+    except ValueError:
+        return jsonify({"error": "dpi must be a number"}), 400
+    if dpi is not None and not 36 <= dpi <= 600:
+        return jsonify({"error": "dpi must be between 36 and 600"}), 400
+
+    output_name = f"{base_name_of(files[0])}_combined.pdf"
+    key = cache_key("images-to-pdf", files, page_size=page_size, dpi=dpi)
+    cached = result_cache.get(key)
+    if cached:
+        return send_named_file(cached, output_name, key=key)
+
     image_paths = []
     base_name = None
     for f in files:
@@ -205,62 +480,125 @@ def images_to_pdf_route():
         if not base_name:
             base_name = name
 
-    output_path = os.path.join(TEMP_DIR, f"{base_name}_combined.pdf")
-    images_to_pdf(image_paths, output_path)
+    output_path = os.path.join(request_scratch(), output_name)
+    images_to_pdf(image_paths, output_path, page_size=page_size, dpi=dpi)
+    result_cache.put(key, output_path)
 
-    return send_named_file(output_path, os.path.basename(output_path))
+    return send_named_file(output_path, output_name, key=key)
 
 @app.route('/pdf-to-images', methods=['POST'])
 def pdf_to_images_route():
     file = request.files.get('file')
     original_name = os.path.splitext(file.filename or "document")[0]
-    file_bytes = file.read()
-
-    image_paths = pdf_to_images(file_bytes)
-    zip_path = os.path.join(TEMP_DIR, f"{original_name}_images.zip")
+    key = cache_key("pdf-to-images", [file])
+    cached = result_cache.get(key)
+    if cached:
+        return send_named_file(cached, f"{original_name}_images.zip", key=key)
+
+    source = upload_source(file)
+
+    if wants_stream():
+        try:
+            pages = iter_pdf_images(source)
+        except Exception as e:
+            return jsonify({"error": f"Could not open PDF: {str(e)}"}), 400
+        return send_zip_stream(pages, f"{original_name}_images.zip", key=key)
+
+    image_paths = pdf_to_images(source, request_scratch())
+    zip_path = os.path.join(request_scratch(), f"{secure_filename(original_name)}_images.zip")
     zip_files(image_paths, zip_path)
+    result_cache.put(key, zip_path)
 
-    return send_named_file(zip_path, os.path.basename(zip_path))
+    return send_named_file(zip_path, os.path.basename(zip_path), key=key)
 
 @app.route('/pptx-to-pdf', methods=['POST'])
 def pptx_to_pdf_route():
     file = request.files.get('file')
+    output_name = f"{base_name_of(file)}.pdf"
+    key = cache_key("pptx-to-pdf", [file])
+    cached = result_cache.get(key)
+    if cached:
+        return send_named_file(cached, output_name, key=key)
+
     input_path, base_name = save_temp_file(file)
-    output_path = os.path.join(TEMP_DIR, f"{base_name}.pdf")
+    output_path = os.path.join(request_scratch(), output_name)
 
     pptx_to_pdf(input_path, output_path)
+    result_cache.put(key, output_path)
 
-    return send_named_file(output_path, f"{base_name}.pdf")
+    return send_named_file(output_path, output_name, key=key)
 
 @app.route('/pdf-to-pptx', methods=['POST'])
 def pdf_to_pptx_route():
     file = request.files.get('file')
-    input_path, base_name = save_temp_file(file)
-    output_path = os.path.join(TEMP_DIR, f"{base_name}.pptx")
+    image_format = request.form.get('format', 'auto').lower()
+    if image_format == 'jpg':
+        image_format = 'jpeg'
+    if image_format not in PPTX_FORMATS:
+        return jsonify({"error": f"Invalid format. Choose one of: {', '.join(PPTX_FORMATS)}."}), 400
+    try:
+        dpi = int(request.form.get('dpi', 150))
+        quality = int(request.form.get('quality', 80))
+    except ValueError:
+        return jsonify({"error": "dpi and quality must be numbers"}), 400
+    if not 36 <= dpi <= 300:
+        return jsonify({"error": "dpi must be between 36 and 300"}), 400
+    if not 1 <= quality <= 95:
+        return jsonify({"error": "quality must be between 1 and 95"}), 400
+
+    output_name = f"{base_name_of(file)}.pptx"
+    key = cache_key("pdf-to-pptx", [file], format=image_format, dpi=dpi, quality=quality)
+    cached = result_cache.get(key)
+    if cached:
+        return send_named_file(cached, output_name, key=key)
 
-    pdf_to_pptx(input_path, output_path)
+    source = upload_source(file)
+    output_path = os.path.join(request_scratch(), output_name)
 
-    return send_named_file(output_path, f"{base_name}.pptx")
+    pdf_to_pptx(source, output_path, dpi=dpi, fmt=image_format, quality=quality)
+    result_cache.put(key, output_path)
+
+    return send_named_file(output_path, output_name, key=key)
 
 @app.route('/xlsx-to-pdf', methods=['POST'])
 def xlsx_to_pdf_route():
     file = request.files.get('file')
-    input_path, base_name = save_temp_file(file)
-    output_path = os.path.join(TEMP_DIR, f"{base_name}.pdf")
+    output_name = f"{base_name_of(file)}.pdf"
+    key = cache_key("xlsx-to-pdf", [file])
+    cached = result_cache.get(key)
+    if cached:
+        return send_named_file(cached, output_name, key=key)
 
-    xlsx_to_pdf(input_path, output_path)
+    output_path = os.path.join(request_scratch(), output_name)
 
-    return send_named_file(output_path, f"{base_name}.pdf")
+    xlsx_to_pdf(upload_source(file), output_path)
+    result_cache.put(key, output_path)
+
+    return send_named_file(output_path, output_name, key=key)
 
 @app.route('/pdf-to-xlsx', methods=['POST'])
 def pdf_to_xlsx_route():
     file = request.files.get('file')
-    input_path, base_name = save_temp_file(file)
-    output_path = os.path.join(TEMP_DIR, f"{base_name}.xlsx")
+    layout = request.form.get('layout', 'combined').lower()
+    if layout not in TABLE_LAYOUTS:
+        return jsonify({"error": f"Invalid layout. Choose one of: {', '.join(TABLE_LAYOUTS)}."}), 400
+
+    output_name = f"{base_name_of(file)}.xlsx"
+    key = cache_key("pdf-to-xlsx", [file], layout=layout)
+    cached = result_cache.get(key)
+    if cached:
+        return send_named_file(cached, output_name, key=key)
+
+    source = upload_source(file)
+    output_path = os.path.join(request_scratch(), output_name)
 
-    pdf_to_xlsx(input_path, output_path)
+    try:
+        pdf_to_xlsx(source, output_path, layout=layout)
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 422
+    result_cache.put(key, output_path)
 
-    return send_named_file(output_path, f"{base_name}.xlsx")
+    return send_named_file(output_path, output_name, key=key)
 
 ## ----- IMAGE -----
 
@@ -270,15 +608,25 @@ def remove_bg_route():
     if not file:
         return jsonify({"error": "No image uploaded"}), 400
 
-    input_path, base_name = save_temp_file(file)
-    output_path = os.path.join(TEMP_DIR, f"{base_name}_nobg.png")
+    output_name = f"{base_name_of(file)}_nobg.png"
+    key = cache_key("remove-bg", [file])
+    cached = result_cache.get(key)
+    if cached:
+        return send_named_file(cached, output_name, key=key)
+
+    source = upload_source(file)
+    output_path = os.path.join(request_scratch(), output_name)
 
     try:
-        remove_background(input_path, output_path)
+        with scheduler.slot("remove-bg"):
+            remove_background(source, output_path)
+    except SchedulerBusy as e:
+        return busy_response(e)
     except Exception as e:
         return jsonify({"error": f"Background removal failed: {str(e)}"}), 500
+    result_cache.put(key, output_path)
 
-    return send_named_file(output_path, os.path.basename(output_path))
+    return send_named_file(output_path, output_name, key=key)
 
 @app.route('/image-to-text', methods=['POST'])
 def image_to_text_route():
@@ -288,14 +636,116 @@ def image_to_text_route():
     if not file:
         return jsonify({"error": "No image uploaded"}), 400
 
-    input_path, _ = save_temp_file(file)
+    key = cache_key("image-to-text", [file], lang=lang)
+    cached = result_cache.get(key)
+    if cached:
+        with open(cached, encoding="utf-8") as f:
+            return jsonify({"text": f.read()})
+
+    source = upload_source(file)
 
     try:
-        text = image_to_text(input_path, lang)
+        with scheduler.slot("ocr"):
+            text = image_to_text(source, lang)
+        result_cache.put_bytes(key, text.encode("utf-8"))
         return jsonify({"text": text})
+    except SchedulerBusy as e:
+        return busy_response(e)
+    except Exception as e:
+        return jsonify({"error": f"OCR failed: {str(e)}"}), 500
+
+
+@app.route('/ocr', methods=['POST'])
+def ocr_route():
+    """
+    OCR several images or a whole PDF in one call. output=json streams one
+    NDJSON line per page as it finishes (or one JSON document with stream=false);
+    output=pdf returns the input as a PDF with a searchable text layer. A
+    page that fails once streaming has started ends the stream with an
+    {"error": ...} line.
+    """
+    files = request.files.getlist('files') or request.files.getlist('file')
+    lang = request.form.get('lang', 'en')
+    output = request.form.get('output', 'json').lower()
+
+    if not files:
+        return jsonify({"error": "No images or PDF uploaded"}), 400
+    if lang not in OCR_LANGUAGES:
+        return jsonify({"error": f"Unsupported language. Choose one of: {', '.join(OCR_LANGUAGES)}."}), 400
+    if output not in ("json", "pdf"):
+        return jsonify({"error": "Invalid output. Choose json or pdf."}), 400
+
+    pdf_files = [f for f in files if is_pdf_upload(f)]
+    if pdf_files and len(files) > 1:
+        return jsonify({"error": "Upload either one PDF or several images"}), 400
+
+    stream = output == "json" and wants_stream()
+    output_format = "pdf" if output == "pdf" else ("ndjson" if stream else "json")
+    output_name = f"{base_name_of(files[0])}_ocr.pdf"
+    key = cache_key("ocr", files, lang=lang, output=output_format)
+    cached = result_cache.get(key)
+    if cached:
+        if output_format == "pdf":
+            return send_named_file(cached, output_name, key=key)
+        return send_file(cached, mimetype="application/x-ndjson" if stream else "application/json")
+
+    sources = [upload_source(f) for f in files]
+    try:
+        # Reject unreadable uploads before a streamed response has started
+        for source in sources[:1] if pdf_files else sources:
+            (open_pdf(source) if pdf_files else open_image(source)).close()
+    except Exception as e:
+        return jsonify({"error": f"Could not read upload: {str(e)}"}), 400
+
+    try:
+        ticket = scheduler.acquire("ocr")
+    except SchedulerBusy as e:
+        return busy_response(e)
+
+    try:
+        # Load the model now, so a failure is still a 500 rather than a broken stream
+        get_reader(lang)
+        inputs = pdf_inputs(sources[0]) if pdf_files else image_inputs(sources)
+        pages = iter_ocr(inputs, lang)
+
+        if output_format == "pdf":
+            output_path = os.path.join(request_scratch(), output_name)
+            if pdf_files:
+                searchable_pdf(pages, output_path, pdf_source=sources[0])
+            else:
+                searchable_pdf(pages, output_path, image_sources=sources)
+            ticket.release()
+            result_cache.put(key, output_path)
+            return send_named_file(output_path, output_name, key=key)
+
+        if output_format == "json":
+            body = json.dumps({"pages": [{"page": p.number + 1, "text": p.text} for p in pages]})
+            ticket.release()
+            result_cache.put_bytes(key, body.encode("utf-8"))
+            return Response(body, mimetype="application/json")
     except Exception as e:
+        ticket.release()
         return jsonify({"error": f"OCR failed: {str(e)}"}), 500
 
+    def lines():
+        for page in pages:
+            yield (json.dumps({"page": page.number + 1, "text": page.text}) + "\n").encode("utf-8")
+
+    def guarded(chunks):
+        # The 200 is already sent, so end with an error line instead of just stopping;
+        # tee drops the partial result when the error passes through it
+        try:
+            yield from chunks
+        except Exception as e:
+            yield (json.dumps({"error": f"OCR failed: {str(e)}"}) + "\n").encode("utf-8")
+
+    chunks = result_cache.tee(key, lines()) if result_cache.claim(key) else lines()
+    response = Response(stream_with_context(guarded(chunks)), mimetype="application/x-ndjson")
+    response.headers["Access-Control-Allow-Origin"] = "*"
+    # The slot is held while pages stream out, and freed even if the client goes away
+    response.call_on_close(ticket.release)
+    return response
+
 
 @app.route('/image-compress', methods=['POST'])
 def compress_image_route():
@@ -310,50 +760,127 @@ def compress_image_route():
 
     quality = COMPRESSION_LEVELS[level]
 
-    input_path, base_name = save_temp_file(file)
-    output_path = os.path.join(TEMP_DIR, f"{base_name}_compressed.jpg")
+    output_name = f"{base_name_of(file)}_compressed.jpg"
+    key = cache_key("image-compress", [file], power=level)
+    cached = result_cache.get(key)
+    if cached:
+        return send_named_file(cached, output_name, key=key)
+
+    source = upload_source(file)
+    output_path = os.path.join(request_scratch(), output_name)
 
     try:
-        compress_image(input_path, output_path, quality=quality)
+        compress_image(source, output_path, quality=quality)
     except Exception as e:
         return jsonify({"error": f"Image compression failed: {str(e)}"}), 500
+    result_cache.put(key, output_path)
 
-    return send_named_file(output_path, os.path.basename(output_path))
+    return send_named_file(output_path, output_name, key=key)
 
 
 @app.route('/upscale', methods=['POST'])
 def upscale_route():
     file = request.files.get('file')
-    scale = int(request.form.get('scale', 2))
+    fmt = request.form.get('format', 'auto').lower()
     if not file:
         return jsonify({"error": "No file uploaded"}), 400
+    try:
+        scale = int(request.form.get('scale', 2))
+    except ValueError:
+        return jsonify({"error": "Scale must be 1-4"}), 400
     if scale < 1 or scale > 4:
         return jsonify({"error": "Scale must be 1-4"}), 400
+    if fmt not in UPSCALE_FORMATS:
+        return jsonify({"error": f"format must be one of {', '.join(UPSCALE_FORMATS)}"}), 400
 
-    input_path, base_name = save_temp_file(file)
-    output_path = os.path.join(TEMP_DIR, f"{base_name}_upscaled.jpg")
+    base_name = base_name_of(file)
+    key = cache_key("upscale", [file], scale=scale, format=fmt)
+    cached = result_cache.get(key)
+    if cached:
+        return send_named_file(cached, f"{base_name}_upscaled.{upscaled_extension(cached)}", key=key)
+
+    source = upload_source(file)
+    output_path = os.path.join(request_scratch(), f"{base_name}_upscaled")
 
     try:
-        upscale_image(input_path, output_path, scale)
+        extension = upscale_image(source, output_path, scale, fmt=fmt)
+    except UpscaleTooLarge as e:
+        return jsonify({"error": str(e)}), 413
     except Exception as e:
         return jsonify({"error": f"Upscaling failed: {str(e)}"}), 500
+    result_cache.put(key, output_path)
 
-    return send_named_file(output_path, os.path.basename(output_path))
+    return send_named_file(output_path, f"{base_name}_upscaled.{extension}", key=key)
 
 @app.route('/to-jpg', methods=['POST'])
 def to_jpg_route():
     file = request.files.get('file')
     if not file:
         return jsonify({"error": "No image uploaded"}), 400
-    input_path, base_name = save_temp_file(file)
-    output_path = os.path.join(TEMP_DIR, f"{base_name}.jpg")
+
+    output_name = f"{base_name_of(file)}.jpg"
+    key = cache_key("to-jpg", [file])
+    cached = result_cache.get(key)
+    if cached:
+        return send_named_file(cached, output_name, key=key)
+
+    source = upload_source(file)
+    output_path = os.path.join(request_scratch(), output_name)
     
     try:
-        to_jpg(input_path, output_path)
+        to_jpg(source, output_path)
     except Exception as e:
         return jsonify({"error": f"Conversion to JPG failed: {str(e)}"}), 500
+    result_cache.put(key, output_path)
     
-    return send_named_file(output_path, os.path.basename(output_path))
+    return send_named_file(output_path, output_name, key=key)
+
+@app.route('/image-batch', methods=['POST'])
+def image_batch_route():
+    """
+    Apply an ordered list of image operations (ops, see imgTools.parse_image_ops)
+    to many images; each image is decoded once and the results stream back as a ZIP.
+    """
+    files = request.files.getlist('files')
+    if not files:
+        return jsonify({"error": "No images uploaded"}), 400
+    if len(files) > IMAGE_BATCH_MAX_FILES:
+        return jsonify({"error": f"At most {IMAGE_BATCH_MAX_FILES} images per batch"}), 400
+    try:
+        ops = parse_image_ops(request.form.get('ops'))
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+
+    output_name = "images.zip"
+    names = [base_name_of(f) or "image" for f in files]
+    # Entry names come from the uploads, so they are part of the result; hex
+    # so make_key's lower-casing cannot merge names that differ only in case
+    key = cache_key("image-batch", files, ops=json.dumps(ops, sort_keys=True),
+                    names=json.dumps(names).encode("utf-8").hex())
+    cached = result_cache.get(key)
+    if cached:
+        return send_named_file(cached, output_name, key=key)
+
+    sources = [upload_source(f) for f in files]
+    try:
+        # Reject unreadable uploads and oversized upscales before the streamed response has started
+        for source in sources:
+            check_image_ops(ops, source)
+    except UpscaleTooLarge as e:
+        return jsonify({"error": str(e)}), 400
+    except Exception as e:
+        return jsonify({"error": f"Could not read upload: {str(e)}"}), 400
+
+    def entries():
+        used = set()
+        for index, data, ext in iter_image_batch(sources, ops):
+            name = f"{names[index]}.{ext}"
+            if name in used:
+                name = f"{names[index]}_{index + 1}.{ext}"
+            used.add(name)
+            yield name, data
+
+    return send_zip_stream(entries(), output_name, key=key)
 
 @app.route('/qr-generator', methods=['POST'])
 def qr_generator_route():
@@ -366,7 +893,7 @@ def qr_generator_route():
         return jsonify({"error": "Text cannot be empty"}), 400
 
     output_filename = f"qr_{uuid.uuid4().hex}.png"
-    output_path = os.path.join(TEMP_DIR, output_filename)
+    output_path = os.path.join(request_scratch(), output_filename)
 
     try:
         generate_qr_code(text, output_path)
@@ -387,16 +914,254 @@ def youtube_mp3_route():
 
     url = data['url']
     try:
-        mp3_path, title = download_youtube_mp3(url, TEMP_DIR)
+        mp3_path, title, key = download_youtube_mp3(url)
         safe_title = f"{secure_filename(title)}.mp3"
-        return send_named_file(mp3_path, safe_title)
+        return send_named_file(mp3_path, safe_title, key=key)
     except Exception as e:
         return jsonify({"error": f"Download failed: {str(e)}"}), 500
 
+## ----- PIPELINE -----
+
+@app.route('/pipeline', methods=['POST'])
+def pipeline_route():
+    """
+    Run several PDF operations in one request, e.g.
+    steps=[{"op": "merge"}, {"op": "compress", "power": "low"}, {"op": "split", "ranges": "1-3,4-6"}].
+    Intermediate documents stay open in memory; only the final result is sent.
+    """
+    files = request.files.getlist('files') or request.files.getlist('file')
+    if not files:
+        return jsonify({"error": "No files provided"}), 400
+    if not all(is_pdf_upload(f) for f in files):
+        return jsonify({"error": "Pipelines only accept PDF uploads"}), 400
+    try:
+        steps = parse_steps(request.form.get('steps'), len(files))
+    except PipelineError as e:
+        return jsonify({"error": str(e)}), 400
+
+    final = steps[-1] if steps[-1]["op"] in FINAL_OPERATIONS else None
+    base_name = base_name_of(files[0])
+    if final is None:
+        output_name = f"{base_name}_processed.pdf"
+    elif final["op"] == "split":
+        output_name = f"{base_name}_split.zip"
+    elif final["op"] == "pdf-to-images":
+        output_name = f"{base_name}_images.zip"
+    elif final["output"] == "pdf":
+        output_name = f"{base_name}_ocr.pdf"
+    else:
+        output_name = f"{base_name}_ocr.json"
+
+    key = cache_key("pipeline", files, steps=json.dumps(steps, sort_keys=True))
+    cached = result_cache.get(key)
+    if cached:
+        if output_name.endswith(".json"):
+            return send_file(cached, mimetype="application/json")
+        return send_named_file(cached, output_name, key=key)
+
+    try:
+        doc = open_input([upload_source(f) for f in files])
+    except Exception as e:
+        return jsonify({"error": f"Could not read upload: {str(e)}"}), 400
+
+    try:
+        doc = run_document_steps(doc, steps[:-1] if final else steps)
+        if final and final["op"] == "ocr" and doc.page_count > UPLOAD_LIMITS["ocr_route"][1]:
+            raise PipelineError(f"OCR is limited to {UPLOAD_LIMITS['ocr_route'][1]} pages")
+    except ValueError as e:
+        doc.close()
+        return jsonify({"error": str(e)}), 400
+    except Exception as e:
+        doc.close()
+        return jsonify({"error": f"Pipeline failed: {str(e)}"}), 500
+
+    if final is None:
+        output_path = os.path.join(request_scratch(), output_name)
+        try:
+            doc.save(output_path, garbage=3, deflate=True, use_objstms=1)
+        finally:
+            doc.close()
+        result_cache.put(key, output_path)
+        return send_named_file(output_path, output_name, key=key)
+
+    if final["op"] == "split":
+        try:
+            entries = split_entries(doc, final)
+        except ValueError as e:
+            return jsonify({"error": str(e)}), 400
+        return send_zip_stream(entries, output_name, key=key)
+
+    if final["op"] == "pdf-to-images":
+        return send_zip_stream(image_entries(doc, final), output_name, key=key)
+
+    try:
+        ticket = scheduler.acquire("ocr")
+    except SchedulerBusy as e:
+        doc.close()
+        return busy_response(e)
+    try:
+        pages = iter_ocr(pdf_inputs(doc), final["lang"])
+        if final["output"] == "pdf":
+            output_path = os.path.join(request_scratch(), output_name)
+            searchable_pdf(pages, output_path, pdf_source=doc)
+            result_cache.put(key, output_path)
+            return send_named_file(output_path, output_name, key=key)
+        body = json.dumps({"pages": [{"page": p.number + 1, "text": p.text} for p in pages]})
+        result_cache.put_bytes(key, body.encode("utf-8"))
+        return Response(body, mimetype="application/json")
+    except Exception as e:
+        return jsonify({"error": f"OCR failed: {str(e)}"}), 500
+    finally:
+        ticket.release()
+        if not doc.is_closed:
+            doc.close()
+
+## ----- PREVIEW -----
+
+@app.route('/preview', methods=['POST'])
+def preview_register_route():
+    """Register a PDF for page previews; returns its handle and page count."""
+    file = request.files.get('file')
+    if not file:
+        return jsonify({"error": "No file uploaded"}), 400
+
+    handle = hash_upload(file)
+    try:
+        pages = preview_store.register(upload_source(file), handle)
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    except RuntimeError as e:
+        return jsonify({"error": str(e)}), 503
+    return jsonify({
+        "handle": handle,
+        "pages": pages,
+        "url": url_for('preview_page_route', handle=handle, page=1),
+        "expires_in": PREVIEW_TTL,
+    })
+
+@app.route('/preview/<handle>', methods=['GET'])
+def preview_info_route(handle):
+    pages = preview_store.page_count(handle) if re.fullmatch(r"[0-9a-f]{64}", handle) else None
+    if not pages:
+        return jsonify({"error": "Preview not found or expired"}), 404
+    return jsonify({"handle": handle, "pages": pages, "expires_in": PREVIEW_TTL})
+
+@app.route('/preview/<handle>/<int:page>', methods=['GET'])
+def preview_page_route(handle, page):
+    """Page (1-based) of a registered PDF as an image w pixels wide (default 200)."""
+    if not re.fullmatch(r"[0-9a-f]{64}", handle):
+        return jsonify({"error": "Preview not found or expired"}), 404
+    try:
+        width = int(request.args.get('w', 200))
+    except ValueError:
+        width = 0
+    if not PREVIEW_MIN_WIDTH <= width <= PREVIEW_MAX_WIDTH:
+        return jsonify({"error": f"w must be between {PREVIEW_MIN_WIDTH} and {PREVIEW_MAX_WIDTH}"}), 400
+
+    try:
+        result = preview_store.render(handle, page - 1, width)
+    except IndexError as e:
+        return jsonify({"error": str(e)}), 404
+    if result is None:
+        return jsonify({"error": "Preview not found or expired"}), 404
+
+    data, mimetype = result
+    # The handle is the document's hash, so a page at a given width never changes
+    return send_file(io.BytesIO(data), mimetype=mimetype, etag=f"{handle}-{page}-{width}", max_age=PREVIEW_TTL)
+
+## ----- OUTPUTS -----
+
+@app.route('/outputs/<key>', methods=['GET'])
+def output_route(key):
+    """Re-download a recent result by its ETag; supports Range/If-Range and If-None-Match."""
+    path = result_cache.get(key, max_age=RESULT_RETENTION) if re.fullmatch(r"[0-9a-f]{64}", key) else None
+    if not path:
+        return jsonify({"error": "Output not found or expired"}), 404
+    name = secure_filename(request.args.get('name', '')) or key
+    return send_named_file(path, name, key=key)
+
+## ----- JOBS -----
+
+@app.route('/jobs/<operation>', methods=['POST'])
+def create_job_route(operation):
+    if operation not in jobs.OPERATIONS:
+        return jsonify({"error": f"Unsupported operation: {operation}"}), 404
+
+    file = request.files.get('file')
+    if not file:
+        return jsonify({"error": "No file uploaded"}), 400
+
+    filename = secure_filename(file.filename)
+    output_name = f"{os.path.splitext(filename)[0]}{jobs.output_suffix(operation)}"
+    input_path, output_path = jobs.job_paths(filename, output_name)
+    with metrics.stage("persist"):
+        persist_upload(file, input_path)
+
+    try:
+        job = jobs.submit(operation, input_path, output_path, output_name, request.form.to_dict())
+    except jobs.JobQueueFull as e:
+        jobs.discard(input_path, output_path)
+        response = jsonify({"error": str(e)})
+        response.headers["Retry-After"] = "5"
+        return response, 503
+
+    return jsonify(job), 202
+
+@app.route('/jobs/<job_id>', methods=['GET'])
+def job_status_route(job_id):
+    job = jobs.get_job(job_id)
+    if not job:
+        return jsonify({"error": "Job not found"}), 404
+    return jsonify(job)
+
+@app.route('/jobs/<job_id>/result', methods=['GET'])
+def job_result_route(job_id):
+    job = jobs.get_job(job_id)
+    if not job:
+        return jsonify({"error": "Job not found"}), 404
+    if job["status"] == "failed":
+        return jsonify({"error": job["error"]}), 500
+
+    result = jobs.get_result(job_id)
+    if not result:
+        return jsonify({"error": "Job not finished", "status": job["status"]}), 409
+
+    output_path, output_name = result
+    return send_named_file(output_path, output_name)
+
+@app.route('/models', methods=['GET'])
+def models_route():
+    return jsonify(model_registry.stats())
+
+@app.route('/cache', methods=['GET'])
+def cache_route():
+    return jsonify(result_cache.stats())
+
+@app.route('/storage', methods=['GET'])
+def storage_route():
+    return jsonify(storage.stats())
+
+@app.route('/scheduler', methods=['GET'])
+def scheduler_route():
+    return jsonify(scheduler.stats())
+
+@app.route('/metrics', methods=['GET'])
+def metrics_route():
+    gauges = {
+        "model_registry": model_registry.stats(),
+        "result_cache": result_cache.stats(),
+        "temp_storage": storage.stats(),
+        "process_memory": memory_usage(),
+        "preview": preview_store.stats(),
+    }
+    for operation, stats in scheduler.stats().items():
+        gauges[f"scheduler_{operation.replace('-', '_')}"] = stats
+    body = metrics.render(gauges)
+    return Response(body, mimetype="text/plain; version=0.0.4")
+
 @app.route('/')
 def home():
     return "PDF API is running"
 
 if __name__ == "__main__":
-    start_temp_cleanup()  # Every 60 seconds, deletes files older than 300s (5 min)
     app.run(debug=True, use_reloader=False)
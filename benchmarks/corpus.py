@@ -0,0 +1,171 @@
+"""
+Deterministic synthetic corpus for the benchmarks.
+Every file is generated offline from a fixed seed, so two runs on the
+same library versions produce the same inputs.
+"""
+import io
+import os
+import random
+
+import fitz
+from PIL import Image, ImageDraw
+
+CORPUS_SEED = 1234
+CORPUS_DIR = os.path.join(os.path.dirname(__file__), ".corpus")
+
+WORDS = (
+    "invoice report quarter revenue total amount balance account payment "
+    "summary customer order shipment delivery period growth margin budget "
+    "forecast expense income asset liability equity statement schedule"
+).split()
+
+# name -> (width, height)
+IMAGE_SIZES = {
+    "small": (640, 480),
+    "medium": (1920, 1080),
+    "large": (4000, 3000),
+}
+
+
+def _sentence(rng, words=12):
+    return " ".join(rng.choice(WORDS) for _ in range(words)).capitalize() + "."
+
+
+def make_image(rng, width, height):
+    img = Image.linear_gradient("L").resize((width, height)).convert("RGB")
+    draw = ImageDraw.Draw(img)
+    for _ in range(40):
+        x0, y0 = rng.randrange(width), rng.randrange(height)
+        x1, y1 = x0 + rng.randrange(width // 4 + 1), y0 + rng.randrange(height // 4 + 1)
+        color = (rng.randrange(256), rng.randrange(256), rng.randrange(256))
+        if rng.random() < 0.5:
+            draw.rectangle([x0, y0, x1, y1], fill=color)
+        else:
+            draw.ellipse([x0, y0, x1, y1], fill=color)
+    return img
+
+
+def _jpeg_bytes(img, quality=85):
+    buffer = io.BytesIO()
+    img.save(buffer, "JPEG", quality=quality)
+    return buffer.getvalue()
+
+
+def _draw_table(page, rng, top, rows=8, cols=4):
+    left, width, row_height = 72, page.rect.width - 144, 18
+    col_width = width / cols
+    for r in range(rows + 1):
+        y = top + r * row_height
+        page.draw_line((left, y), (left + width, y))
+    for c in range(cols + 1):
+        x = left + c * col_width
+        page.draw_line((x, top), (x, top + rows * row_height))
+    for r in range(rows):
+        for c in range(cols):
+            text = f"Col {c + 1}" if r == 0 else f"{rng.randrange(10000) / 100:.2f}"
+            page.insert_text((left + c * col_width + 4, top + r * row_height + 13), text, fontsize=9)
+    return top + rows * row_height
+
+
+def make_pdf(rng, pages, images=True, tables=True):
+    """Multi-page PDF mixing paragraphs, a ruled table and an embedded photo per page."""
+    doc = fitz.open()
+    for number in range(pages):
+        page = doc.new_page()
+        page.insert_text((72, 60), f"Section {number + 1}", fontsize=16)
+        text = " ".join(_sentence(rng) for _ in range(8))
+        page.insert_textbox(fitz.Rect(72, 80, page.rect.width - 72, 260), text, fontsize=10)
+        y = 270
+        if tables:
+            y = _draw_table(page, rng, y) + 12
+        if images:
+            photo = _jpeg_bytes(make_image(rng, 1200, 800))
+            page.insert_image(fitz.Rect(72, y, page.rect.width - 72, y + 280), stream=photo)
+    data = doc.tobytes(garbage=3, deflate=True)
+    doc.close()
+    return data
+
+
+def make_scan_pdf(rng, pages):
+    """PDF whose pages are a single full-page image and no text, like a scanner output."""
+    doc = fitz.open()
+    for _ in range(pages):
+        page = doc.new_page()
+        page.insert_image(page.rect, stream=_jpeg_bytes(make_image(rng, 1700, 2200), quality=90))
+    data = doc.tobytes(garbage=3, deflate=True)
+    doc.close()
+    return data
+
+
+def make_docx(rng, path, paragraphs=60):
+    from docx import Document
+
+    document = Document()
+    document.add_heading("Benchmark document", 0)
+    for i in range(paragraphs):
+        if i % 15 == 0:
+            document.add_heading(f"Chapter {i // 15 + 1}", level=1)
+        document.add_paragraph(" ".join(_sentence(rng) for _ in range(4)))
+    table = document.add_table(rows=10, cols=4)
+    for row in table.rows:
+        for cell in row.cells:
+            cell.text = str(rng.randrange(1000))
+    document.save(path)
+
+
+def make_xlsx(rng, path, rows=2000, cols=8):
+    from openpyxl import Workbook
+
+    workbook = Workbook(write_only=True)
+    sheet = workbook.create_sheet("Sheet1")
+    sheet.append([f"col_{c + 1}" for c in range(cols)] + ["label"])
+    for _ in range(rows):
+        sheet.append([rng.randrange(100000) / 100 for _ in range(cols)] + [rng.choice(WORDS)])
+    workbook.save(path)
+
+
+def make_pptx(rng, path, slides=10):
+    from pptx import Presentation
+    from pptx.util import Inches
+
+    prs = Presentation()
+    for number in range(slides):
+        slide = prs.slides.add_slide(prs.slide_layouts[1])
+        slide.shapes.title.text = f"Slide {number + 1}"
+        slide.placeholders[1].text = "\n".join(_sentence(rng, 6) for _ in range(4))
+        buffer = io.BytesIO(_jpeg_bytes(make_image(rng, 800, 600)))
+        slide.shapes.add_picture(buffer, Inches(6), Inches(4), width=Inches(3))
+    prs.save(path)
+
+
+def build_corpus(directory=CORPUS_DIR, seed=CORPUS_SEED):
+    """Generate the corpus into directory (if missing) and return {name: path}."""
+    os.makedirs(directory, exist_ok=True)
+
+    builders = {
+        "doc_5p.pdf": lambda rng, p: _write(p, make_pdf(rng, 5)),
+        "doc_50p.pdf": lambda rng, p: _write(p, make_pdf(rng, 50)),
+        "text_20p.pdf": lambda rng, p: _write(p, make_pdf(rng, 20, images=False)),
+        "scan_10p.pdf": lambda rng, p: _write(p, make_scan_pdf(rng, 10)),
+        "report.docx": make_docx,
+        "sheet.xlsx": make_xlsx,
+        "deck.pptx": make_pptx,
+    }
+    for size, (width, height) in IMAGE_SIZES.items():
+        builders[f"image_{size}.png"] = lambda rng, p, w=width, h=height: make_image(rng, w, h).save(p, "PNG")
+        builders[f"image_{size}.jpg"] = lambda rng, p, w=width, h=height: make_image(rng, w, h).save(p, "JPEG", quality=90)
+
+    files = {}
+    for name, build in builders.items():
+        path = os.path.join(directory, name)
+        if not os.path.exists(path):
+            # Each file gets its own rng, so files can be rebuilt independently
+            build(random.Random(f"{seed}:{name}"), path)
+        files[name] = path
+
+    return files
+
+
+def _write(path, data):
+    with open(path, "wb") as f:
+        f.write(data)
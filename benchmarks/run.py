@@ -0,0 +1,448 @@
+"""
+Benchmark every route in app.py (through the Flask test client) and the
+util functions behind them (called directly).
+
+    python -m benchmarks.run                          # run and write results
+    python -m benchmarks.run --only compress          # cases whose name contains "compress"
+    python -m benchmarks.run --baseline benchmarks/baseline.json
+    python -m benchmarks.run --save-baseline benchmarks/baseline.json
+
+Each case runs in its own forked process, so the reported peak RSS
+belongs to that case alone. With --baseline, the run fails (exit code 1)
+when a case's p50 latency or peak RSS grows by more than --threshold.
+"""
+import os
+import sys
+import json
+import time
+import shutil
+import argparse
+import platform
+import resource
+import tempfile
+import multiprocessing
+
+# The result cache would turn every repeat into a hit, and benchmark files
+# should not mix with a real deployment's temp directory
+os.environ.setdefault("RESULT_CACHE_MAX_MB", "0")
+os.environ.setdefault("TEMP_DIR", os.path.join(tempfile.gettempdir(), "fileconv-bench"))
+os.environ.setdefault("PREVIEW_DIR", os.path.join(tempfile.gettempdir(), "fileconv-bench-previews"))
+
+from benchmarks.corpus import build_corpus, CORPUS_SEED
+
+DEFAULT_OUTPUT = os.path.join(os.path.dirname(__file__), "results.json")
+
+
+# -------------------- CASES --------------------
+# A case is (name, tags, function(ctx) -> output size in bytes).
+# ctx holds the corpus paths, a Flask test client and a scratch directory.
+
+def _post(ctx, route, files, data=None, field="file"):
+    form = dict(data or {})
+    handles = [(open(ctx["corpus"][name], "rb"), name) for name in files]
+    form[field] = handles if field == "files" else handles[0]
+    try:
+        response = ctx["client"].post(route, data=form, content_type="multipart/form-data")
+        body = response.get_data()
+        response.close()
+    finally:
+        for handle, _ in handles:
+            handle.close()
+    if response.status_code >= 400:
+        raise RuntimeError(f"{route} returned {response.status_code}: {body[:200]!r}")
+    return len(body)
+
+
+def _post_json(ctx, route, payload):
+    response = ctx["client"].post(route, json=payload)
+    body = response.get_data()
+    response.close()
+    if response.status_code >= 400:
+        raise RuntimeError(f"{route} returned {response.status_code}: {body[:200]!r}")
+    return len(body)
+
+
+def _get(ctx, route):
+    response = ctx["client"].get(route)
+    body = response.get_data()
+    if response.status_code >= 400:
+        raise RuntimeError(f"{route} returned {response.status_code}")
+    return len(body)
+
+
+def _job(ctx, operation, file, data=None):
+    client = ctx["client"]
+    with open(ctx["corpus"][file], "rb") as f:
+        form = dict(data or {}, file=(f, file))
+        job = client.post(f"/jobs/{operation}", data=form, content_type="multipart/form-data").get_json()
+    while True:
+        status = client.get(f"/jobs/{job['id']}").get_json()
+        if status["status"] in ("done", "failed"):
+            break
+        time.sleep(0.05)
+    if status["status"] == "failed":
+        raise RuntimeError(status["error"])
+    return len(client.get(f"/jobs/{job['id']}/result").get_data())
+
+
+PREVIEW_PAGES = 10
+_preview_widths = iter(range(200, 1000))
+
+
+def _preview(ctx, fresh=False):
+    """Register doc_50p.pdf and fetch thumbnails of its first pages, as a viewer would."""
+    client = ctx["client"]
+    with open(ctx["corpus"]["doc_50p.pdf"], "rb") as f:
+        response = client.post("/preview", data={"file": (f, "doc_50p.pdf")}, content_type="multipart/form-data")
+    if response.status_code >= 400:
+        raise RuntimeError(f"/preview returned {response.status_code}: {response.get_data()[:200]!r}")
+    handle = response.get_json()["handle"]
+    # A width not asked for before misses the page cache, so every page is rendered
+    width = next(_preview_widths) if fresh else 200
+    return sum(_get(ctx, f"/preview/{handle}/{page}?w={width}") for page in range(1, PREVIEW_PAGES + 1))
+
+
+def _preview_handle(ctx):
+    # Registered once per case; the timed part is the GET
+    if "preview_handle" not in ctx:
+        with open(ctx["corpus"]["doc_50p.pdf"], "rb") as f:
+            response = ctx["client"].post("/preview", data={"file": (f, "doc_50p.pdf")},
+                                          content_type="multipart/form-data")
+        ctx["preview_handle"] = response.get_json()["handle"]
+    return ctx["preview_handle"]
+
+
+def _preview_page(ctx):
+    return _get(ctx, f"/preview/{_preview_handle(ctx)}/1?w={next(_preview_widths)}")
+
+
+def _outputs(ctx):
+    """Re-download a stored result; the result cache is switched on for this case only."""
+    if "output_url" not in ctx:
+        import app
+        from utils.cache import ResultCache
+        app.result_cache = ResultCache(os.path.join(ctx["scratch"], "results"), 256 * 1024 * 1024)
+        with open(ctx["corpus"]["doc_50p.pdf"], "rb") as f:
+            response = ctx["client"].post("/compress", data={"file": (f, "doc_50p.pdf")},
+                                          content_type="multipart/form-data")
+        response.get_data()
+        ctx["output_url"] = response.headers["Content-Location"]
+    return _get(ctx, ctx["output_url"])
+
+
+def _out(ctx, name):
+    return os.path.join(ctx["scratch"], name)
+
+
+def _size(path):
+    return os.path.getsize(path)
+
+
+def _util_compress(ctx, file, mode):
+    from utils.compress import compress_pdf
+    compress_pdf(ctx["corpus"][file], _out(ctx, "c.pdf"), power="medium", mode=mode)
+    return _size(_out(ctx, "c.pdf"))
+
+
+def _util_merge(ctx):
+    from utils.merge import merge_pdfs
+    merge_pdfs([ctx["corpus"]["doc_5p.pdf"], ctx["corpus"]["text_20p.pdf"]], _out(ctx, "m.pdf"))
+    return _size(_out(ctx, "m.pdf"))
+
+
+def _util_split(ctx):
+    from utils.split import iter_split_pdf_ranges
+    return sum(len(data) for _, data in iter_split_pdf_ranges(ctx["corpus"]["doc_50p.pdf"], [(1, 10), (20, 30)]))
+
+
+def _util_convert(func_name, file, suffix, *args):
+    def run(ctx):
+        from utils import convert
+        getattr(convert, func_name)(ctx["corpus"][file], _out(ctx, f"out{suffix}"), *args)
+        return _size(_out(ctx, f"out{suffix}"))
+    return run
+
+
+def _util_images_to_pdf(ctx):
+    from utils.convert import images_to_pdf
+    files = ["image_medium.jpg", "image_small.png", "image_large.jpg"]
+    images_to_pdf([ctx["corpus"][f] for f in files], _out(ctx, "i.pdf"))
+    return _size(_out(ctx, "i.pdf"))
+
+
+def _util_pdf_to_images(ctx):
+    from utils.convert import iter_pdf_images
+    with open(ctx["corpus"]["doc_5p.pdf"], "rb") as f:
+        return sum(len(data) for _, data in iter_pdf_images(f.read()))
+
+
+def _util_render(ctx):
+    from utils.render import render_pages
+    return sum(len(page.data) for page in render_pages(ctx["corpus"]["doc_50p.pdf"], dpi=150))
+
+
+def _util_image(func_name, file, suffix, *args):
+    def run(ctx):
+        from utils import imgTools
+        getattr(imgTools, func_name)(ctx["corpus"][file], _out(ctx, f"img{suffix}"), *args)
+        return _size(_out(ctx, f"img{suffix}"))
+    return run
+
+
+def _util_ocr(ctx):
+    from utils.imgTools import image_to_text
+    return len(image_to_text(ctx["corpus"]["image_small.png"], "en").encode("utf-8"))
+
+
+def _util_remove_bg(ctx):
+    from utils.remover import remove_background
+    remove_background(ctx["corpus"]["image_small.jpg"], _out(ctx, "nobg.png"))
+    return _size(_out(ctx, "nobg.png"))
+
+
+def _util_qr(ctx):
+    from utils.generate import generate_qr_code
+    generate_qr_code("https://example.com/benchmark", _out(ctx, "qr.png"))
+    return _size(_out(ctx, "qr.png"))
+
+
+class FakeExtractor:
+    """Stands in for yt-dlp: a 4 MB 'MP3' per video id, no network or ffmpeg."""
+
+    def video_id(self, url):
+        return f"Fake-{url.rsplit('=', 1)[-1]}"
+
+    def download(self, url, output_dir, known=None):
+        cache_id = self.video_id(url)
+        if known and known(cache_id):
+            return cache_id, None, "Benchmark audio"
+        path = os.path.join(output_dir, f"{cache_id}.mp3")
+        with open(path, "wb") as f:
+            f.write(b"ID3" + bytes(4 * 1024 * 1024))
+        return cache_id, path, "Benchmark audio"
+
+
+def _youtube(ctx):
+    from utils.youtube import audio_cache
+    audio_cache.extractor = FakeExtractor()
+    return _post_json(ctx, "/youtube-mp3", {"url": "https://www.youtube.com/watch?v=benchmark"})
+
+
+CASES = [
+    # Routes
+    ("route:merge", [], lambda c: _post(c, "/merge", ["doc_5p.pdf", "text_20p.pdf"], field="files")),
+    ("route:compress-auto", [], lambda c: _post(c, "/compress", ["doc_50p.pdf"])),
+    ("route:compress-images", [], lambda c: _post(c, "/compress", ["doc_50p.pdf"], {"mode": "images"})),
+    ("route:compress-rasterize", [], lambda c: _post(c, "/compress", ["scan_10p.pdf"], {"mode": "rasterize"})),
+    ("route:split", [], lambda c: _post(c, "/split", ["doc_50p.pdf"], {"ranges": "1-10,20-30"})),
+    ("route:pipeline", [], lambda c: _post(
+        c, "/pipeline", ["doc_5p.pdf", "text_20p.pdf"],
+        {"steps": '["merge", {"op": "compress", "mode": "images"}, {"op": "split", "ranges": "1-5,6-25"}]'},
+        field="files"
+    )),
+    ("route:docx-to-pdf", [], lambda c: _post(c, "/docx-to-pdf", ["report.docx"])),
+    ("route:pdf-to-docx", [], lambda c: _post(c, "/pdf-to-docx", ["doc_5p.pdf"])),
+    ("route:images-to-pdf", [], lambda c: _post(c, "/images-to-pdf", ["image_medium.jpg", "image_small.png", "image_large.jpg"], field="files")),
+    ("route:pdf-to-images", [], lambda c: _post(c, "/pdf-to-images", ["doc_5p.pdf"])),
+    ("route:pptx-to-pdf", ["office"], lambda c: _post(c, "/pptx-to-pdf", ["deck.pptx"])),
+    ("route:pdf-to-pptx", [], lambda c: _post(c, "/pdf-to-pptx", ["doc_5p.pdf"])),
+    ("route:xlsx-to-pdf", [], lambda c: _post(c, "/xlsx-to-pdf", ["sheet.xlsx"])),
+    ("route:pdf-to-xlsx", [], lambda c: _post(c, "/pdf-to-xlsx", ["text_20p.pdf"])),
+    ("route:remove-bg", ["model"], lambda c: _post(c, "/remove-bg", ["image_small.jpg"])),
+    ("route:image-to-text", ["model"], lambda c: _post(c, "/image-to-text", ["image_small.png"])),
+    ("route:ocr-pdf", ["model"], lambda c: _post(c, "/ocr", ["scan_10p.pdf"], {"stream": "false"})),
+    ("route:ocr-searchable-pdf", ["model"], lambda c: _post(c, "/ocr", ["scan_10p.pdf"], {"output": "pdf"})),
+    ("route:image-compress", [], lambda c: _post(c, "/image-compress", ["image_large.jpg"], {"power": "medium"})),
+    ("route:upscale", [], lambda c: _post(c, "/upscale", ["image_small.jpg"], {"scale": "2"})),
+    ("route:image-batch", [], lambda c: _post(
+        c, "/image-batch", ["image_large.jpg", "image_medium.jpg", "image_large.png", "image_small.jpg"],
+        {"ops": '[{"op": "resize", "width": 800}, {"op": "compress", "power": "medium"}]'},
+        field="files"
+    )),
+    ("route:to-jpg", [], lambda c: _post(c, "/to-jpg", ["image_medium.png"])),
+    ("route:qr-generator", [], lambda c: _post_json(c, "/qr-generator", {"text": "https://example.com/benchmark"})),
+    ("route:youtube-mp3", [], _youtube),
+    ("route:jobs-compress", [], lambda c: _job(c, "compress", "doc_50p.pdf")),
+    ("route:preview", [], lambda c: _preview(c)),
+    ("route:preview-render", [], lambda c: _preview(c, fresh=True)),
+    ("route:preview-info", [], lambda c: _get(c, f"/preview/{_preview_handle(c)}")),
+    ("route:preview-page", [], _preview_page),
+    ("route:outputs", [], _outputs),
+    ("route:scheduler", [], lambda c: _get(c, "/scheduler")),
+    ("route:home", [], lambda c: _get(c, "/")),
+    ("route:models", [], lambda c: _get(c, "/models")),
+    ("route:cache", [], lambda c: _get(c, "/cache")),
+    ("route:storage", [], lambda c: _get(c, "/storage")),
+    ("route:metrics", [], lambda c: _get(c, "/metrics")),
+    # Utils
+    ("util:compress_pdf-images", [], lambda c: _util_compress(c, "doc_50p.pdf", "images")),
+    ("util:compress_pdf-rasterize", [], lambda c: _util_compress(c, "scan_10p.pdf", "rasterize")),
+    ("util:merge_pdfs", [], _util_merge),
+    ("util:split_pdf_ranges", [], _util_split),
+    ("util:docx_to_pdf", [], _util_convert("docx_to_pdf", "report.docx", ".pdf")),
+    ("util:pdf_to_word", [], _util_convert("pdf_to_word", "doc_5p.pdf", ".docx")),
+    ("util:images_to_pdf", [], _util_images_to_pdf),
+    ("util:pdf_to_images", [], _util_pdf_to_images),
+    ("util:render_pages", [], _util_render),
+    ("util:pptx_to_pdf", ["office"], _util_convert("pptx_to_pdf", "deck.pptx", ".pdf")),
+    ("util:pdf_to_pptx", [], _util_convert("pdf_to_pptx", "doc_5p.pdf", ".pptx")),
+    ("util:xlsx_to_pdf", [], _util_convert("xlsx_to_pdf", "sheet.xlsx", ".pdf")),
+    ("util:pdf_to_xlsx", [], _util_convert("pdf_to_xlsx", "text_20p.pdf", ".xlsx")),
+    ("util:compress_image", [], _util_image("compress_image", "image_large.jpg", ".jpg", 60)),
+    ("util:upscale_image", [], _util_image("upscale_image", "image_small.jpg", ".jpg", 2)),
+    ("util:to_jpg", [], _util_image("to_jpg", "image_medium.png", ".jpg")),
+    ("util:image_to_text", ["model"], _util_ocr),
+    ("util:remove_background", ["model"], _util_remove_bg),
+    ("util:generate_qr_code", [], _util_qr),
+]
+
+
+# -------------------- RUNNER --------------------
+
+def percentile(values, pct):
+    ordered = sorted(values)
+    index = max(0, min(len(ordered) - 1, int(round(pct / 100 * len(ordered) + 0.5)) - 1))
+    return ordered[index]
+
+
+def _run_case(func, corpus, iterations, warmup, conn):
+    # Runs in a forked child, so ru_maxrss below is this case's own peak
+    try:
+        from app import app
+
+        scratch = tempfile.mkdtemp(prefix="bench_")
+        ctx = {"corpus": corpus, "client": app.test_client(), "scratch": scratch}
+        first = None
+        for _ in range(warmup):
+            start = time.perf_counter()
+            func(ctx)
+            first = first or time.perf_counter() - start
+        latencies = []
+        output_bytes = 0
+        for _ in range(iterations):
+            start = time.perf_counter()
+            output_bytes = func(ctx)
+            latencies.append(time.perf_counter() - start)
+        shutil.rmtree(scratch, ignore_errors=True)
+        peak_kb = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        conn.send({
+            "iterations": iterations,
+            "first_ms": round(first * 1000, 2) if first else None,
+            "p50_ms": round(percentile(latencies, 50) * 1000, 2),
+            "p95_ms": round(percentile(latencies, 95) * 1000, 2),
+            "mean_ms": round(sum(latencies) / len(latencies) * 1000, 2),
+            "throughput_per_s": round(len(latencies) / sum(latencies), 3),
+            "peak_rss_mb": round(peak_kb / 1024, 1),
+            "output_bytes": output_bytes,
+            "error": None,
+        })
+    except Exception as e:
+        conn.send({"error": f"{type(e).__name__}: {e}"})
+    finally:
+        conn.close()
+
+
+def run_case(func, corpus, iterations, warmup, timeout):
+    ctx = multiprocessing.get_context("fork")
+    parent, child = ctx.Pipe(duplex=False)
+    process = ctx.Process(target=_run_case, args=(func, corpus, iterations, warmup, child))
+    process.start()
+    child.close()
+    result = parent.recv() if parent.poll(timeout) else {"error": f"timed out after {timeout}s"}
+    process.join(5)
+    if process.is_alive():
+        process.kill()
+    return result
+
+
+def compare(results, baseline, threshold, skipped=()):
+    """
+    Return a list of human-readable regressions against the baseline results.
+    A case that now fails, or that is in the baseline but did not run (and
+    was not left out with --only/--skip-tag), is a regression too.
+    """
+    regressions = []
+    for name, previous in baseline.items():
+        if name not in results and name not in skipped:
+            regressions.append(f"{name}: missing (in the baseline but not run)")
+    for name, current in results.items():
+        previous = baseline.get(name)
+        if current.get("error"):
+            if not previous or not previous.get("error"):
+                regressions.append(f"{name}: error {current['error']}")
+            continue
+        if not previous or previous.get("error"):
+            continue
+        for metric in ("p50_ms", "peak_rss_mb"):
+            old, new = previous.get(metric), current.get(metric)
+            if old and new and new > old * (1 + threshold):
+                regressions.append(f"{name}: {metric} {old} -> {new} (+{(new / old - 1) * 100:.0f}%)")
+    return regressions
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark fileconv routes and utils.")
+    parser.add_argument("--only", action="append", default=[], help="Run cases whose name contains this text")
+    parser.add_argument("--skip-tag", action="append", default=None,
+                        help="Skip cases with this tag (default: model and office, which need "
+                             "easyocr/rembg and the Windows OfficeToPDF binary)")
+    parser.add_argument("--iterations", type=int, default=5)
+    parser.add_argument("--warmup", type=int, default=1)
+    parser.add_argument("--timeout", type=int, default=900, help="Seconds allowed per case")
+    parser.add_argument("--output", default=DEFAULT_OUTPUT)
+    parser.add_argument("--baseline", help="Fail when results regress against this file")
+    parser.add_argument("--threshold", type=float, default=0.2, help="Allowed relative regression (0.2 = 20%%)")
+    parser.add_argument("--save-baseline", help="Also write the results to this baseline file")
+    args = parser.parse_args(argv)
+
+    skip_tags = set(args.skip_tag if args.skip_tag is not None else ["model", "office"])
+    corpus = build_corpus()
+
+    results = {}
+    skipped = set()
+    for name, tags, func in CASES:
+        if args.only and not any(text in name for text in args.only):
+            skipped.add(name)
+            continue
+        if skip_tags & set(tags):
+            skipped.add(name)
+            continue
+        result = run_case(func, corpus, args.iterations, args.warmup, args.timeout)
+        results[name] = result
+        if result.get("error"):
+            print(f"{name:34} ERROR {result['error']}")
+        else:
+            print(f"{name:34} p50 {result['p50_ms']:>9.1f} ms  p95 {result['p95_ms']:>9.1f} ms  "
+                  f"{result['throughput_per_s']:>8.2f}/s  rss {result['peak_rss_mb']:>7.1f} MB  "
+                  f"out {result['output_bytes']:>10} B")
+
+    report = {
+        "meta": {
+            "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S"),
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "cpu_count": os.cpu_count(),
+            "corpus_seed": CORPUS_SEED,
+            "iterations": args.iterations,
+        },
+        "results": results,
+    }
+    for path in filter(None, [args.output, args.save_baseline]):
+        with open(path, "w") as f:
+            json.dump(report, f, indent=2)
+
+    if args.baseline:
+        with open(args.baseline) as f:
+            baseline = json.load(f)["results"]
+        regressions = compare(results, baseline, args.threshold, skipped)
+        if regressions:
+            print("\nRegressions:")
+            for line in regressions:
+                print(f"  {line}")
+            return 1
+        print(f"\nNo regressions beyond {args.threshold:.0%} against {args.baseline}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,94 @@
+"""
+Gunicorn settings: gunicorn -c gunicorn.conf.py app:app
+
+The app is imported and warmed (PyMuPDF, Pillow and the models in
+PRELOAD_MODELS) once in the master before it forks, so workers share those
+pages copy-on-write instead of each loading their own copy. The master logs
+the startup time and each worker logs its RSS split into shared and private
+memory; /metrics exports the same numbers per worker.
+
+Environment:
+    PORT                  listen port (5000)
+    WEB_CONCURRENCY       worker processes (2)
+    GUNICORN_WORKER_CLASS sync or gthread (gthread)
+    GUNICORN_THREADS      threads per gthread worker (CPU_BUDGET * 2 / workers)
+    CPU_BUDGET            cores the server may use (all)
+    GUNICORN_TIMEOUT      seconds before a silent worker is restarted (120)
+    POOL_WORKERS          processes in each worker's shared pool (CPU_BUDGET / workers)
+    ML_THREAD_BUDGET      model threads per worker (CPU_BUDGET / workers)
+    OCR_SLOTS, REMOVE_BG_SLOTS, ML_QUEUE_LIMIT
+                          per worker, not divided: the server runs up to
+                          slots x workers of each, every worker holding its
+                          own copy of the model (see utils/scheduler.py)
+    TEMP_QUOTA_MB         temp disk quota per worker (4096 / workers)
+    PRELOAD_MODELS        see utils/warmup.py
+"""
+import gc
+import os
+import time
+
+_started = time.perf_counter()
+
+CPU_BUDGET = int(os.environ.get("CPU_BUDGET", os.cpu_count() or 1))
+
+bind = f"0.0.0.0:{os.environ.get('PORT', 5000)}"
+workers = int(os.environ.get("WEB_CONCURRENCY", 2))
+worker_class = os.environ.get("GUNICORN_WORKER_CLASS", "gthread")
+# Requests mostly wait on I/O or on pools sized separately, so allow two per core
+threads = int(os.environ.get("GUNICORN_THREADS", max(1, CPU_BUDGET * 2 // workers)))
+if worker_class == "sync":
+    # gunicorn silently switches sync workers with threads > 1 to gthread
+    threads = 1
+timeout = int(os.environ.get("GUNICORN_TIMEOUT", 120))
+preload_app = True
+
+# Each worker has its own ML scheduler; split the cores between them. Must
+# be set before the app is imported.
+os.environ.setdefault("ML_THREAD_BUDGET", str(max(1, CPU_BUDGET // workers)))
+# Likewise for the process pool each worker shares between rendering, tables, DOCX and jobs
+os.environ.setdefault("POOL_WORKERS", str(max(1, CPU_BUDGET // workers)))
+# The temp quota is enforced per worker; split the default 4 GB so the total holds
+os.environ.setdefault("TEMP_QUOTA_MB", str(4096 // workers))
+
+
+def _memory_line(usage):
+    if not usage:
+        return "memory unavailable"
+    return (
+        f"rss {usage['rss_mb']:.0f} MB "
+        f"(shared {usage['shared_mb']:.0f} MB, private {usage['private_mb']:.0f} MB, pss {usage['pss_mb']:.0f} MB)"
+    )
+
+
+def when_ready(server):
+    from utils.warmup import warm_up, fork_safe, PRELOAD_MODELS
+
+    report = warm_up([name for name in PRELOAD_MODELS if fork_safe(name)])
+    # Move everything loaded so far out of the collector's reach: a collection
+    # in a worker would otherwise write to (and so copy) every shared object
+    gc.collect()
+    gc.freeze()
+    server.log.info(
+        f"[Startup] Master ready in {time.perf_counter() - _started:.1f}s "
+        f"(warmup {report['seconds']:.1f}s, models: {', '.join(report['models']) or 'none'}); "
+        f"{_memory_line(report['memory'])}"
+    )
+    server.log.info(f"[Startup] {workers} {worker_class} worker(s), {threads} thread(s) each, CPU budget {CPU_BUDGET}")
+    from utils.scheduler import ML_SLOTS
+    server.log.info(
+        "[Startup] ML slots per worker: "
+        + ", ".join(f"{op} {n} ({n * workers} in total)" for op, n in ML_SLOTS.items())
+    )
+
+
+def pre_fork(server, worker):
+    # Objects created in the master since the last fork
+    gc.freeze()
+
+
+def post_worker_init(worker):
+    from utils.warmup import after_fork, preload_models, memory_usage, fork_safe, PRELOAD_MODELS
+
+    after_fork()
+    preload_models([name for name in PRELOAD_MODELS if not fork_safe(name)], pin=False)
+    worker.log.info(f"[Startup] Worker {worker.pid} ready; {_memory_line(memory_usage())}")
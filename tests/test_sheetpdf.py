@@ -0,0 +1,44 @@
+import fitz
+from openpyxl import Workbook
+
+from utils.sheetpdf import xlsx_to_pdf, MIN_COL_WIDTH
+
+
+def _workbook(path, columns, rows):
+    workbook = Workbook()
+    sheet = workbook.active
+    sheet.title = "Wide"
+    sheet.append([f"header_{col}" for col in range(columns)])
+    for row in range(rows):
+        sheet.append([f"value_{col}" for col in range(columns)])
+    workbook.save(path)
+
+
+def test_wide_sheet_keeps_every_cell(tmp_path):
+    source, output = tmp_path / "wide.xlsx", tmp_path / "wide.pdf"
+    _workbook(source, columns=120, rows=3)
+
+    xlsx_to_pdf(str(source), str(output))
+
+    doc = fitz.open(str(output))
+    words = {word[4] for page in doc for word in page.get_text("words")}
+    assert doc.page_count > 1
+    for col in range(120):
+        assert f"header_{col}" in words
+        assert f"value_{col}" in words
+    assert not any("…" in word for word in words)
+    # Every page repeats the header of the columns it shows
+    assert all("header_" in page.get_text() for page in doc)
+
+
+def test_columns_are_not_shrunk(tmp_path):
+    source, output = tmp_path / "wide.xlsx", tmp_path / "wide.pdf"
+    _workbook(source, columns=120, rows=1)
+
+    xlsx_to_pdf(str(source), str(output))
+
+    doc = fitz.open(str(output))
+    for page in doc:
+        xs = sorted({round(p.x, 1) for d in page.get_drawings() for item in d["items"]
+                     for p in item[1:] if item[0] == "l" and item[1].x == item[2].x})
+        assert all(b - a >= MIN_COL_WIDTH for a, b in zip(xs, xs[1:]))
@@ -0,0 +1,262 @@
+import os
+import json
+import time
+import uuid
+import shutil
+import hashlib
+import threading
+from collections import OrderedDict
+
+from utils.uploads import upload_digest
+
+RESULT_CACHE_DIR = os.environ.get("RESULT_CACHE_DIR", "cache")
+RESULT_CACHE_MAX_MB = int(os.environ.get("RESULT_CACHE_MAX_MB", 2048))
+# How long an output stays downloadable by key (/outputs/<key>) after it was last produced or served
+RESULT_RETENTION = int(os.environ.get("RESULT_RETENTION", 900))
+
+HASH_CHUNK_SIZE = 1024 * 1024
+# A claim older than this belongs to a stream that died without releasing it
+CLAIM_TTL = 3600
+
+
+def hash_upload(file):
+    """Return the sha256 hex digest of an uploaded file and rewind it."""
+    digest = upload_digest(file)
+    if digest:
+        return digest
+    stream = file.stream
+    stream.seek(0)
+    digest = hashlib.sha256()
+    for chunk in iter(lambda: stream.read(HASH_CHUNK_SIZE), b""):
+        digest.update(chunk)
+    stream.seek(0)
+    return digest.hexdigest()
+
+
+def make_key(operation, digests, params=None):
+    """
+    Cache key for an operation: input content hashes, the operation name and
+    its parameters normalized to lower-case strings with sorted keys.
+    """
+    normalized = {str(k): str(v).strip().lower() for k, v in (params or {}).items() if v is not None}
+    payload = json.dumps([operation, list(digests), normalized], sort_keys=True)
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+class ResultCache:
+    """
+    Size-capped on-disk cache of conversion outputs, one file per key.
+    Entries are evicted least-recently-used first; a hit refreshes the
+    file's mtime so the order survives restarts and is shared by workers.
+    RESULT_CACHE_MAX_MB=0 disables it.
+    """
+
+    def __init__(self, directory=RESULT_CACHE_DIR, max_bytes=RESULT_CACHE_MAX_MB * 1024 * 1024):
+        self.directory = os.path.abspath(directory)
+        self.max_bytes = max_bytes
+        self._lock = threading.Lock()
+        self._counters = {"hits": 0, "misses": 0, "stores": 0, "evictions": 0}
+        self._claims = os.path.join(self.directory, ".claims")
+        os.makedirs(self._claims, exist_ok=True)
+        self._index = OrderedDict()
+        self._total = 0
+        self._rescan()
+
+    def path_for(self, key):
+        return os.path.join(self.directory, key)
+
+    @property
+    def enabled(self):
+        return self.max_bytes > 0
+
+    def get(self, key, max_age=None):
+        """
+        Return the cached output path for key, or None on a miss. With
+        max_age, entries not used for that many seconds count as misses.
+        """
+        if not self.enabled:
+            return None
+        path = self.path_for(key)
+        with self._lock:
+            try:
+                if max_age is not None and time.time() - os.path.getmtime(path) > max_age:
+                    raise FileNotFoundError(path)
+                os.utime(path)
+            except OSError:
+                self._counters["misses"] += 1
+                return None
+            if key in self._index:
+                self._index.move_to_end(key)
+            self._counters["hits"] += 1
+            return path
+
+    def stored(self, key):
+        """Path of the entry for key if there is one; unlike get(), not counted as a lookup."""
+        if not self.enabled:
+            return None
+        path = self.path_for(key)
+        return path if os.path.exists(path) else None
+
+    def claim(self, key):
+        """
+        Reserve key for a streamed response before any byte is sent (see
+        tee). Returns False when the entry exists or another stream holds
+        the key; such a response must not advertise the key, because the
+        bytes it sends are not the ones that will be stored.
+        """
+        if not self.enabled or self.stored(key):
+            return False
+        claim_path = os.path.join(self._claims, key)
+        for _ in range(2):
+            try:
+                os.close(os.open(claim_path, os.O_CREAT | os.O_EXCL | os.O_WRONLY))
+                return True
+            except FileExistsError:
+                if not self._claim_is_stale(claim_path):
+                    return False
+                try:
+                    os.remove(claim_path)
+                except OSError:
+                    pass
+        return False
+
+    def _claim_is_stale(self, claim_path):
+        try:
+            return time.time() - os.path.getmtime(claim_path) > CLAIM_TTL
+        except OSError:
+            return True
+
+    def _release_claim(self, key):
+        try:
+            os.remove(os.path.join(self._claims, key))
+        except OSError:
+            pass
+
+    def put(self, key, src_path):
+        """Copy src_path into the cache under key; returns the stored path, or None (see _commit)."""
+        if not self.enabled:
+            return None
+        path = self.path_for(key)
+        tmp_path = f"{path}.{uuid.uuid4().hex}.tmp"
+        shutil.copyfile(src_path, tmp_path)
+        return self._commit(key, tmp_path)
+
+    def put_bytes(self, key, data):
+        if not self.enabled:
+            return None
+        path = self.path_for(key)
+        tmp_path = f"{path}.{uuid.uuid4().hex}.tmp"
+        with open(tmp_path, "wb") as f:
+            f.write(data)
+        return self._commit(key, tmp_path)
+
+    def tee(self, key, chunks):
+        """
+        Pass chunks through while writing them to the cache; the entry is
+        only committed once the whole stream has been produced. If the
+        consumer stops early (the client went away), the rest is still
+        written, so the download can be resumed from the cached entry.
+        The caller must hold claim(key); it is released at the end.
+        """
+        if not self.enabled:
+            yield from chunks
+            return
+        tmp_path = f"{self.path_for(key)}.{uuid.uuid4().hex}.tmp"
+        completed = False
+        try:
+            with open(tmp_path, "wb") as f:
+                try:
+                    for chunk in chunks:
+                        f.write(chunk)
+                        yield chunk
+                except GeneratorExit:
+                    for chunk in chunks:
+                        f.write(chunk)
+                    completed = True
+                    raise
+            completed = True
+        finally:
+            try:
+                if completed:
+                    self._commit(key, tmp_path, claimed=True)
+                else:
+                    try:
+                        os.remove(tmp_path)
+                    except OSError:
+                        pass
+            finally:
+                self._release_claim(key)
+
+    def stats(self):
+        with self._lock:
+            requests = self._counters["hits"] + self._counters["misses"]
+            return {
+                **self._counters,
+                "hit_ratio": round(self._counters["hits"] / requests, 3) if requests else 0.0,
+                "entries": len(self._index),
+                "bytes": self._total,
+                "max_bytes": self.max_bytes,
+            }
+
+    def _commit(self, key, tmp_path, claimed=False):
+        """
+        Move tmp_path into place unless the key is already stored. Entries
+        are write-once: outputs are not byte-for-byte reproducible, and a
+        download resumed against the ETag must never mix two files, so a
+        concurrent or repeated run keeps the first entry. A key claimed by
+        a stream is left to that stream. Returns the stored path, or None
+        when nothing is stored under key.
+        """
+        path = self.path_for(key)
+        claim_path = os.path.join(self._claims, key)
+        if not claimed and os.path.exists(claim_path) and not self._claim_is_stale(claim_path):
+            os.remove(tmp_path)
+            return self.stored(key)
+        size = os.path.getsize(tmp_path)
+        while True:
+            try:
+                os.link(tmp_path, path)
+                break
+            except FileExistsError:
+                try:
+                    os.utime(path)
+                except FileNotFoundError:
+                    continue  # evicted in between; try again
+                os.remove(tmp_path)
+                return path
+        os.remove(tmp_path)
+        with self._lock:
+            if key in self._index:
+                self._total -= self._index.pop(key)
+            self._index[key] = size
+            self._total += size
+            self._counters["stores"] += 1
+            if self._total > self.max_bytes:
+                # Other workers share the directory, so re-read it before evicting
+                self._rescan()
+                self._evict()
+        return path
+
+    def _rescan(self):
+        entries = []
+        with os.scandir(self.directory) as it:
+            for entry in it:
+                if entry.is_file() and not entry.name.endswith(".tmp"):
+                    stat = entry.stat()
+                    entries.append((stat.st_mtime, entry.name, stat.st_size))
+        entries.sort()
+        self._index = OrderedDict((name, size) for _, name, size in entries)
+        self._total = sum(size for _, _, size in entries)
+
+    def _evict(self):
+        while self._index and self._total > self.max_bytes:
+            key, size = self._index.popitem(last=False)
+            self._total -= size
+            self._counters["evictions"] += 1
+            try:
+                os.remove(self.path_for(key))
+            except OSError:
+                pass
+
+
+result_cache = ResultCache()
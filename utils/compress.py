@@ -1,10 +1,94 @@
 import fitz
 
-def compress_pdf(input_path, output_path, power="medium"):
+from utils.render import render_pages, open_pdf
+
+COMPRESSION_MODES = ("auto", "images", "rasterize")
+
+# power -> (target image DPI, JPEG quality) for the structure-preserving mode
+IMAGE_SETTINGS = {
+    "low": (72, 50),
+    "medium": (96, 65),
+    "high": (150, 80)
+}
+
+# Pages sampled by the automatic mode picker
+AUTO_SAMPLE_PAGES = 10
+
+
+def compress_pdf(input_path, output_path, power="medium", mode="auto"):
+    """
+    Compress a PDF.
+    mode="rasterize" renders every page to a JPEG (best for scans),
+    mode="images" only recompresses oversized embedded images and keeps text
+    and vectors intact, and mode="auto" picks one by looking at the document.
+    """
+    if mode not in COMPRESSION_MODES:
+        raise ValueError(f"Invalid compression mode: {mode}")
+
+    if mode == "auto":
+        mode = pick_mode(input_path)
+
+    if mode == "images":
+        recompress_images(input_path, output_path, power=power)
+    else:
+        rasterize_pdf(input_path, output_path, power=power)
+
+
+def compress_document(doc, power="medium", mode="auto"):
+    """
+    In-memory compress_pdf for an open document: returns the compressed
+    document, which is doc itself in images mode and a new one (doc is
+    closed) when rasterizing.
+    """
+    if mode not in COMPRESSION_MODES:
+        raise ValueError(f"Invalid compression mode: {mode}")
+    if mode == "auto":
+        mode = pick_mode(doc)
+    if mode == "images":
+        _recompress(doc, power)
+        return doc
+    compressed = _rasterize(doc, power)
+    doc.close()
+    return compressed
+
+
+def pick_mode(input_path):
+    """
+    Return "rasterize" when most sampled pages look scanned (almost no text
+    and one image covering the page), otherwise "images".
+    """
+    doc = open_pdf(input_path)
+    try:
+        step = max(1, doc.page_count // AUTO_SAMPLE_PAGES)
+        sampled = scanned = 0
+        for page in list(doc.pages(0, doc.page_count, step))[:AUTO_SAMPLE_PAGES]:
+            sampled += 1
+            if len(page.get_text("text").strip()) > 20:
+                continue
+            page_area = abs(page.rect)
+            for img in page.get_images(full=True):
+                # First placement only, read from the content stream (see _recompress)
+                rect = page.get_image_bbox(img)
+                if not rect.is_infinite and abs(rect & page.rect) >= 0.8 * page_area:
+                    scanned += 1
+                    break
+        return "rasterize" if sampled and scanned * 2 > sampled else "images"
+    finally:
+        if doc is not input_path:
+            doc.close()
+
+
+def rasterize_pdf(input_path, output_path, power="medium"):
     """
     Compress a PDF by rendering each page as an image and saving at lower DPI.
     Works best for scanned/image-based PDFs.
     """
+    compressed = _rasterize(input_path, power)
+    compressed.save(output_path, deflate=True)
+    compressed.close()
+
+
+def _rasterize(source, power):
     dpi_settings = {
         "low": 50,
         "medium": 72,
@@ -12,20 +96,68 @@ def compress_pdf(input_path, output_path, power="medium"):
     }
 
     dpi = dpi_settings.get(power, 100)
-    zoom = dpi / 72
 
-    original = fitz.open(input_path)
     compressed = fitz.open()
 
-    for page in original:
-        pix = page.get_pixmap(matrix=fitz.Matrix(zoom, zoom))
-        img_bytes = pix.tobytes("jpeg")
+    for page in render_pages(source, dpi=dpi, fmt="jpeg"):
+        rect = fitz.Rect(0, 0, page.width, page.height)
+        new_page = compressed.new_page(width=page.width, height=page.height)
 
-        rect = fitz.Rect(0, 0, pix.width, pix.height)
-        new_page = compressed.new_page(width=pix.width, height=pix.height)
+        new_page.insert_image(rect, stream=page.data)
 
-        new_page.insert_image(rect, stream=img_bytes)
+    return compressed
 
-    compressed.save(output_path, deflate=True)
-    original.close()
-    compressed.close()
+
+def recompress_images(input_path, output_path, power="medium"):
+    """
+    Downsample and re-encode embedded images whose effective resolution is
+    above the target DPI, then garbage-collect and deflate the document.
+    Each image xref is processed once, however many pages share it.
+    """
+    doc = open_pdf(input_path)
+    _recompress(doc, power)
+    doc.save(output_path, garbage=3, deflate=True, use_objstms=1)
+    doc.close()
+
+
+def _recompress(doc, power):
+    target_dpi, quality = IMAGE_SETTINGS.get(power, IMAGE_SETTINGS["medium"])
+    seen = set()
+
+    for page in doc:
+        for img in page.get_images(full=True):
+            xref, smask, width, height, bpc = img[0], img[1], img[2], img[3], img[4]
+            if xref in seen:
+                continue
+            seen.add(xref)
+
+            # Leave masked and 1-bit images (usually CCITT/JBIG2 scans) alone
+            if smask or bpc == 1:
+                continue
+
+            # get_image_bbox reads the placement from the content stream;
+            # get_image_rects would decode and hash the image to find it
+            rect = page.get_image_bbox(img)
+            if rect.is_infinite or rect.width <= 0 or rect.height <= 0:
+                continue
+
+            effective_dpi = min(width / (rect.width / 72), height / (rect.height / 72))
+            if effective_dpi <= target_dpi * 1.1:
+                continue
+
+            pix = fitz.Pixmap(doc, xref)
+            if pix.colorspace is None:
+                continue
+            if pix.alpha:
+                pix = fitz.Pixmap(pix, 0)
+            if pix.colorspace.n not in (1, 3):
+                pix = fitz.Pixmap(fitz.csRGB, pix)
+
+            factor = target_dpi / effective_dpi
+            new_width = max(1, int(width * factor))
+            new_height = max(1, int(height * factor))
+            scaled = fitz.Pixmap(pix, new_width, new_height, None)
+            data = scaled.tobytes("jpeg", jpg_quality=quality)
+
+            if len(data) < len(doc.xref_stream_raw(xref)):
+                page.replace_image(xref, stream=data)
@@ -1,17 +1,25 @@
+import io
 import os
-import uuid
 import subprocess
 from xhtml2pdf import pisa
-from pdf2docx import Converter
-from PIL import Image
 from pptx import Presentation
-import pandas as pd
-import pdfplumber
-import fitz
 import zipfile
 from pptx.util import Inches
 import mammoth
 
+from utils.render import render_pages, open_pdf
+from utils.imagepdf import images_to_pdf, PAGE_SIZES
+from utils.tables import pdf_to_xlsx, TABLE_LAYOUTS
+from utils.sheetpdf import xlsx_to_pdf
+from utils.pdfdocx import pdf_to_word
+
+# The converters that live in their own modules are re-exported from here
+__all__ = [
+    "zip_files", "docx_to_pdf", "iter_pdf_images", "pdf_to_images", "pptx_to_pdf",
+    "PPTX_FORMATS", "pdf_to_pptx",
+    "images_to_pdf", "PAGE_SIZES", "pdf_to_xlsx", "TABLE_LAYOUTS", "xlsx_to_pdf", "pdf_to_word",
+]
+
 def zip_files(file_paths, zip_path):
     with zipfile.ZipFile(zip_path, 'w') as zipf:
         for path in file_paths:
@@ -26,31 +34,32 @@ def docx_to_pdf(input_path, output_path):
     with open(output_path, "wb") as pdf_file:
         pisa.CreatePDF(html, dest=pdf_file)
 
-# PDF to DOCX
-def pdf_to_word(input_path, output_path):
-    cv = Converter(input_path)
-    cv.convert(output_path, start=0, end=None)
-    cv.close()
-
-# Images to PDF
-def images_to_pdf(file_paths, output_path):
-    images = [Image.open(f).convert("RGB") for f in file_paths]
-    images[0].save(output_path, save_all=True, append_images=images[1:])
-
 
 # PDF to Images
-def pdf_to_images(file_bytes):
-    os.makedirs("temp", exist_ok=True)
-    pdf = fitz.open(stream=file_bytes, filetype="pdf")
+def iter_pdf_images(source, dpi=200):
+    """
+    Render pages one at a time and yield (filename, png_bytes),
+    so only a single page is held in memory.
+    source is a path or the PDF bytes.
+    """
+    # Open once up front so an invalid upload fails before anything is yielded
+    open_pdf(source).close()
+
+    def pages():
+        for page in render_pages(source, dpi=dpi, fmt="png"):
+            yield f"page_{page.number+1}.png", page.data
+
+    return pages()
+
+def pdf_to_images(source, output_dir):
     output_paths = []
 
-    for i, page in enumerate(pdf):
-        pix = page.get_pixmap(dpi=200)
-        path = f"temp/page_{uuid.uuid4().hex}_{i+1}.png"
-        pix.save(path)
+    for name, data in iter_pdf_images(source):
+        path = os.path.join(output_dir, name)
+        with open(path, "wb") as f:
+            f.write(data)
         output_paths.append(path)
 
-    pdf.close()
     return output_paths
 
 # PPTX to PDF
@@ -66,77 +75,50 @@ def pptx_to_pdf(input_path, output_path):
         raise RuntimeError(f"PPTX to PDF conversion failed: {e}")
 
 # PDF to PPTX
-def pdf_to_pptx(input_path, output_path):
-    doc = fitz.open(input_path)
-    prs = Presentation()
-    prs.slide_width = Inches(11.69)
-    prs.slide_height = Inches(8.27)
-
-    image_paths = []
+PPTX_FORMATS = ("auto", "jpeg", "png")
 
-    for i, page in enumerate(doc):
-        pix = page.get_pixmap(dpi=150)
-        img_path = f"temp_pdf_slide_{uuid.uuid4().hex}_{i+1}.png"
-        pix.save(img_path)
-        image_paths.append(img_path)
+# PowerPoint accepts slides between 1 and 56 inches on a side
+EMU_PER_POINT = 12700
+MIN_SLIDE_EMU = Inches(1)
+MAX_SLIDE_EMU = Inches(56)
 
-        slide = prs.slides.add_slide(prs.slide_layouts[6])
-        slide.shapes.add_picture(img_path, 0, 0, width=prs.slide_width, height=prs.slide_height)
 
-    prs.save(output_path)
+def _slide_size(rect):
+    """Slide size in EMU with the aspect ratio of a page rect (in points)."""
+    width, height = rect.width * EMU_PER_POINT, rect.height * EMU_PER_POINT
+    scale = min(1.0, MAX_SLIDE_EMU / max(width, height))
+    scale = max(scale, MIN_SLIDE_EMU / min(width, height))
+    return int(width * scale), int(height * scale)
 
-    for path in image_paths:
-        try:
-            os.remove(path)
-        except Exception as e:
-            print(f"Warning: failed to delete temp image {path}: {e}")
 
+def pdf_to_pptx(source, output_path, dpi=150, fmt="auto", quality=80):
+    """
+    One full-bleed picture slide per page. Slides take the size of the first
+    page; pages with a different shape are centered on them. Pages are
+    rendered on the render pool and added from memory in page order.
+    """
+    if fmt not in PPTX_FORMATS:
+        raise ValueError(f"Invalid image format: {fmt}")
 
-# XLSX to PDF
-def xlsx_to_pdf(input_path, output_path):
+    doc = open_pdf(source)
     try:
-        df = pd.read_excel(input_path)
-        html_content = df.to_html(index=False)
-
-        html = f"""
-        <html>
-            <head>
-                <meta charset="UTF-8">
-                <style>
-                    table {{
-                        width: 100%;
-                        border-collapse: collapse;
-                    }}
-                    th, td {{
-                        border: 1px solid #333;
-                        padding: 4px;
-                        text-align: left;
-                    }}
-                </style>
-            </head>
-            <body>{html_content}</body>
-        </html>
-        """
-        with open(output_path, "wb") as pdf_file:
-            pisa_status = pisa.CreatePDF(html, dest=pdf_file)
-
-        if pisa_status.err:
-            raise Exception("Failed to convert Excel to PDF.")
-    except Exception as e:
-        raise RuntimeError(f"Excel to PDF conversion error: {e}")
-
-
-# PDF to XLSX
-def pdf_to_xlsx(input_path, output_path):
-    all_data = []
-    with pdfplumber.open(input_path) as pdf:
-        for page in pdf.pages:
-            table = page.extract_table()
-            if table:
-                df = pd.DataFrame(table[1:], columns=table[0])
-                all_data.append(df)
-    if all_data:
-        result = pd.concat(all_data, ignore_index=True)
-        result.to_excel(output_path, index=False)
-    else:
-        raise ValueError("No tables found in PDF.")
+        rects = [page.rect for page in doc]
+    finally:
+        doc.close()
+    if not rects:
+        raise ValueError("PDF has no pages")
+
+    prs = Presentation()
+    prs.slide_width, prs.slide_height = _slide_size(rects[0])
+    layout = prs.slide_layouts[6]
+
+    for page in render_pages(source, dpi=dpi, fmt=fmt, quality=quality):
+        rect = rects[page.number]
+        scale = min(prs.slide_width / rect.width, prs.slide_height / rect.height)
+        width, height = int(rect.width * scale), int(rect.height * scale)
+        left, top = (prs.slide_width - width) // 2, (prs.slide_height - height) // 2
+
+        slide = prs.slides.add_slide(layout)
+        slide.shapes.add_picture(io.BytesIO(page.data), left, top, width=width, height=height)
+
+    prs.save(output_path)
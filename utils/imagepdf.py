@@ -0,0 +1,145 @@
+import io
+import struct
+
+import fitz
+from PIL import Image
+
+# Page sizes in points (portrait); pages are turned to match the image
+PAGE_SIZES = {
+    "a3": (842, 1191),
+    "a4": (595, 842),
+    "a5": (420, 595),
+    "letter": (612, 792),
+    "legal": (612, 1008),
+}
+
+# JPEG quality used when an image has to be re-encoded after downscaling
+DOWNSCALE_JPEG_QUALITY = 85
+
+PNG_SIGNATURE = b"\x89PNG\r\n\x1a\n"
+
+
+def _png_passthrough(data):
+    """
+    Return (width, height, colors, idat) when the PNG's compressed data can
+    be embedded as a FlateDecode stream as-is: 8-bit gray or RGB, no alpha,
+    no palette, not interlaced. Otherwise return None.
+    """
+    if not data.startswith(PNG_SIGNATURE):
+        return None
+    pos = len(PNG_SIGNATURE)
+    header = None
+    idat = []
+    while pos + 8 <= len(data):
+        length, kind = struct.unpack(">I4s", data[pos:pos + 8])
+        body = data[pos + 8:pos + 8 + length]
+        pos += 12 + length
+        if kind == b"IHDR":
+            header = struct.unpack(">IIBBBBB", body)
+        elif kind == b"IDAT":
+            idat.append(body)
+        elif kind == b"tRNS":
+            # Transparency would need an SMask
+            return None
+        elif kind == b"IEND":
+            break
+    if not header or not idat:
+        return None
+    width, height, bit_depth, color_type, _, _, interlace = header
+    if bit_depth != 8 or interlace or color_type not in (0, 2):
+        return None
+    return width, height, 1 if color_type == 0 else 3, b"".join(idat)
+
+
+def _add_png_xobject(doc, width, height, colors, idat):
+    xref = doc.get_new_xref()
+    colorspace = "/DeviceGray" if colors == 1 else "/DeviceRGB"
+    doc.update_object(xref, (
+        f"<</Type/XObject/Subtype/Image/Width {width}/Height {height}"
+        f"/ColorSpace{colorspace}/BitsPerComponent 8>>"
+    ))
+    doc.update_stream(xref, idat, compress=False)
+    # update_stream rewrites the filter keys, so they are set afterwards
+    doc.xref_set_key(xref, "Filter", "/FlateDecode")
+    doc.xref_set_key(xref, "DecodeParms", f"<</Predictor 15/Colors {colors}/BitsPerComponent 8/Columns {width}>>")
+    return xref
+
+
+def _page_rect(width, height, page_size):
+    """Page size in points and the rectangle the image is drawn into."""
+    if not page_size:
+        # Same as Pillow's PDF writer: one pixel per point
+        return (width, height), fitz.Rect(0, 0, width, height)
+
+    page_w, page_h = PAGE_SIZES[page_size]
+    if (width > height) != (page_w > page_h):
+        page_w, page_h = page_h, page_w
+    scale = min(page_w / width, page_h / height)
+    w, h = width * scale, height * scale
+    x, y = (page_w - w) / 2, (page_h - h) / 2
+    return (page_w, page_h), fitz.Rect(x, y, x + w, y + h)
+
+
+def _decode(img, target=None):
+    """Decode an image to RGB or gray, shrinking it to target (w, h) if given."""
+    if target and img.format == "JPEG":
+        # Let libjpeg decode at 1/2, 1/4 or 1/8 scale instead of full size
+        img.draft("RGB" if img.mode != "L" else "L", target)
+    if img.mode not in ("RGB", "L"):
+        img = img.convert("RGB")
+    if target and img.size != target:
+        img = img.resize(target, Image.LANCZOS)
+    return img
+
+
+def images_to_pdf(file_paths, output_path, page_size=None, dpi=None):
+    """
+    Write one page per image, reading a single image at a time.
+
+    JPEGs and plain 8-bit gray/RGB PNGs are embedded without being decoded;
+    anything else is decoded and stored losslessly. With page_size (a key of
+    PAGE_SIZES) each image is fitted onto a page of that size, and with dpi
+    images denser than that on their page are downscaled and stored as JPEG.
+    """
+    if page_size and page_size not in PAGE_SIZES:
+        raise ValueError(f"Unknown page size: {page_size}")
+
+    doc = fitz.open()
+    try:
+        for path in file_paths:
+            with open(path, "rb") as f:
+                data = f.read()
+
+            with Image.open(io.BytesIO(data)) as img:
+                width, height = img.size
+                (page_w, page_h), rect = _page_rect(width, height, page_size)
+                page = doc.new_page(width=page_w, height=page_h)
+
+                target = None
+                if dpi:
+                    max_w = max(1, round(rect.width / 72 * dpi))
+                    max_h = max(1, round(rect.height / 72 * dpi))
+                    if width > max_w or height > max_h:
+                        target = (min(width, max_w), min(height, max_h))
+
+                if target:
+                    small = _decode(img, target)
+                    buffer = io.BytesIO()
+                    small.save(buffer, format="JPEG", quality=DOWNSCALE_JPEG_QUALITY)
+                    page.insert_image(rect, stream=buffer.getvalue())
+                elif img.format == "JPEG":
+                    page.insert_image(rect, stream=data)
+                else:
+                    png = _png_passthrough(data) if img.format == "PNG" else None
+                    if png:
+                        page.insert_image(rect, xref=_add_png_xobject(doc, *png))
+                    else:
+                        decoded = _decode(img)
+                        colorspace = fitz.csGRAY if decoded.mode == "L" else fitz.csRGB
+                        pix = fitz.Pixmap(colorspace, width, height, decoded.tobytes(), 0)
+                        page.insert_image(rect, pixmap=pix)
+            del data
+
+        doc.save(output_path, deflate=True)
+    finally:
+        doc.close()
@@ -1,35 +1,306 @@
-import easyocr
+import io
 import os
+import json
+import threading
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+
 from PIL import Image
 
-readers = {
-    "en": easyocr.Reader(['en'], gpu=False),
-    "id": easyocr.Reader(['id'], gpu=False),
-    "en-id": easyocr.Reader(['en', 'id'], gpu=False)
+from utils.models import registry
+from utils.scheduler import threads_per_slot
+from utils.tiles import resize_to_png, band_memory
+
+COMPRESSION_LEVELS = {
+    "high": 30,     # maximum compression (lowest quality)
+    "medium": 60,   # good balance
+    "low": 85       # least compression (highest quality)
+}
+
+# OCR language option -> EasyOCR language list
+OCR_LANGUAGES = {
+    "en": ['en'],
+    "id": ['id'],
+    "en-id": ['en', 'id']
 }
 
+# Pillow releases the GIL while decoding, resizing and encoding
+IMAGE_BATCH_WORKERS = int(os.environ.get("IMAGE_BATCH_WORKERS", os.cpu_count() or 1))
+IMAGE_BATCH_MAX_FILES = int(os.environ.get("IMAGE_BATCH_MAX_FILES", 100))
+IMAGE_OPERATIONS = ("compress", "upscale", "resize", "to-jpg")
+
+# Largest upscale output allowed, and the memory one upscale may use
+UPSCALE_MAX_PIXELS = int(os.environ.get("UPSCALE_MAX_PIXELS", 400_000_000))
+UPSCALE_MEMORY_MB = int(os.environ.get("UPSCALE_MEMORY_MB", 512))
+UPSCALE_JPEG_QUALITY = int(os.environ.get("UPSCALE_JPEG_QUALITY", 90))
+UPSCALE_FORMATS = ("auto", "jpeg", "png")
+
+OCR_READER_SIZE_MB = 250
+# Overrides the scheduler's per-slot share of ML_THREAD_BUDGET
+OCR_TORCH_THREADS = int(os.environ.get("OCR_TORCH_THREADS", 0))
+
+def get_reader(lang):
+    """Return the EasyOCR reader for lang, loading it on first use."""
+    if lang not in OCR_LANGUAGES:
+        raise ValueError(f"Unsupported OCR language: {lang}")
+
+    def load():
+        import torch
+        import easyocr
+        # torch's thread pool is process wide; keep it to one slot's share
+        torch.set_num_threads(OCR_TORCH_THREADS or threads_per_slot())
+        return easyocr.Reader(OCR_LANGUAGES[lang], gpu=False)
+
+    return registry.get(f"easyocr:{lang}", load, size_mb=OCR_READER_SIZE_MB)
+
+def open_image(source):
+    """Open an image from a path or from bytes already in memory."""
+    if isinstance(source, (bytes, bytearray, memoryview)):
+        source = io.BytesIO(source)
+    return Image.open(source)
+
 def image_to_text(image_path, lang):
-    reader = readers.get(lang, readers[lang])
+    reader = get_reader(lang)
     results = reader.readtext(image_path, detail=0)
     return "\n".join(results)
 
 def compress_image(input_path, output_path, quality):
-    with Image.open(input_path) as img:
+    with open_image(input_path) as img:
         if img.mode in ("RGBA", "P"):
             img = img.convert("RGB")
 
         img.save(output_path, "JPEG", optimize=True, quality=quality)
 
-def upscale_image(input_path, output_path, scale=2):
-    with Image.open(input_path) as img:
+class UpscaleTooLarge(ValueError):
+    pass
+
+
+def plan_upscale(size, channels, scale, fmt="auto"):
+    """
+    Decide how an upscale runs before anything is decoded. Returns "jpeg" or
+    "png" (whole image in memory) or "tiled" (PNG written band by band);
+    raises UpscaleTooLarge when the output is over UPSCALE_MAX_PIXELS or
+    does not fit UPSCALE_MEMORY_MB.
+    """
+    width, height = size
+    out_width, out_height = int(width * scale), int(height * scale)
+    if out_width * out_height > UPSCALE_MAX_PIXELS:
+        raise UpscaleTooLarge(
+            f"Upscaled image would be {out_width}x{out_height}; the limit is {UPSCALE_MAX_PIXELS // 1000000} MP"
+        )
+
+    budget = UPSCALE_MEMORY_MB * 1024 * 1024
+    source_bytes = width * height * channels
+    # A whole-image resize holds the source, the horizontal pass and the output
+    whole_fits = source_bytes + (out_width * height + out_width * out_height) * channels <= budget
+
+    if fmt == "jpeg" or (fmt == "auto" and whole_fits and channels < 4):
+        if not whole_fits:
+            raise UpscaleTooLarge("Image is too large to upscale as JPEG; use format=png")
+        return "jpeg"
+    if fmt == "auto" and whole_fits:
+        return "png"
+    if source_bytes + band_memory((out_width, out_height), channels) > budget:
+        raise UpscaleTooLarge("Image is too large to upscale within the memory budget")
+    return "tiled"
+
+
+def resize_channels(img):
+    """Bytes per pixel once img is in the mode it is resized in (P and 1 become RGB or RGBA)."""
+    if "A" in img.getbands() or "transparency" in img.info:
+        return 4
+    if img.mode in ("RGB", "L", "CMYK"):
+        return len(img.getbands())
+    return 3
+
+
+def upscaled_extension(path):
+    with open(path, "rb") as f:
+        return "png" if f.read(8) == b"\x89PNG\r\n\x1a\n" else "jpg"
+
+
+def upscale_image(input_path, output_path, scale=2, fmt="auto"):
+    """
+    Upscale with LANCZOS. Output is a progressive JPEG when the whole image
+    fits UPSCALE_MEMORY_MB; larger results (or fmt="png") are resized in
+    bands and streamed to a PNG. Returns the extension written ("jpg"/"png").
+    """
+    with open_image(input_path) as img:
+        alpha = "A" in img.getbands() or "transparency" in img.info
+        plan = plan_upscale(img.size, resize_channels(img), scale, fmt)
         new_size = (int(img.width * scale), int(img.height * scale))
+
+        if plan == "tiled":
+            resize_to_png(img, new_size, output_path)
+            return "png"
+
+        if plan == "jpeg" and img.mode not in ("RGB", "L"):
+            img = img.convert("RGB")
+        elif img.mode not in ("RGB", "L", "RGBA", "LA"):
+            # Palette and bilevel images would otherwise be resized with NEAREST
+            img = img.convert("RGBA" if alpha else "RGB")
         upscaled = img.resize(new_size, Image.LANCZOS)
-        upscaled.save(output_path)
+        if plan == "png":
+            upscaled.save(output_path, "PNG")
+            return "png"
+        upscaled.save(output_path, "JPEG", quality=UPSCALE_JPEG_QUALITY, progressive=True, optimize=True)
+        return "jpg"
 
 def to_jpg(input_path, output_path):
-    with Image.open(input_path) as img:
+    with open_image(input_path) as img:
         if img.mode in ("RGBA", "P"):
             img = img.convert("RGB")
-        img.save(output_path, "JPG")
+        img.save(output_path, "JPEG")
+
+    return output_path
+
+
+# -------------------- BATCH --------------------
+
+def parse_image_ops(text):
+    """
+    Validate a JSON list of operations such as
+    [{"op": "upscale", "scale": 2}, {"op": "compress", "power": "medium"}]
+    and return it normalized. Raises ValueError.
+    """
+    try:
+        raw = json.loads(text or "")
+    except ValueError:
+        raise ValueError("ops must be a JSON list")
+    if not isinstance(raw, list) or not raw:
+        raise ValueError("ops must be a non-empty JSON list")
+
+    ops = []
+    for op in raw:
+        if isinstance(op, str):
+            op = {"op": op}
+        name = op.get("op") if isinstance(op, dict) else None
+        if name not in IMAGE_OPERATIONS:
+            raise ValueError(f"op must be one of {', '.join(IMAGE_OPERATIONS)}")
+        try:
+            if name == "compress":
+                power = str(op.get("power", "medium")).lower()
+                if power not in COMPRESSION_LEVELS:
+                    raise ValueError("compress: power must be low, medium or high")
+                ops.append({"op": name, "power": power})
+            elif name == "upscale":
+                scale = int(op.get("scale", 2))
+                if not 1 <= scale <= 4:
+                    raise ValueError("upscale: scale must be 1-4")
+                ops.append({"op": name, "scale": scale})
+            elif name == "resize":
+                box = {k: int(op[k]) for k in ("width", "height") if op.get(k) is not None}
+                if not box or min(box.values()) < 1:
+                    raise ValueError("resize: give a positive width and/or height")
+                ops.append({"op": name, **box})
+            else:
+                ops.append({"op": name})
+        except (TypeError, ValueError) as e:
+            raise ValueError(str(e) if str(e).startswith(name) else f"{name}: invalid parameters")
+    return ops
+
+
+def plan_image_ops(ops, size, channels=3):
+    """
+    Fold an ordered list of operations into one (size, format, quality)
+    plan for an image of the given size: resizes and upscales collapse into
+    a single target size, and the last compress/to-jpg decides the encoding.
+    format None keeps the source format. A net enlargement is checked with
+    plan_upscale; batch results are built in memory, so one that would need
+    the tiled path raises UpscaleTooLarge as well.
+    """
+    width, height = size
+    fmt, quality = None, None
+    for op in ops:
+        if op["op"] == "upscale":
+            width, height = width * op["scale"], height * op["scale"]
+        elif op["op"] == "resize":
+            # Fit inside the box, never enlarging (like Image.thumbnail)
+            factor = min(1.0, op.get("width", width) / width, op.get("height", height) / height)
+            width, height = width * factor, height * factor
+        elif op["op"] == "compress":
+            fmt, quality = "JPEG", COMPRESSION_LEVELS[op["power"]]
+        elif op["op"] == "to-jpg":
+            fmt, quality = "JPEG", None
+    target = (max(1, round(width)), max(1, round(height)))
+
+    scale = max(target[0] / size[0], target[1] / size[1])
+    if scale > 1:
+        plan = plan_upscale(size, channels, scale, "jpeg" if fmt == "JPEG" else "auto")
+        if plan == "tiled":
+            raise UpscaleTooLarge(
+                f"Upscaled image would be {target[0]}x{target[1]}, too large for a batch; use /upscale"
+            )
+    return target, fmt, quality
+
+
+def check_image_ops(ops, source):
+    """Raise UpscaleTooLarge if ops would enlarge source past the upscale limits; reads only the header."""
+    with open_image(source) as img:
+        plan_image_ops(ops, img.size, resize_channels(img))
+
+
+def process_image(source, ops):
+    """
+    Run ops on one image with a single decode and return (data, extension).
+    JPEGs that end up smaller are decoded at reduced size with draft().
+    """
+    with open_image(source) as img:
+        target, fmt, quality = plan_image_ops(ops, img.size, resize_channels(img))
+        fmt = fmt or (img.format if img.format in ("JPEG", "PNG", "WEBP", "GIF", "TIFF", "BMP") else "PNG")
+        if img.format == "JPEG" and target[0] < img.width and target[1] < img.height:
+            # Lets libjpeg scale by 1/2, 1/4 or 1/8 while decoding; never below target
+            img.draft(img.mode, target)
+        img.load()
+
+        # Palette and bilevel images resize with nearest neighbour only, so
+        # convert before resizing, keeping alpha (and palette transparency)
+        if fmt == "JPEG" and img.mode not in ("RGB", "L", "CMYK"):
+            img = img.convert("RGB")
+        elif img.mode not in ("RGB", "L", "RGBA", "LA", "CMYK"):
+            img = img.convert("RGBA" if "A" in img.getbands() or "transparency" in img.info else "RGB")
+        if img.size != target:
+            img = img.resize(target, Image.LANCZOS, reducing_gap=3.0 if target[0] < img.width else None)
+
+        buffer = io.BytesIO()
+        options = {"optimize": True} if fmt in ("JPEG", "PNG") else {}
+        if quality:
+            options["quality"] = quality
+        img.save(buffer, fmt, **options)
+    return buffer.getvalue(), "jpg" if fmt == "JPEG" else fmt.lower()
+
+
+_batch_executor = None
+_batch_executor_lock = threading.Lock()
+
+
+def _get_batch_executor():
+    # Requests run on several threads; only one of them may create the pool
+    global _batch_executor
+    with _batch_executor_lock:
+        if _batch_executor is None:
+            _batch_executor = ThreadPoolExecutor(max_workers=IMAGE_BATCH_WORKERS, thread_name_prefix="image-batch")
+        return _batch_executor
+
+
+def iter_image_batch(sources, ops, workers=None):
+    """
+    Process images on a thread pool and yield (index, data, extension) in
+    input order, with at most a couple of images per worker in flight.
+    """
+    executor = _get_batch_executor()
+    workers = min(workers or IMAGE_BATCH_WORKERS, IMAGE_BATCH_WORKERS)
 
-    return output_path
\ No newline at end of file
+    pending = deque()
+    try:
+        for index, source in enumerate(sources):
+            pending.append((index, executor.submit(process_image, source, ops)))
+            if len(pending) >= workers * 2:
+                index, future = pending.popleft()
+                yield (index, *future.result())
+        while pending:
+            index, future = pending.popleft()
+            yield (index, *future.result())
+    finally:
+        for _, future in pending:
+            future.cancel()
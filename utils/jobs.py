@@ -0,0 +1,417 @@
+import os
+import re
+import time
+import json
+import uuid
+import fcntl
+from contextlib import contextmanager
+import threading
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+
+from utils.compress import compress_pdf
+from utils.convert import (
+    docx_to_pdf,
+    pdf_to_word,
+    pdf_to_images,
+    pptx_to_pdf,
+    pdf_to_pptx,
+    xlsx_to_pdf,
+    pdf_to_xlsx,
+    zip_files
+)
+from utils.remover import remove_background
+from utils.storage import storage
+from utils.cache import RESULT_CACHE_DIR
+from utils.pool import POOL_WORKERS, get_executor
+from utils.scheduler import scheduler, SchedulerBusy, ML_SLOTS
+from utils.imgTools import image_to_text, compress_image, upscale_image, to_jpg, COMPRESSION_LEVELS, UPSCALE_FORMATS
+
+# Jobs run on the shared process pool; this many at a time per gunicorn
+# worker, so interactive requests still find free pool processes
+JOB_WORKERS = int(os.environ.get("JOB_WORKERS", max(1, POOL_WORKERS // 2)))
+JOB_QUEUE_LIMIT = int(os.environ.get("JOB_QUEUE_LIMIT", 32))
+JOB_TTL = int(os.environ.get("JOB_TTL", 3600))
+# Job records are JSON files here, so every gunicorn worker sees every job
+JOB_DIR = os.environ.get("JOB_DIR", os.path.join(RESULT_CACHE_DIR, "jobs"))
+# Inputs and outputs of jobs. They are outside TempStorage, whose expiry
+# and quota eviction know nothing about jobs, and are deleted together
+# with their record.
+JOB_FILES_DIR = os.path.join(JOB_DIR, "files")
+# Progress is written at most this often per job
+JOB_PROGRESS_INTERVAL = float(os.environ.get("JOB_PROGRESS_INTERVAL", 0.5))
+
+# Record fields not shown to clients
+PRIVATE_FIELDS = ("input_path", "output_path", "owner")
+
+# Jobs of this worker waiting for one of its JOB_WORKERS slots
+_waiting = deque()
+_running = 0
+_dispatch_lock = threading.Lock()
+
+_ml_executor = None
+_ml_executor_pid = None
+_ml_executor_lock = threading.Lock()
+
+os.makedirs(JOB_FILES_DIR, exist_ok=True)
+
+
+class JobQueueFull(Exception):
+    pass
+
+
+# -------------------- OPERATIONS --------------------
+# Every operation takes (input_path, output_path, params, progress). All but
+# ML_OPERATIONS run inside a pool process, so they must only use
+# module-level functions.
+
+def _compress(input_path, output_path, params, progress):
+    compress_pdf(
+        input_path,
+        output_path,
+        power=params.get("power", "medium"),
+        mode=params.get("mode", "auto").lower()
+    )
+
+def _docx_to_pdf(input_path, output_path, params, progress):
+    docx_to_pdf(input_path, output_path)
+
+def _pdf_to_docx(input_path, output_path, params, progress):
+    pdf_to_word(input_path, output_path, pages=params.get("pages"), progress=progress)
+
+def _pdf_to_images(input_path, output_path, params, progress):
+    image_dir = storage.mkdtemp(prefix="pages_")
+    try:
+        image_paths = pdf_to_images(input_path, image_dir)
+        zip_files(image_paths, output_path)
+    finally:
+        storage.release(image_dir)
+
+def _pptx_to_pdf(input_path, output_path, params, progress):
+    pptx_to_pdf(input_path, output_path)
+
+def _pdf_to_pptx(input_path, output_path, params, progress):
+    pdf_to_pptx(
+        input_path,
+        output_path,
+        dpi=int(params.get("dpi", 150)),
+        fmt=params.get("format", "auto").lower(),
+        quality=int(params.get("quality", 80))
+    )
+
+def _xlsx_to_pdf(input_path, output_path, params, progress):
+    xlsx_to_pdf(input_path, output_path, progress=progress)
+
+def _pdf_to_xlsx(input_path, output_path, params, progress):
+    pdf_to_xlsx(input_path, output_path, layout=params.get("layout", "combined").lower(), progress=progress)
+
+def _remove_bg(input_path, output_path, params, progress):
+    remove_background(input_path, output_path)
+
+def _image_to_text(input_path, output_path, params, progress):
+    text = image_to_text(input_path, params.get("lang", "en"))
+    with open(output_path, "w", encoding="utf-8") as f:
+        f.write(text)
+
+def _image_compress(input_path, output_path, params, progress):
+    level = params.get("power", "medium").lower()
+    if level not in COMPRESSION_LEVELS:
+        raise ValueError("Invalid compression level. Choose low, medium, or high.")
+    compress_image(input_path, output_path, quality=COMPRESSION_LEVELS[level])
+
+def _upscale(input_path, output_path, params, progress):
+    scale = int(params.get("scale", 2))
+    if scale < 1 or scale > 4:
+        raise ValueError("Scale must be 1-4")
+    fmt = params.get("format", "auto").lower()
+    if fmt not in UPSCALE_FORMATS:
+        raise ValueError(f"format must be one of {', '.join(UPSCALE_FORMATS)}")
+    # format=auto only settles on JPEG or PNG once the size is known
+    return f"_upscaled.{upscale_image(input_path, output_path, scale, fmt=fmt)}"
+
+def _to_jpg(input_path, output_path, params, progress):
+    to_jpg(input_path, output_path)
+
+
+# Model-backed operations run on threads in the gunicorn worker, under the
+# scheduler queue named here, instead of on the process pool
+ML_OPERATIONS = {"remove-bg": "remove-bg", "image-to-text": "ocr"}
+
+# operation -> (function, output suffix)
+OPERATIONS = {
+    "compress": (_compress, "_compressed.pdf"),
+    "docx-to-pdf": (_docx_to_pdf, ".pdf"),
+    "pdf-to-docx": (_pdf_to_docx, ".docx"),
+    "pdf-to-images": (_pdf_to_images, "_images.zip"),
+    "pptx-to-pdf": (_pptx_to_pdf, ".pdf"),
+    "pdf-to-pptx": (_pdf_to_pptx, ".pptx"),
+    "xlsx-to-pdf": (_xlsx_to_pdf, ".pdf"),
+    "pdf-to-xlsx": (_pdf_to_xlsx, ".xlsx"),
+    "remove-bg": (_remove_bg, "_nobg.png"),
+    "image-to-text": (_image_to_text, ".txt"),
+    "image-compress": (_image_compress, "_compressed.jpg"),
+    "upscale": (_upscale, "_upscaled.jpg"),
+    "to-jpg": (_to_jpg, ".jpg"),
+}
+
+
+def output_suffix(operation):
+    """Suffix of the download name; an operation may return a different one when it finishes."""
+    return OPERATIONS[operation][1]
+
+
+# -------------------- RECORDS --------------------
+
+def _record_path(job_id):
+    return os.path.join(JOB_DIR, f"{job_id}.json")
+
+
+@contextmanager
+def _records_locked():
+    # flock serializes both the gunicorn workers and the threads within one
+    with open(os.path.join(JOB_DIR, ".lock"), "w") as lock:
+        fcntl.flock(lock, fcntl.LOCK_EX)
+        yield
+
+
+def _read(job_id):
+    try:
+        with open(_record_path(job_id), encoding="utf-8") as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+
+def _write(job):
+    path = _record_path(job["id"])
+    tmp_path = f"{path}.{uuid.uuid4().hex}.tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump(job, f)
+    os.replace(tmp_path, path)
+
+
+def _update(job_id, **fields):
+    """Change fields of an unfinished job; finished jobs are left alone."""
+    with _records_locked():
+        job = _read(job_id)
+        if not job or job["status"] in ("done", "failed"):
+            return
+        job.update(fields)
+        _write(job)
+
+
+def _alive(pid):
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        pass
+    return True
+
+
+def _check_owner(job):
+    # A job whose worker died (restart, crash) will never finish; called with the lock held
+    if job["status"] in ("queued", "running") and not _alive(job["owner"]):
+        job.update(status="failed", error="The worker running this job exited", finished=time.time())
+        _write(job)
+    return job
+
+
+def _all_jobs():
+    jobs = []
+    for entry in os.scandir(JOB_DIR):
+        if entry.name.endswith(".json"):
+            job = _read(entry.name[:-5])
+            if job:
+                jobs.append(job)
+    return jobs
+
+
+def _remove(path):
+    try:
+        os.remove(path)
+    except OSError:
+        pass
+
+
+def _prune(jobs):
+    now = time.time()
+    kept = []
+    for job in jobs:
+        if job.get("finished") and now - job["finished"] > JOB_TTL:
+            for path in (job["input_path"], job["output_path"], _record_path(job["id"])):
+                _remove(path)
+        else:
+            kept.append(job)
+
+    # Files left behind by a worker that died before writing the record
+    referenced = {path for job in kept for path in (job["input_path"], job["output_path"])}
+    for entry in os.scandir(JOB_FILES_DIR):
+        try:
+            stale = now - entry.stat().st_mtime > JOB_TTL * 2
+        except OSError:
+            continue
+        if stale and entry.path not in referenced:
+            _remove(entry.path)
+    return kept
+
+
+# -------------------- POOL --------------------
+
+def _run(job_id, operation, input_path, output_path, params):
+    last = 0.0
+
+    def progress(done, total):
+        nonlocal last
+        now = time.monotonic()
+        if now - last >= JOB_PROGRESS_INTERVAL or done == total:
+            last = now
+            _update(job_id, progress=round(done / total, 3) if total else 0.0)
+
+    _update(job_id, status="running", started=time.time())
+    func, _ = OPERATIONS[operation]
+    return func(input_path, output_path, params, progress)
+
+
+def _run_ml(job_id, operation, input_path, output_path, params):
+    # Same admission control as the sync routes. A job has no client
+    # waiting on it, so a busy scheduler means try again later, not fail.
+    while True:
+        try:
+            ticket = scheduler.acquire(ML_OPERATIONS[operation])
+            break
+        except SchedulerBusy as e:
+            time.sleep(e.retry_after)
+    try:
+        _run(job_id, operation, input_path, output_path, params)
+    finally:
+        ticket.release()
+
+
+def _get_ml_executor():
+    # Threads in the gunicorn worker itself, so jobs use the worker's model
+    # registry; one thread per scheduler slot is enough to keep them busy
+    global _ml_executor, _ml_executor_pid
+    with _ml_executor_lock:
+        if _ml_executor is None or _ml_executor_pid != os.getpid():
+            _ml_executor = ThreadPoolExecutor(max_workers=sum(ML_SLOTS.values()), thread_name_prefix="ml-jobs")
+            _ml_executor_pid = os.getpid()
+        return _ml_executor
+
+
+def _dispatch():
+    global _running
+    with _dispatch_lock:
+        while _waiting and _running < JOB_WORKERS:
+            job_id, args = _waiting.popleft()
+            _running += 1
+            future = get_executor().submit(_run, job_id, *args)
+            future.add_done_callback(lambda f, job_id=job_id: _on_done(job_id, f, pooled=True))
+
+
+def _on_done(job_id, future, pooled=False):
+    global _running
+    if pooled:
+        with _dispatch_lock:
+            _running -= 1
+        _dispatch()
+
+    error = future.exception()
+    with _records_locked():
+        job = _read(job_id)
+        if not job:
+            return
+        job["finished"] = time.time()
+        if error:
+            job["status"] = "failed"
+            job["error"] = str(error)
+        else:
+            job["status"] = "done"
+            job["progress"] = 1.0
+            suffix = future.result()
+            default = output_suffix(job["operation"])
+            if suffix and job["download_name"].endswith(default):
+                job["download_name"] = job["download_name"][:-len(default)] + suffix
+        _write(job)
+    _remove(job["input_path"])
+
+
+# -------------------- PUBLIC API --------------------
+
+def job_paths(filename, download_name):
+    """Fresh (input_path, output_path) for a job; they live until its record is pruned."""
+    prefix = uuid.uuid4().hex
+    return (
+        os.path.join(JOB_FILES_DIR, f"{prefix}_in_{filename}"),
+        os.path.join(JOB_FILES_DIR, f"{prefix}_{download_name}"),
+    )
+
+
+def discard(*paths):
+    """Delete the files of a job that was never submitted."""
+    for path in paths:
+        _remove(path)
+
+
+def submit(operation, input_path, output_path, download_name, params):
+    """
+    Queue an operation on the shared process pool and return its job
+    record. Raises JobQueueFull when JOB_QUEUE_LIMIT jobs are already
+    pending across all workers.
+    """
+    with _records_locked():
+        jobs = [_check_owner(job) for job in _prune(_all_jobs())]
+        active = sum(1 for j in jobs if j["status"] in ("queued", "running"))
+        if active >= JOB_QUEUE_LIMIT:
+            raise JobQueueFull(f"Too many pending jobs ({active})")
+
+        job_id = uuid.uuid4().hex
+        job = {
+            "id": job_id,
+            "operation": operation,
+            "status": "queued",
+            "progress": 0.0,
+            "error": None,
+            "created": time.time(),
+            "started": None,
+            "finished": None,
+            "input_path": input_path,
+            "output_path": output_path,
+            "download_name": download_name,
+            "owner": os.getpid(),
+        }
+        _write(job)
+
+    args = (operation, input_path, output_path, params)
+    if operation in ML_OPERATIONS:
+        future = _get_ml_executor().submit(_run_ml, job_id, *args)
+        future.add_done_callback(lambda f: _on_done(job_id, f))
+    else:
+        with _dispatch_lock:
+            _waiting.append((job_id, args))
+        _dispatch()
+    return _public(job)
+
+
+def _public(job):
+    return {k: v for k, v in job.items() if k not in PRIVATE_FIELDS}
+
+
+def get_job(job_id):
+    """Return the public view of a job, or None if it is unknown or expired."""
+    if not re.fullmatch(r"[0-9a-f]{32}", job_id):
+        return None
+    with _records_locked():
+        job = _read(job_id)
+        if not job:
+            return None
+        return _public(_check_owner(job))
+
+
+def get_result(job_id):
+    """Return (output_path, download_name) for a finished job, or None."""
+    job = _read(job_id) if re.fullmatch(r"[0-9a-f]{32}", job_id) else None
+    if not job or job["status"] != "done":
+        return None
+    return job["output_path"], job["download_name"]
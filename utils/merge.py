@@ -1,8 +1,16 @@
-from PyPDF2 import PdfMerger
+from utils.pdfengine import get_engine
 
-def merge_pdfs(files, output_path):
-    merger = PdfMerger()
-    for f in files:
-        merger.append(f)
-    merger.write(output_path)
-    merger.close()
+def merge_pdfs(files, output_path, engine=None):
+    """
+    Merge PDFs (paths, bytes or file streams) into output_path. Each source
+    is appended and closed before the next one is opened; paths are opened
+    in place rather than read into memory. The merged document is built in
+    memory and saved once at the end.
+    """
+    merger = get_engine(engine).merger()
+    try:
+        for f in files:
+            merger.append(f)
+        merger.write(output_path)
+    finally:
+        merger.close()
@@ -0,0 +1,232 @@
+import os
+import time
+import random
+import cProfile
+import resource
+import threading
+from bisect import bisect_left
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+PROFILE_SAMPLE_RATE = float(os.environ.get("PROFILE_SAMPLE_RATE", 0))
+PROFILE_SLOW_MS = int(os.environ.get("PROFILE_SLOW_MS", 1000))
+PROFILE_DIR = os.path.abspath(os.environ.get("PROFILE_DIR", "profiles"))
+
+TIME_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120)
+BYTE_BUCKETS = tuple(1024 * 4 ** i for i in range(11))  # 1 KB .. 1 GB
+
+_lock = threading.Lock()
+_current = ContextVar("request_metrics", default=None)
+
+
+def _peak_rss_bytes():
+    # ru_maxrss is reported in KB on Linux
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
+
+
+def _format_labels(labels):
+    if not labels:
+        return ""
+    inner = ",".join(f'{k}="{str(v)}"' for k, v in labels)
+    return "{" + inner + "}"
+
+
+# -------------------- METRIC TYPES --------------------
+
+class Counter:
+    def __init__(self, name, help_text):
+        self.name = name
+        self.help = help_text
+        self._values = {}
+
+    def inc(self, amount=1, **labels):
+        key = tuple(sorted(labels.items()))
+        with _lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} counter"]
+        with _lock:
+            for key, value in sorted(self._values.items()):
+                lines.append(f"{self.name}{_format_labels(key)} {value}")
+        return lines
+
+
+class Histogram:
+    def __init__(self, name, help_text, buckets=TIME_BUCKETS):
+        self.name = name
+        self.help = help_text
+        self.buckets = tuple(buckets)
+        self._values = {}  # labels -> [bucket counts..., sum, count]
+
+    def observe(self, value, **labels):
+        key = tuple(sorted(labels.items()))
+        with _lock:
+            state = self._values.setdefault(key, [0] * (len(self.buckets) + 2))
+            # Buckets are stored non-cumulatively and summed up when rendered
+            index = bisect_left(self.buckets, value)
+            if index < len(self.buckets):
+                state[index] += 1
+            state[-2] += value
+            state[-1] += 1
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} histogram"]
+        with _lock:
+            for key, state in sorted(self._values.items()):
+                cumulative = 0
+                for bound, count in zip(self.buckets, state):
+                    cumulative += count
+                    lines.append(f"{self.name}_bucket{_format_labels(key + (('le', bound),))} {cumulative}")
+                lines.append(f"{self.name}_bucket{_format_labels(key + (('le', '+Inf'),))} {state[-1]}")
+                lines.append(f"{self.name}_sum{_format_labels(key)} {state[-2]}")
+                lines.append(f"{self.name}_count{_format_labels(key)} {state[-1]}")
+        return lines
+
+
+REQUESTS = Counter("http_requests_total", "Requests handled, by endpoint and status.")
+REQUEST_SECONDS = Histogram("http_request_duration_seconds", "Wall time from request start to the last byte sent.")
+STAGE_SECONDS = Histogram("http_request_stage_seconds", "Time spent per request stage (receive, persist, convert, respond).")
+INPUT_BYTES = Histogram("http_request_input_bytes", "Request body size.", BYTE_BUCKETS)
+OUTPUT_BYTES = Histogram("http_response_output_bytes", "Response body size.", BYTE_BUCKETS)
+RSS_GROWTH = Histogram("http_request_peak_rss_growth_bytes", "How far a request raised the process peak RSS.", BYTE_BUCKETS)
+PAGES = Counter("pages_processed_total", "Document pages rendered, merged or split.")
+PROFILES = Counter("request_profiles_total", "Slow sampled requests written to PROFILE_DIR.")
+
+METRICS = (REQUESTS, REQUEST_SECONDS, STAGE_SECONDS, INPUT_BYTES, OUTPUT_BYTES, RSS_GROWTH, PAGES, PROFILES)
+
+
+# -------------------- PER REQUEST --------------------
+
+class RequestMetrics:
+    """
+    Timings and sizes of one request. Stages not timed explicitly are
+    derived when the request finishes: convert is the view time minus the
+    persist stage, respond runs until the response body has been sent.
+    """
+
+    def __init__(self, endpoint, input_bytes=0):
+        self.endpoint = endpoint or "unknown"
+        self.input_bytes = input_bytes or 0
+        self.output_bytes = 0
+        self.pages = 0
+        self.stages = {}
+        self.started = time.perf_counter()
+        self.peak_rss_before = _peak_rss_bytes()
+        self.profiler = None
+        self._finished = False
+
+        if PROFILE_SAMPLE_RATE and random.random() < PROFILE_SAMPLE_RATE:
+            try:
+                self.profiler = cProfile.Profile()
+                self.profiler.enable()
+            except ValueError:
+                # Another profiler is already active in this thread
+                self.profiler = None
+
+    def add_stage(self, name, seconds):
+        self.stages[name] = self.stages.get(name, 0) + seconds
+
+    @contextmanager
+    def stage(self, name):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.add_stage(name, time.perf_counter() - start)
+
+    def server_timing(self):
+        """Value for the Server-Timing header, covering everything up to the response headers."""
+        parts = [f"{name};dur={seconds * 1000:.1f}" for name, seconds in self.stages.items()]
+        parts.append(f"total;dur={(time.perf_counter() - self.started) * 1000:.1f}")
+        return ", ".join(parts)
+
+    def finish(self, status):
+        if self._finished:
+            return
+        self._finished = True
+        if _current.get() is self:
+            _current.set(None)
+
+        elapsed = time.perf_counter() - self.started
+        endpoint = self.endpoint
+
+        REQUESTS.inc(endpoint=endpoint, status=status)
+        REQUEST_SECONDS.observe(elapsed, endpoint=endpoint)
+        for name, seconds in self.stages.items():
+            STAGE_SECONDS.observe(seconds, endpoint=endpoint, stage=name)
+        INPUT_BYTES.observe(self.input_bytes, endpoint=endpoint)
+        OUTPUT_BYTES.observe(self.output_bytes, endpoint=endpoint)
+        RSS_GROWTH.observe(_peak_rss_bytes() - self.peak_rss_before, endpoint=endpoint)
+        if self.pages:
+            PAGES.inc(self.pages, endpoint=endpoint)
+
+        if self.profiler:
+            self.profiler.disable()
+            if elapsed * 1000 >= PROFILE_SLOW_MS:
+                self._dump_profile(elapsed)
+
+    def _dump_profile(self, elapsed):
+        os.makedirs(PROFILE_DIR, exist_ok=True)
+        name = f"{self.endpoint}_{int(time.time())}_{int(elapsed * 1000)}ms_{os.getpid()}.prof"
+        path = os.path.join(PROFILE_DIR, name)
+        try:
+            self.profiler.dump_stats(path)
+            PROFILES.inc(endpoint=self.endpoint)
+            print(f"[Metrics] Wrote profile {path}")
+        except OSError as e:
+            print(f"[Metrics Error] Could not write profile: {e}")
+
+
+def start_request(endpoint, input_bytes=0):
+    metrics = RequestMetrics(endpoint, input_bytes)
+    _current.set(metrics)
+    return metrics
+
+
+def current():
+    """The RequestMetrics of the request running in this context, if any."""
+    return _current.get()
+
+
+@contextmanager
+def stage(name):
+    """Time a block as a stage of the current request; a no-op outside requests."""
+    metrics = _current.get()
+    if metrics is None:
+        yield
+        return
+    with metrics.stage(name):
+        yield
+
+
+def add_pages(count):
+    metrics = _current.get()
+    if metrics is not None:
+        metrics.pages += count
+
+
+# -------------------- EXPOSITION --------------------
+
+def render(gauges=None):
+    """
+    Prometheus text format for everything recorded in this process.
+    gauges maps a prefix to a stats dict (e.g. result_cache.stats());
+    every numeric value in it is exported as <prefix>_<key>.
+    Each gunicorn worker keeps its own numbers.
+    """
+    lines = []
+    for metric in METRICS:
+        lines.extend(metric.render())
+
+    lines.append("# TYPE process_peak_rss_bytes gauge")
+    lines.append(f"process_peak_rss_bytes {_peak_rss_bytes()}")
+
+    for prefix, stats in (gauges or {}).items():
+        for key, value in stats.items():
+            if isinstance(value, bool) or not isinstance(value, (int, float)):
+                continue
+            lines.append(f"# TYPE {prefix}_{key} gauge")
+            lines.append(f"{prefix}_{key} {value}")
+
+    return "\n".join(lines) + "\n"
@@ -0,0 +1,150 @@
+import os
+import gc
+import time
+import threading
+from collections import OrderedDict
+
+MODEL_MEMORY_BUDGET_MB = int(os.environ.get("MODEL_MEMORY_BUDGET_MB", 1024))
+MODEL_IDLE_TIMEOUT = int(os.environ.get("MODEL_IDLE_TIMEOUT", 900))
+MODEL_SWEEP_INTERVAL = int(os.environ.get("MODEL_SWEEP_INTERVAL", 60))
+
+
+def _rss_mb():
+    try:
+        with open("/proc/self/statm") as f:
+            pages = int(f.read().split()[1])
+        return pages * os.sysconf("SC_PAGE_SIZE") / (1024 * 1024)
+    except (OSError, ValueError):
+        return 0
+
+
+class ModelRegistry:
+    """
+    Per-process cache of heavy ML models (EasyOCR readers, rembg sessions).
+    Models are loaded on first use and evicted least-recently-used first when
+    the memory budget is exceeded, or once they have been idle too long; a
+    sweeper thread checks for idle models even when no lookups come in.
+    """
+
+    def __init__(self, budget_mb=MODEL_MEMORY_BUDGET_MB, idle_timeout=MODEL_IDLE_TIMEOUT):
+        self.budget_mb = budget_mb
+        self.idle_timeout = idle_timeout
+        self._models = OrderedDict()  # key -> {"model", "size_mb", "last_used"}
+        self._load_locks = {}
+        self._lock = threading.Lock()
+        self._counters = {"loads": 0, "hits": 0, "evictions": 0}
+        self._sweeper_pid = None
+
+    def get(self, key, loader, size_mb=0):
+        """
+        Return the model stored under key, calling loader() to build it on a miss.
+        size_mb is the expected footprint, used when the measured RSS growth is not usable.
+        """
+        self._ensure_sweeper()
+        with self._lock:
+            self._expire_idle()
+            entry = self._models.get(key)
+            if entry:
+                return self._hit(key, entry)
+            load_lock = self._load_locks.setdefault(key, threading.Lock())
+
+        # Only one thread loads a given model; the others wait and then hit
+        with load_lock:
+            with self._lock:
+                entry = self._models.get(key)
+                if entry:
+                    return self._hit(key, entry)
+
+            before = _rss_mb()
+            model = loader()
+            measured = _rss_mb() - before
+
+            with self._lock:
+                size = measured if measured > 0 else size_mb
+                self._evict_for(size)
+                self._models[key] = {"model": model, "size_mb": size, "last_used": time.time()}
+                self._counters["loads"] += 1
+                print(f"[Models] Loaded {key} (~{size:.0f} MB)")
+                return model
+
+    def pin(self, key):
+        """
+        Keep key loaded for the life of the process. Used for models loaded
+        before gunicorn forks: their pages are shared with the master, so
+        evicting them frees nothing and reloading would make a private copy.
+        """
+        with self._lock:
+            if key in self._models:
+                self._models[key]["pinned"] = True
+
+    def evict(self, key):
+        with self._lock:
+            if self._models.pop(key, None) is not None:
+                self._counters["evictions"] += 1
+        gc.collect()
+
+    def expire_idle(self):
+        """Drop models idle for longer than idle_timeout; returns how many were dropped."""
+        with self._lock:
+            before = len(self._models)
+            self._expire_idle()
+            dropped = before - len(self._models)
+        if dropped:
+            gc.collect()
+        return dropped
+
+    def stats(self):
+        with self._lock:
+            return {
+                **self._counters,
+                "loaded": list(self._models.keys()),
+                "pinned": [k for k, e in self._models.items() if e.get("pinned")],
+                "used_mb": round(sum(e["size_mb"] for e in self._models.values()), 1),
+                "budget_mb": self.budget_mb,
+            }
+
+    def _hit(self, key, entry):
+        entry["last_used"] = time.time()
+        self._models.move_to_end(key)
+        self._counters["hits"] += 1
+        return entry["model"]
+
+    def _expire_idle(self):
+        if not self.idle_timeout:
+            return
+        now = time.time()
+        for key, entry in list(self._models.items()):
+            if now - entry["last_used"] > self.idle_timeout and not entry.get("pinned"):
+                self._drop(key, "idle")
+
+    def _evict_for(self, size_mb):
+        used = sum(e["size_mb"] for e in self._models.values())
+        evictable = [k for k, e in self._models.items() if not e.get("pinned")]
+        while evictable and used + size_mb > self.budget_mb:
+            key = evictable.pop(0)
+            used -= self._models[key]["size_mb"]
+            self._drop(key, "budget")
+
+    def _ensure_sweeper(self):
+        # Threads do not survive fork, so each worker process starts its own
+        if self._sweeper_pid == os.getpid() or not self.idle_timeout:
+            return
+        self._sweeper_pid = os.getpid()
+
+        def sweep():
+            while True:
+                time.sleep(MODEL_SWEEP_INTERVAL)
+                try:
+                    self.expire_idle()
+                except Exception as e:
+                    print(f"[Models Error] {e}")
+
+        threading.Thread(target=sweep, name="model-sweeper", daemon=True).start()
+
+    def _drop(self, key, reason):
+        del self._models[key]
+        self._counters["evictions"] += 1
+        print(f"[Models] Evicted {key} ({reason})")
+
+
+registry = ModelRegistry()
@@ -0,0 +1,125 @@
+import io
+import os
+from collections import namedtuple
+
+import fitz
+
+from utils.imgTools import get_reader, open_image
+from utils.render import render_pages, open_pdf
+
+OCR_BATCH_SIZE = int(os.environ.get("OCR_BATCH_SIZE", 4))
+OCR_DPI = int(os.environ.get("OCR_DPI", 200))
+
+# Formats OpenCV decodes itself; anything else is converted to PNG first
+OCR_NATIVE_FORMATS = ("JPEG", "PNG", "BMP", "TIFF", "WEBP")
+
+# data is encoded image bytes, width/height are in pixels
+OcrInput = namedtuple("OcrInput", ["number", "data", "width", "height"])
+# lines are (x0, y0, x1, y1, text, confidence) in image pixels
+OcrPage = namedtuple("OcrPage", ["number", "text", "lines", "width", "height"])
+
+def pdf_inputs(source, dpi=OCR_DPI):
+    """Render PDF pages for OCR, in parallel for large documents (see render_pages)."""
+    for page in render_pages(source, dpi=dpi, fmt="png"):
+        yield OcrInput(page.number, page.data, page.width, page.height)
+
+
+def image_inputs(sources):
+    """Wrap uploaded images (paths or bytes) as OCR inputs, reading only their headers."""
+    for number, source in enumerate(sources):
+        with open_image(source) as img:
+            width, height = img.size
+            if img.format in OCR_NATIVE_FORMATS:
+                data = source
+                if isinstance(source, str):
+                    with open(source, "rb") as f:
+                        data = f.read()
+            else:
+                buffer = io.BytesIO()
+                img.convert("RGB").save(buffer, format="PNG")
+                data = buffer.getvalue()
+        yield OcrInput(number, data, width, height)
+
+
+def _to_page(item, result):
+    lines = []
+    for box, text, confidence in result:
+        xs = [p[0] for p in box]
+        ys = [p[1] for p in box]
+        lines.append((min(xs), min(ys), max(xs), max(ys), text, float(confidence)))
+    return OcrPage(item.number, "\n".join(line[4] for line in lines), lines, item.width, item.height)
+
+
+def _run_batch(reader, batch):
+    if len(batch) == 1:
+        results = [reader.readtext(batch[0].data)]
+    else:
+        width, height = batch[0].width, batch[0].height
+        results = reader.readtext_batched(
+            [item.data for item in batch], n_width=width, n_height=height
+        )
+    return [_to_page(item, result) for item, result in zip(batch, results)]
+
+
+def iter_ocr(inputs, lang, batch_size=OCR_BATCH_SIZE):
+    """
+    OCR inputs in order and yield one OcrPage per input as soon as its batch
+    is done. Consecutive inputs of the same size share one detector batch;
+    a size change or a full batch flushes it.
+    """
+    reader = get_reader(lang)
+    batch = []
+    for item in inputs:
+        if batch and (len(batch) >= batch_size or (item.width, item.height) != (batch[0].width, batch[0].height)):
+            yield from _run_batch(reader, batch)
+            batch = []
+        batch.append(item)
+    if batch:
+        yield from _run_batch(reader, batch)
+
+
+# -------------------- SEARCHABLE PDF --------------------
+
+def _add_text_layer(page, ocr_page):
+    # OCR ran on a rendering of the page as displayed, so map back through the rotation
+    scale = page.rect.width / ocr_page.width
+    derotate = page.derotation_matrix
+    for x0, y0, x1, y1, text, _ in ocr_page.lines:
+        if not text.strip():
+            continue
+        height = (y1 - y0) * scale
+        fontsize = max(1.0, height * 0.8)
+        origin = fitz.Point(x0 * scale, y1 * scale - height * 0.2) * derotate
+        morph = None
+        length = fitz.get_text_length(text, fontname="helv", fontsize=fontsize)
+        if length and not page.rotation:
+            # Stretch the invisible text over the word box so selection lines up
+            morph = (origin, fitz.Matrix((x1 - x0) * scale / length, 1))
+        page.insert_text(
+            origin, text, fontsize=fontsize, fontname="helv",
+            render_mode=3, rotate=page.rotation, morph=morph
+        )
+
+
+def searchable_pdf(ocr_pages, output_path, pdf_source=None, image_sources=None):
+    """
+    Write a PDF with an invisible text layer from OCR results. For PDF input
+    the layer is added to the original pages; for images each image becomes
+    a page, one pixel per point.
+    """
+    doc = open_pdf(pdf_source) if pdf_source is not None else fitz.open()
+    try:
+        for ocr_page in ocr_pages:
+            if pdf_source is not None:
+                page = doc[ocr_page.number]
+            else:
+                page = doc.new_page(width=ocr_page.width, height=ocr_page.height)
+                source = image_sources[ocr_page.number]
+                if isinstance(source, str):
+                    page.insert_image(page.rect, filename=source)
+                else:
+                    page.insert_image(page.rect, stream=source)
+            _add_text_layer(page, ocr_page)
+        doc.save(output_path, garbage=3, deflate=True)
+    finally:
+        doc.close()
@@ -0,0 +1,118 @@
+import os
+import math
+
+from pdf2docx import Converter
+
+from utils.render import open_pdf
+from utils.metrics import add_pages
+from utils.pool import POOL_WORKERS, parallelism, imap_bounded, source_path
+
+DOCX_WORKERS = int(os.environ.get("DOCX_WORKERS", POOL_WORKERS))
+DOCX_CHUNK_PAGES = int(os.environ.get("DOCX_CHUNK_PAGES", 8))
+DOCX_PARALLEL_MIN_PAGES = int(os.environ.get("DOCX_PARALLEL_MIN_PAGES", 16))
+
+def parse_page_ranges(spec, page_count):
+    """
+    Turn "1-3,7,10-" (1-based, inclusive, open ended allowed) into sorted
+    0-based page indexes. An empty spec selects every page. Raises
+    ValueError with the same messages as /split.
+    """
+    if not spec or not spec.strip():
+        return list(range(page_count))
+
+    indexes = set()
+    for part in spec.split(","):
+        part = part.strip()
+        if not part:
+            continue
+        try:
+            if "-" in part:
+                first, last = part.split("-", 1)
+                first = int(first) if first.strip() else 1
+                last = int(last) if last.strip() else page_count
+            else:
+                first = last = int(part)
+        except ValueError:
+            raise ValueError("Invalid page ranges")
+        if first < 1 or last > page_count or first > last:
+            raise ValueError(f"Invalid page range {part} for a {page_count}-page document")
+        indexes.update(range(first - 1, last))
+    if not indexes:
+        raise ValueError("No pages selected")
+    return sorted(indexes)
+
+
+def _open(source):
+    if isinstance(source, str):
+        return Converter(source)
+    return Converter(stream=bytes(source))
+
+
+def _parse_chunk(source, indexes):
+    """Runs in a pool process: parse the given pages and return their stored layout."""
+    cv = _open(source)
+    try:
+        settings = cv.default_settings
+        cv.load_pages(pages=indexes).parse_document(**settings).parse_pages(**settings)
+        # What Converter.store() returns under "pages"; store() itself needs
+        # a file name, which a Converter opened from bytes does not have
+        return [page.store() for page in cv.pages if page.finalized]
+    finally:
+        cv.close()
+
+
+def _parse_serial(cv, settings, progress):
+    # Converter.parse_pages, with a progress report after every page
+    pages = [page for page in cv.pages if not page.skip_parsing]
+    for done, page in enumerate(pages, start=1):
+        try:
+            page.parse(**settings)
+        except Exception as e:
+            print(f"[pdf-to-docx] Skipping page {page.id + 1}: {e}")
+        add_pages(1)
+        if progress:
+            progress(done, len(pages))
+
+
+def _parse_parallel(cv, source, indexes, workers, progress):
+    chunk_size = max(DOCX_CHUNK_PAGES, math.ceil(len(indexes) / (workers * 4)))
+    chunks = [indexes[i:i + chunk_size] for i in range(0, len(indexes), chunk_size)]
+
+    done = 0
+    with source_path(source) as path:
+        calls = [(path, chunk) for chunk in chunks]
+        for chunk, pages in zip(chunks, imap_bounded(_parse_chunk, calls, workers)):
+            cv.restore({"pages": pages})
+            done += len(chunk)
+            add_pages(len(chunk))
+            if progress:
+                progress(done, len(indexes))
+
+
+def pdf_to_word(source, output_path, pages=None, workers=None, progress=None):
+    """
+    Convert a PDF (path or bytes) to DOCX. pages is a range spec such as
+    "1-3,7" (see parse_page_ranges); only those pages are parsed and
+    written. Long selections are parsed in page chunks on the shared
+    process pool and the parsed layouts are merged into one document, so
+    the output is the same as a single-process run. progress(done, total)
+    is called as pages are parsed.
+    """
+    doc = open_pdf(source)
+    page_count = doc.page_count
+    doc.close()
+    indexes = parse_page_ranges(pages, page_count)
+    workers = parallelism(workers, DOCX_WORKERS)
+
+    cv = _open(source)
+    try:
+        settings = cv.default_settings
+        cv.load_pages(pages=indexes)
+        if workers <= 1 or len(indexes) < DOCX_PARALLEL_MIN_PAGES:
+            cv.parse_document(**settings)
+            _parse_serial(cv, settings, progress)
+        else:
+            _parse_parallel(cv, source, indexes, workers, progress)
+        cv.make_docx(output_path, **settings)
+    finally:
+        cv.close()
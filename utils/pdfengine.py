@@ -0,0 +1,136 @@
+import os
+import io
+
+import fitz
+
+from utils.render import open_pdf
+from utils.metrics import add_pages
+
+PDF_ENGINE = os.environ.get("PDF_ENGINE", "pymupdf")
+
+
+def validate_ranges(ranges, page_count):
+    for start, end in ranges:
+        if start < 1 or end < start or end > page_count:
+            raise ValueError(f"Invalid page range {start}-{end} for a {page_count}-page document")
+
+
+def _read_source(source):
+    # Streams are read into memory; paths (pass uploads.upload_source for an
+    # upload) and bytes pass through, so files on disk are opened in place
+    if hasattr(source, "read"):
+        source.seek(0)
+        return source.read()
+    return source
+
+
+# -------------------- PyMuPDF --------------------
+
+class _MuPDFMerger:
+    def __init__(self):
+        self.doc = fitz.open()
+
+    # The merged document is held in memory until write(); only the sources are released as it goes
+    def append(self, source):
+        src = open_pdf(_read_source(source))
+        try:
+            self.doc.insert_pdf(src)
+            add_pages(src.page_count)
+        finally:
+            src.close()
+
+    def write(self, output_path):
+        self.doc.save(output_path, garbage=3, deflate=True)
+
+    def close(self):
+        self.doc.close()
+
+
+class MuPDFEngine:
+    name = "pymupdf"
+
+    def merger(self):
+        return _MuPDFMerger()
+
+    def split(self, source, ranges):
+        doc = open_pdf(_read_source(source))
+        try:
+            validate_ranges(ranges, doc.page_count)
+        except ValueError:
+            doc.close()
+            raise
+
+        def parts():
+            try:
+                for idx, (start, end) in enumerate(ranges, start=1):
+                    part = fitz.open()
+                    part.insert_pdf(doc, from_page=start - 1, to_page=end - 1)
+                    add_pages(end - start + 1)
+                    yield f"split_part_{idx}.pdf", part.tobytes(garbage=3, deflate=True)
+                    part.close()
+            finally:
+                doc.close()
+
+        return parts()
+
+
+# -------------------- PyPDF2 --------------------
+
+class _PyPDF2Merger:
+    def __init__(self):
+        from PyPDF2 import PdfMerger
+        self.merger = PdfMerger()
+
+    def append(self, source):
+        if hasattr(source, "read"):
+            source.seek(0)
+        before = len(self.merger.pages)
+        self.merger.append(source)
+        add_pages(len(self.merger.pages) - before)
+
+    def write(self, output_path):
+        self.merger.write(output_path)
+
+    def close(self):
+        self.merger.close()
+
+
+class PyPDF2Engine:
+    name = "pypdf2"
+
+    def merger(self):
+        return _PyPDF2Merger()
+
+    def split(self, source, ranges):
+        from PyPDF2 import PdfReader, PdfWriter
+
+        if hasattr(source, "read"):
+            source.seek(0)
+        reader = PdfReader(source)
+        validate_ranges(ranges, len(reader.pages))
+
+        def parts():
+            for idx, (start, end) in enumerate(ranges, start=1):
+                writer = PdfWriter()
+                for i in range(start - 1, end):
+                    writer.add_page(reader.pages[i])
+                add_pages(end - start + 1)
+                buffer = io.BytesIO()
+                writer.write(buffer)
+                yield f"split_part_{idx}.pdf", buffer.getvalue()
+
+        return parts()
+
+
+ENGINES = {
+    "pymupdf": MuPDFEngine,
+    "pypdf2": PyPDF2Engine,
+}
+
+
+def get_engine(name=None):
+    """Return the PDF engine selected by name or the PDF_ENGINE setting."""
+    name = (name or PDF_ENGINE).lower()
+    if name not in ENGINES:
+        raise ValueError(f"Unknown PDF engine: {name}")
+    return ENGINES[name]()
@@ -0,0 +1,144 @@
+import os
+import json
+
+import fitz
+
+from utils.render import open_pdf, render_pages
+from utils.metrics import add_pages, stage
+from utils.compress import compress_document, IMAGE_SETTINGS, COMPRESSION_MODES
+from utils.pdfengine import get_engine
+from utils.split import parse_ranges
+from utils.imgTools import OCR_LANGUAGES
+
+PIPELINE_MAX_STEPS = int(os.environ.get("PIPELINE_MAX_STEPS", 8))
+
+PIPELINE_OPERATIONS = ("merge", "compress", "split", "pdf-to-images", "ocr")
+# These turn the document into something else, so nothing can follow them
+FINAL_OPERATIONS = ("split", "pdf-to-images", "ocr")
+
+
+class PipelineError(ValueError):
+    pass
+
+
+def _choice(step, name, default, choices):
+    value = str(step.get(name, default)).lower()
+    if value not in choices:
+        raise PipelineError(f"{step['op']}: {name} must be one of {', '.join(choices)}")
+    return value
+
+
+def _int(step, name, default, low, high):
+    try:
+        value = int(step.get(name, default))
+    except (TypeError, ValueError):
+        raise PipelineError(f"{step['op']}: {name} must be a number")
+    if not low <= value <= high:
+        raise PipelineError(f"{step['op']}: {name} must be between {low} and {high}")
+    return value
+
+
+def parse_steps(text, file_count):
+    """
+    Validate a JSON list of steps such as
+    [{"op": "merge"}, {"op": "compress", "power": "low"}, {"op": "split", "ranges": "1-3,4"}]
+    and return them with parameters normalized and defaults filled in.
+    Everything is checked before any work starts.
+    """
+    try:
+        raw = json.loads(text or "")
+    except ValueError:
+        raise PipelineError("steps must be a JSON list")
+    if not isinstance(raw, list) or not raw:
+        raise PipelineError("steps must be a non-empty JSON list")
+    if len(raw) > PIPELINE_MAX_STEPS:
+        raise PipelineError(f"At most {PIPELINE_MAX_STEPS} steps are allowed")
+
+    steps = []
+    for index, step in enumerate(raw):
+        if isinstance(step, str):
+            step = {"op": step}
+        if not isinstance(step, dict) or step.get("op") not in PIPELINE_OPERATIONS:
+            raise PipelineError(f"Step {index + 1}: op must be one of {', '.join(PIPELINE_OPERATIONS)}")
+        op = step["op"]
+        if op == "merge" and index:
+            raise PipelineError("merge can only be the first step")
+        if op in FINAL_OPERATIONS and index != len(raw) - 1:
+            raise PipelineError(f"{op} can only be the last step")
+
+        if op == "merge":
+            steps.append({"op": op})
+        elif op == "compress":
+            steps.append({
+                "op": op,
+                "power": _choice(step, "power", "medium", tuple(IMAGE_SETTINGS)),
+                "mode": _choice(step, "mode", "auto", COMPRESSION_MODES),
+            })
+        elif op == "split":
+            try:
+                ranges = parse_ranges(str(step.get("ranges", "")))
+            except ValueError:
+                raise PipelineError("split: invalid page ranges")
+            steps.append({"op": op, "ranges": ranges})
+        elif op == "pdf-to-images":
+            steps.append({"op": op, "dpi": _int(step, "dpi", 200, 36, 600)})
+        else:
+            steps.append({
+                "op": op,
+                "lang": _choice(step, "lang", "en", OCR_LANGUAGES),
+                "output": _choice(step, "output", "json", ("json", "pdf")),
+            })
+
+    if file_count > 1 and steps[0]["op"] != "merge":
+        raise PipelineError("Several files need merge as the first step")
+    return steps
+
+
+def open_input(sources):
+    """Open the uploaded PDFs as one document, merging them when there are several."""
+    if len(sources) == 1:
+        return open_pdf(sources[0])
+    doc = fitz.open()
+    try:
+        for source in sources:
+            src = open_pdf(source)
+            try:
+                doc.insert_pdf(src)
+                add_pages(src.page_count)
+            finally:
+                src.close()
+    except Exception:
+        doc.close()
+        raise
+    return doc
+
+
+def run_document_steps(doc, steps):
+    """
+    Apply the steps that produce a PDF (merge, compress) to an open document
+    and return the resulting document. Nothing is saved in between.
+    """
+    for step in steps:
+        if step["op"] == "compress":
+            with stage("compress"):
+                doc = compress_document(doc, power=step["power"], mode=step["mode"])
+    return doc
+
+
+def split_entries(doc, step):
+    """(name, pdf_bytes) per range; takes ownership of doc."""
+    return get_engine("pymupdf").split(doc, step["ranges"])
+
+
+def image_entries(doc, step):
+    """(name, png_bytes) per page; takes ownership of doc."""
+    pages = render_pages(doc, dpi=step["dpi"], fmt="png")
+
+    def entries():
+        try:
+            for page in pages:
+                yield f"page_{page.number + 1}.png", page.data
+        finally:
+            doc.close()
+
+    return entries()
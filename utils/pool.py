@@ -0,0 +1,84 @@
+import os
+import threading
+from contextlib import contextmanager
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+
+from utils.storage import storage
+
+# One process pool per gunicorn worker, shared by page rendering, table
+# extraction, DOCX parsing and background jobs
+POOL_WORKERS = int(os.environ.get("POOL_WORKERS", os.cpu_count() or 1))
+
+_executor = None
+_executor_pid = None
+_executor_lock = threading.Lock()
+_in_pool = False
+
+
+def _mark_pool_process():
+    global _in_pool
+    _in_pool = True
+
+
+def in_pool():
+    """True inside a pool process, where work runs inline instead of starting more processes."""
+    return _in_pool
+
+
+def get_executor():
+    # Created lazily per process: pools do not survive fork, so every gunicorn worker makes its own
+    global _executor, _executor_pid
+    with _executor_lock:
+        if _executor is None or _executor_pid != os.getpid():
+            _executor = ProcessPoolExecutor(max_workers=POOL_WORKERS, initializer=_mark_pool_process)
+            _executor_pid = os.getpid()
+        return _executor
+
+
+def parallelism(requested, limit):
+    """How many pool processes a caller may keep busy; 1 means run inline."""
+    if _in_pool:
+        return 1
+    return max(1, min(requested or limit, limit, POOL_WORKERS))
+
+
+def imap_bounded(func, calls, workers):
+    """
+    Run func(*args) on the pool for every args tuple in calls and yield the
+    results in order. At most workers * 2 calls are in flight, so memory
+    stays bounded when the consumer is slow; calls not yet started are
+    cancelled if the generator is closed early.
+    """
+    executor = get_executor()
+    pending = deque()
+    try:
+        for args in calls:
+            pending.append(executor.submit(func, *args))
+            if len(pending) >= workers * 2:
+                yield pending.popleft().result()
+        while pending:
+            yield pending.popleft().result()
+    finally:
+        for future in pending:
+            future.cancel()
+
+
+@contextmanager
+def source_path(source, suffix=".pdf"):
+    """
+    A path for source (a path or bytes-like) to hand to pool calls. Bytes
+    are written to a temp file once instead of being pickled into every call.
+    """
+    if isinstance(source, str):
+        yield source
+        return
+    # Pinned with a long deadline: it must outlive however long the work takes
+    path = storage.allocate(f"pool{suffix}", ttl=max(storage.ttl, 3600), pinned=True)
+    try:
+        with open(path, "wb") as f:
+            f.write(source)
+        storage.account(path)
+        yield path
+    finally:
+        storage.release(path)
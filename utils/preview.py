@@ -0,0 +1,155 @@
+import os
+import threading
+from collections import OrderedDict
+
+import fitz
+
+from utils.cache import ResultCache, RESULT_CACHE_DIR
+from utils.render import open_pdf, image_coverage, AUTO_JPEG_COVERAGE
+from utils.metrics import add_pages
+
+# Registered PDFs live on disk so every worker can serve a handle; they are
+# dropped least-recently-used first, or once unused for PREVIEW_TTL seconds
+PREVIEW_DIR = os.environ.get("PREVIEW_DIR", os.path.join(RESULT_CACHE_DIR, "previews"))
+PREVIEW_STORE_MB = int(os.environ.get("PREVIEW_STORE_MB", 1024))
+PREVIEW_TTL = int(os.environ.get("PREVIEW_TTL", 3600))
+# Rendered pages kept in memory per worker
+PREVIEW_CACHE_MB = int(os.environ.get("PREVIEW_CACHE_MB", 64))
+# Parsed documents kept open per worker
+PREVIEW_OPEN_DOCS = int(os.environ.get("PREVIEW_OPEN_DOCS", 8))
+PREVIEW_MIN_WIDTH = 16
+PREVIEW_MAX_WIDTH = int(os.environ.get("PREVIEW_MAX_WIDTH", 1600))
+PREVIEW_JPEG_QUALITY = int(os.environ.get("PREVIEW_JPEG_QUALITY", 75))
+
+
+class PreviewStore:
+    """
+    Uploaded PDFs addressed by their sha256 (the handle), with single pages
+    rendered on demand at a requested width. Rendered pages are kept in an
+    in-memory LRU capped at PREVIEW_CACHE_MB and the most recently used
+    documents stay open, so a thumbnail costs one page render the first
+    time and a dictionary lookup after that.
+    """
+
+    def __init__(self, directory=PREVIEW_DIR, store_mb=PREVIEW_STORE_MB,
+                 cache_mb=PREVIEW_CACHE_MB, open_docs=PREVIEW_OPEN_DOCS):
+        self.documents = ResultCache(directory, store_mb * 1024 * 1024)
+        self.max_bytes = cache_mb * 1024 * 1024
+        self.open_docs = open_docs
+        self._pages = OrderedDict()  # (handle, page, width) -> (data, mimetype)
+        self._docs = OrderedDict()   # handle -> fitz.Document
+        self._total = 0
+        self._lock = threading.Lock()
+        # MuPDF documents are not safe to use from several threads at once
+        self._render_lock = threading.Lock()
+        self._counters = {"hits": 0, "misses": 0, "evictions": 0}
+
+    def register(self, source, handle):
+        """Store a PDF (path or bytes) under handle; returns its page count."""
+        if not self.documents.enabled:
+            raise RuntimeError("Previews are disabled (PREVIEW_STORE_MB=0)")
+        page_count = self.page_count(handle)
+        if page_count:
+            return page_count
+
+        try:
+            doc = open_pdf(source)
+        except Exception:
+            raise ValueError("Not a readable PDF")
+        try:
+            if doc.needs_pass:
+                raise ValueError("Password protected PDFs cannot be previewed")
+            page_count = doc.page_count
+        finally:
+            doc.close()
+        if not page_count:
+            raise ValueError("PDF has no pages")
+
+        if isinstance(source, str):
+            self.documents.put(handle, source)
+        else:
+            self.documents.put_bytes(handle, bytes(source))
+        return page_count
+
+    def page_count(self, handle):
+        """Page count for a registered handle, or None when it is unknown or expired."""
+        path = self.documents.get(handle, max_age=PREVIEW_TTL)
+        if not path:
+            return None
+        with self._render_lock:
+            return self._document(handle, path).page_count
+
+    def render(self, handle, number, width):
+        """
+        Return (image bytes, mimetype) for 0-based page number scaled to
+        width pixels, or None when the handle is unknown or expired. Raises
+        IndexError for a page outside the document.
+        """
+        key = (handle, number, width)
+        with self._lock:
+            hit = self._pages.get(key)
+            if hit:
+                self._pages.move_to_end(key)
+                self._counters["hits"] += 1
+        if hit:
+            # Keep the document from expiring while its pages are being viewed
+            self.documents.get(handle)
+            return hit
+
+        path = self.documents.get(handle, max_age=PREVIEW_TTL)
+        if not path:
+            return None
+        with self._render_lock:
+            doc = self._document(handle, path)
+            if not 0 <= number < doc.page_count:
+                raise IndexError(f"Page {number + 1} is outside the {doc.page_count}-page document")
+            result = _render_width(doc[number], width)
+        add_pages(1)
+
+        with self._lock:
+            self._counters["misses"] += 1
+            if key not in self._pages:
+                self._pages[key] = result
+                self._total += len(result[0])
+                self._evict()
+        return result
+
+    def stats(self):
+        with self._lock:
+            return {
+                **self._counters,
+                "pages": len(self._pages),
+                "size_mb": round(self._total / (1024 * 1024), 1),
+                "max_mb": self.max_bytes // (1024 * 1024),
+                "open_documents": len(self._docs),
+            }
+
+    def _document(self, handle, path):
+        # Called with _render_lock held
+        doc = self._docs.get(handle)
+        if doc is not None:
+            self._docs.move_to_end(handle)
+            return doc
+        doc = self._docs[handle] = fitz.open(path, filetype="pdf")
+        while len(self._docs) > self.open_docs:
+            _, old = self._docs.popitem(last=False)
+            old.close()
+        return doc
+
+    def _evict(self):
+        while self._pages and self._total > self.max_bytes:
+            _, (data, _) = self._pages.popitem(last=False)
+            self._total -= len(data)
+            self._counters["evictions"] += 1
+
+
+def _render_width(page, width):
+    zoom = width / page.rect.width
+    pix = page.get_pixmap(matrix=fitz.Matrix(zoom, zoom), alpha=False)
+    # Same choice as render fmt="auto": photos as JPEG, text and line art as PNG
+    if image_coverage(page) >= AUTO_JPEG_COVERAGE:
+        return pix.tobytes("jpeg", jpg_quality=PREVIEW_JPEG_QUALITY), "image/jpeg"
+    return pix.tobytes("png"), "image/png"
+
+
+preview_store = PreviewStore()
@@ -1,7 +1,25 @@
-from rembg import remove
-from PIL import Image
+import os
+
+from utils.models import registry
+from utils.scheduler import threads_per_slot
+from utils.imgTools import open_image
+
+REMBG_MODEL = "u2net"
+REMBG_SESSION_SIZE_MB = 350
+
+def get_session(model=REMBG_MODEL):
+    """Return the rembg session for model, loading it on first use."""
+    def load():
+        # rembg sizes its onnxruntime thread pools from OMP_NUM_THREADS
+        os.environ.setdefault("OMP_NUM_THREADS", str(threads_per_slot()))
+        from rembg import new_session
+        return new_session(model)
+
+    return registry.get(f"rembg:{model}", load, size_mb=REMBG_SESSION_SIZE_MB)
 
 def remove_background(input_image_path, output_image_path):
-    with Image.open(input_image_path) as img:
-        output = remove(img)
+    from rembg import remove
+
+    with open_image(input_image_path) as img:
+        output = remove(img, session=get_session())
         output.save(output_image_path)
@@ -0,0 +1,108 @@
+import os
+import math
+from collections import namedtuple
+
+import fitz
+
+from utils.metrics import add_pages
+from utils.pool import POOL_WORKERS, parallelism, imap_bounded, source_path
+
+RENDER_WORKERS = int(os.environ.get("RENDER_WORKERS", POOL_WORKERS))
+RENDER_CHUNK_PAGES = int(os.environ.get("RENDER_CHUNK_PAGES", 8))
+# Below this many pages the pool overhead outweighs the gain
+RENDER_PARALLEL_MIN_PAGES = int(os.environ.get("RENDER_PARALLEL_MIN_PAGES", 16))
+
+# fmt="auto" encodes a page as JPEG when images cover at least this share of it
+AUTO_JPEG_COVERAGE = float(os.environ.get("AUTO_JPEG_COVERAGE", 0.5))
+
+RenderedPage = namedtuple("RenderedPage", ["number", "data", "width", "height"])
+
+def open_pdf(source):
+    """Open a PDF from a path, bytes-like object or an already open document."""
+    if isinstance(source, fitz.Document):
+        return source
+    if isinstance(source, (bytes, bytearray, memoryview)):
+        return fitz.open(stream=source, filetype="pdf")
+    return fitz.open(source, filetype="pdf")
+
+
+def image_coverage(page):
+    """Share of the page area covered by placed images (overlaps counted twice)."""
+    area = abs(page.rect)
+    if not area:
+        return 0.0
+    covered = sum(abs(fitz.Rect(info["bbox"]) & page.rect) for info in page.get_image_info())
+    return min(1.0, covered / area)
+
+
+def _render_auto(page, dpi, quality):
+    # Photos and scans compress far better as JPEG, text and line art as PNG.
+    # Pages in between get both and keep JPEG only when it is clearly smaller.
+    coverage = image_coverage(page)
+    if coverage >= AUTO_JPEG_COVERAGE:
+        return _render_page(page, dpi, "jpeg", quality)
+    pix = page.get_pixmap(dpi=dpi)
+    data = pix.tobytes("png")
+    if coverage > 0:
+        jpeg = pix.tobytes("jpeg", jpg_quality=quality or 85)
+        if len(jpeg) * 3 < len(data) * 2:
+            data = jpeg
+    return RenderedPage(page.number, data, pix.width, pix.height)
+
+
+def _render_page(page, dpi, fmt, quality):
+    if fmt == "auto":
+        return _render_auto(page, dpi, quality)
+    pix = page.get_pixmap(dpi=dpi)
+    if fmt in ("jpg", "jpeg") and quality:
+        data = pix.tobytes("jpeg", jpg_quality=quality)
+    else:
+        data = pix.tobytes("jpeg" if fmt == "jpg" else fmt)
+    return RenderedPage(page.number, data, pix.width, pix.height)
+
+
+def _render_chunk(source, numbers, dpi, fmt, quality):
+    # Runs in a pool process: every worker opens its own document
+    doc = open_pdf(source)
+    try:
+        return [_render_page(doc[n], dpi, fmt, quality) for n in numbers]
+    finally:
+        doc.close()
+
+
+def render_pages(source, dpi=150, fmt="png", quality=None, workers=None, pages=None):
+    """
+    Render PDF pages to image bytes and yield RenderedPage tuples in page order.
+    fmt="auto" picks JPEG or PNG per page from its content.
+
+    Large documents are sharded into page chunks rendered on the shared
+    process pool; at most a few chunks per worker are in flight, so memory
+    stays bounded even when the caller consumes pages slowly. Output is identical to
+    rendering the pages one after another.
+    """
+    workers = parallelism(workers, RENDER_WORKERS)
+    doc = open_pdf(source)
+    numbers = list(range(doc.page_count)) if pages is None else list(pages)
+
+    if workers <= 1 or len(numbers) < RENDER_PARALLEL_MIN_PAGES:
+        try:
+            for n in numbers:
+                yield _render_page(doc[n], dpi, fmt, quality)
+                add_pages(1)
+        finally:
+            if doc is not source:
+                doc.close()
+        return
+
+    payload = source.tobytes() if isinstance(source, fitz.Document) else source
+    if doc is not source:
+        doc.close()
+
+    chunk_size = max(RENDER_CHUNK_PAGES, math.ceil(len(numbers) / (workers * 4)))
+    chunks = [numbers[i:i + chunk_size] for i in range(0, len(numbers), chunk_size)]
+
+    with source_path(payload) as path:
+        calls = [(path, chunk, dpi, fmt, quality) for chunk in chunks]
+        for rendered in imap_bounded(_render_chunk, calls, workers):
+            add_pages(len(rendered))
+            yield from rendered
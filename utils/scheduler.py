@@ -0,0 +1,149 @@
+import os
+import time
+import threading
+from collections import deque
+from contextlib import contextmanager
+
+# Concurrent runs allowed per ML operation; /image-to-text and /ocr share "ocr".
+# Slots and queues are per process: under gunicorn every worker has its own,
+# so the server runs up to slots x WEB_CONCURRENCY of each (gunicorn.conf.py
+# splits ML_THREAD_BUDGET between workers so the cores still add up).
+ML_SLOTS = {
+    "ocr": int(os.environ.get("OCR_SLOTS", 1)),
+    "remove-bg": int(os.environ.get("REMOVE_BG_SLOTS", 1)),
+}
+ML_QUEUE_LIMIT = int(os.environ.get("ML_QUEUE_LIMIT", 8))
+ML_MAX_WAIT = float(os.environ.get("ML_MAX_WAIT", 30))
+# Cores shared by all ML slots; each slot gets an equal, fixed share
+ML_THREAD_BUDGET = int(os.environ.get("ML_THREAD_BUDGET", os.cpu_count() or 1))
+
+
+class SchedulerBusy(Exception):
+    def __init__(self, message, retry_after):
+        super().__init__(message)
+        self.retry_after = retry_after
+
+
+def threads_per_slot():
+    """Intra-op threads one model run may use so that all slots together fit the budget."""
+    return max(1, ML_THREAD_BUDGET // max(1, sum(ML_SLOTS.values())))
+
+
+class Ticket:
+    """A granted slot. release() is idempotent, so it can be tied to several cleanup paths."""
+
+    def __init__(self, queue):
+        self._queue = queue
+        self._started = time.monotonic()
+        self._released = False
+
+    def release(self):
+        if self._released:
+            return
+        self._released = True
+        self._queue._release(time.monotonic() - self._started)
+
+
+class OperationQueue:
+    """
+    Admission control for one operation: at most `slots` run at once, up to
+    `max_queue` more wait in FIFO order for at most `max_wait` seconds, and
+    everything beyond that is turned away immediately.
+    """
+
+    def __init__(self, name, slots, max_queue=ML_QUEUE_LIMIT, max_wait=ML_MAX_WAIT):
+        self.name = name
+        self.slots = slots
+        self.max_queue = max_queue
+        self.max_wait = max_wait
+        self._cond = threading.Condition()
+        self._waiters = deque()
+        self._running = 0
+        self._service_time = None  # moving average of a run, for Retry-After
+        self._counters = {"admitted": 0, "rejected": 0, "timed_out": 0}
+        self._wait_total = 0.0
+        self._wait_max = 0.0
+
+    def acquire(self):
+        start = time.monotonic()
+        with self._cond:
+            if self._running < self.slots and not self._waiters:
+                return self._admit(start)
+            if len(self._waiters) >= self.max_queue:
+                self._counters["rejected"] += 1
+                raise SchedulerBusy(f"{self.name} is busy, try again later", self._retry_after())
+
+            token = object()
+            self._waiters.append(token)
+            deadline = start + self.max_wait
+            while not (self._waiters[0] is token and self._running < self.slots):
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    self._waiters.remove(token)
+                    self._counters["timed_out"] += 1
+                    self._cond.notify_all()
+                    raise SchedulerBusy(f"{self.name} queue wait exceeded {self.max_wait:g}s", self._retry_after())
+                self._cond.wait(remaining)
+
+            self._waiters.popleft()
+            # The next waiter may also fit if more than one slot is free
+            self._cond.notify_all()
+            return self._admit(start)
+
+    def _admit(self, start):
+        wait = time.monotonic() - start
+        self._running += 1
+        self._counters["admitted"] += 1
+        self._wait_total += wait
+        self._wait_max = max(self._wait_max, wait)
+        return Ticket(self)
+
+    def _release(self, duration):
+        with self._cond:
+            self._running -= 1
+            if self._service_time is None:
+                self._service_time = duration
+            else:
+                self._service_time = 0.8 * self._service_time + 0.2 * duration
+            self._cond.notify_all()
+
+    def _retry_after(self):
+        per_run = self._service_time or 5
+        return max(1, int(per_run * (len(self._waiters) + 1) / self.slots + 0.5))
+
+    def stats(self):
+        with self._cond:
+            admitted = self._counters["admitted"]
+            return {
+                **self._counters,
+                "slots": self.slots,
+                "running": self._running,
+                "queued": len(self._waiters),
+                "max_queue": self.max_queue,
+                "wait_seconds_total": round(self._wait_total, 3),
+                "wait_seconds_avg": round(self._wait_total / admitted, 3) if admitted else 0.0,
+                "wait_seconds_max": round(self._wait_max, 3),
+            }
+
+
+class Scheduler:
+    def __init__(self, slots=ML_SLOTS):
+        self.queues = {name: OperationQueue(name, count) for name, count in slots.items()}
+
+    def acquire(self, operation):
+        """Wait for a slot and return its Ticket, or raise SchedulerBusy."""
+        return self.queues[operation].acquire()
+
+    @contextmanager
+    def slot(self, operation):
+        ticket = self.acquire(operation)
+        try:
+            yield
+        finally:
+            ticket.release()
+
+    def stats(self):
+        return {name: queue.stats() for name, queue in self.queues.items()}
+
+
+scheduler = Scheduler()
@@ -0,0 +1,254 @@
+import io
+import os
+import datetime
+from itertools import chain, islice
+
+import fitz
+from openpyxl import load_workbook
+from openpyxl.utils import get_column_letter
+
+from utils.metrics import add_pages
+
+# Rows read to size the columns of each sheet
+SHEET_SAMPLE_ROWS = int(os.environ.get("SHEET_SAMPLE_ROWS", 200))
+
+PAGE_SIZE = (595, 842)  # A4 portrait, turned to landscape for wide sheets
+MARGIN = 36
+FONT_SIZE = 8
+ROW_HEIGHT = 12
+TITLE_HEIGHT = 18
+CELL_PADDING = 3
+MIN_COL_WIDTH = 24
+MAX_COL_WIDTH = 220
+
+# Standard PDF fonts need no embedding; text is encoded as WinAnsi (cp1252)
+FONT_OBJECT = "<</Type/Font/Subtype/Type1/BaseFont/{}/Encoding/WinAnsiEncoding>>"
+
+
+def _cell_text(value):
+    if value is None:
+        return ""
+    if isinstance(value, float) and value.is_integer():
+        return str(int(value))
+    if isinstance(value, datetime.datetime) and value.time() == datetime.time(0):
+        return value.date().isoformat()
+    return str(value)
+
+
+# char -> advance at size 1 for Helvetica and Helvetica-Bold, filled on demand;
+# fitz.get_text_length walks the string in Python and is far too slow per cell
+_char_widths = ({}, {})
+
+
+def _text_width(text, bold=False):
+    widths = _char_widths[bold]
+    try:
+        return sum(map(widths.__getitem__, text)) * FONT_SIZE
+    except KeyError:
+        fontname = "hebo" if bold else "helv"
+        for char in set(text) - widths.keys():
+            widths[char] = fitz.get_text_length(char, fontname=fontname, fontsize=1)
+        return sum(map(widths.__getitem__, text)) * FONT_SIZE
+
+
+def _pdf_string(text):
+    data = text.encode("cp1252", errors="replace")
+    data = data.replace(b"\\", b"\\\\").replace(b"(", b"\\(").replace(b")", b"\\)")
+    return b"(" + data.replace(b"\r", b" ").replace(b"\n", b" ") + b")"
+
+
+def _fit(text, width, bold=False):
+    """Cut text so it fits width, ending in an ellipsis when shortened."""
+    # Helvetica is at most ~1 em per glyph, so short strings cannot overflow
+    if len(text) * FONT_SIZE <= width:
+        return text
+    if _text_width(text, bold) <= width:
+        return text
+    keep = len(text)
+    while keep > 0 and _text_width(text[:keep] + "…", bold) > width:
+        keep = keep * 3 // 4 if keep > 8 else keep - 1
+    return text[:keep] + "…" if keep > 0 else ""
+
+
+def _column_widths(sample):
+    columns = max((len(row) for row in sample), default=0)
+    widths = [MIN_COL_WIDTH] * columns
+    for index, row in enumerate(sample):
+        for col, value in enumerate(row):
+            text = _cell_text(value)
+            if text:
+                width = _text_width(text, bold=index == 0) + 2 * CELL_PADDING
+                widths[col] = min(MAX_COL_WIDTH, max(widths[col], width))
+    return widths
+
+
+def _column_bands(widths, usable_width):
+    """Split columns into (first, last) ranges that each fit usable_width."""
+    bands = []
+    start, used = 0, 0
+    for col, width in enumerate(widths):
+        if col > start and used + width > usable_width:
+            bands.append((start, col))
+            start, used = col, 0
+        used += width
+    if widths:
+        bands.append((start, len(widths)))
+    return bands
+
+
+class _PageWriter:
+    """Builds one page's content stream from raw PDF operators."""
+
+    def __init__(self, doc, size, fonts):
+        self.doc = doc
+        self.width, self.height = size
+        self.fonts = fonts
+        self.lines = []
+        self.text = []
+
+    def cell(self, x, y, width, text, bold=False, right=False):
+        text = _fit(text, width - 2 * CELL_PADDING, bold)
+        if not text:
+            return
+        if right:
+            x = x + width - CELL_PADDING - _text_width(text, bold)
+        else:
+            x = x + CELL_PADDING
+        font = b"/F2" if bold else b"/F1"
+        self.text.append(
+            b"%s %d Tf 1 0 0 1 %.2f %.2f Tm %s Tj" % (font, FONT_SIZE, x, self.height - y, _pdf_string(text))
+        )
+
+    def hline(self, x0, x1, y):
+        self.lines.append(b"%.2f %.2f m %.2f %.2f l" % (x0, self.height - y, x1, self.height - y))
+
+    def vline(self, x, y0, y1):
+        self.lines.append(b"%.2f %.2f m %.2f %.2f l" % (x, self.height - y0, x, self.height - y1))
+
+    def finish(self):
+        page = self.doc.new_page(width=self.width, height=self.height)
+        content = b"\n".join(
+            [b"q 0.5 w 0.6 G"] + self.lines + [b"S Q", b"BT 0 g"] + self.text + [b"ET"]
+        )
+        xref = self.doc.get_new_xref()
+        self.doc.update_object(xref, "<<>>")
+        self.doc.update_stream(xref, content)
+        self.doc.xref_set_key(page.xref, "Contents", f"{xref} 0 R")
+        self.doc.xref_set_key(page.xref, "Resources", f"<</Font<</F1 {self.fonts[0]} 0 R/F2 {self.fonts[1]} 0 R>>>>")
+        return page
+
+
+def _render_sheet(doc, fonts, title, rows):
+    """Lay out one sheet's rows page by page; returns the number of pages written."""
+    rows = iter(rows)
+    # Empty rows (often trailing formatted ones) are left out
+    sample = [row for row in islice(rows, SHEET_SAMPLE_ROWS) if any(v is not None for v in row)]
+    if not sample:
+        return 0
+
+    widths = _column_widths(sample)
+    width, height = PAGE_SIZE
+    if sum(widths) > width - 2 * MARGIN:
+        width, height = height, width
+    # Columns never shrink; those that do not fit go on further pages
+    bands = _column_bands(widths, width - 2 * MARGIN)
+
+    header = [_cell_text(v) for v in sample[0]]
+    numeric = [False] * len(widths)
+    for row in sample[1:]:
+        for col, value in enumerate(row):
+            if isinstance(value, (int, float)) and not isinstance(value, bool):
+                numeric[col] = True
+
+    body_top = MARGIN + TITLE_HEIGHT
+    rows_per_page = max(1, int((height - MARGIN - body_top) // ROW_HEIGHT) - 1)
+
+    def write_row(writer, y, values, first, last, offsets, bold=False):
+        for col, value in enumerate(values[first:last], start=first):
+            text = value if isinstance(value, str) else _cell_text(value)
+            right = not bold and numeric[col] and isinstance(value, (int, float))
+            writer.cell(offsets[col - first], y, widths[col], text, bold=bold, right=right)
+
+    def write_page(chunk, first, last):
+        offsets = [MARGIN]
+        for w in widths[first:last]:
+            offsets.append(offsets[-1] + w)
+        table_right = offsets[-1]
+
+        label = f"{title} ({pages + 1})"
+        if len(bands) > 1:
+            label += f", columns {get_column_letter(first + 1)}-{get_column_letter(last)}"
+        writer = _PageWriter(doc, (width, height), fonts)
+        writer.cell(MARGIN, MARGIN + FONT_SIZE + 2, width - 2 * MARGIN, label, bold=True)
+
+        # Header repeated on every page
+        y = body_top
+        write_row(writer, y + ROW_HEIGHT - CELL_PADDING, header, first, last, offsets, bold=True)
+        writer.hline(MARGIN, table_right, y)
+        for row in chunk:
+            y += ROW_HEIGHT
+            writer.hline(MARGIN, table_right, y)
+            write_row(writer, y + ROW_HEIGHT - CELL_PADDING, row, first, last, offsets)
+        y += ROW_HEIGHT
+        writer.hline(MARGIN, table_right, y)
+        for x in offsets:
+            writer.vline(x, body_top, y)
+        writer.finish()
+
+    pages = 0
+    body = (row for row in chain(sample[1:], rows) if any(v is not None for v in row))
+    while True:
+        chunk = list(islice(body, rows_per_page))
+        if not chunk and pages:
+            break
+        # Each block of rows is printed band by band, left to right
+        for first, last in bands:
+            write_page(chunk, first, last)
+            pages += 1
+        if len(chunk) < rows_per_page:
+            break
+    return pages
+
+
+def xlsx_to_pdf(input_path, output_path, progress=None):
+    """
+    Render every sheet of a workbook as paged tables. Rows are streamed
+    from a read-only workbook one page at a time and written as raw PDF
+    operators, so memory is bounded by a page of rows and time is linear
+    in the row count. The first row of a sheet is its header and is
+    repeated on every page; column widths are fitted to the first
+    SHEET_SAMPLE_ROWS rows, and columns that do not fit the page width
+    continue on following pages. progress(done, total) is called per sheet.
+    """
+    source = io.BytesIO(input_path) if isinstance(input_path, (bytes, bytearray)) else input_path
+    try:
+        workbook = load_workbook(source, read_only=True, data_only=True)
+    except Exception as e:
+        raise RuntimeError(f"Excel to PDF conversion error: {e}")
+
+    doc = fitz.open()
+    try:
+        fonts = []
+        for base_font in ("Helvetica", "Helvetica-Bold"):
+            xref = doc.get_new_xref()
+            doc.update_object(xref, FONT_OBJECT.format(base_font))
+            fonts.append(xref)
+
+        toc = []
+        sheets = workbook.worksheets
+        for done, sheet in enumerate(sheets, start=1):
+            first_page = doc.page_count + 1
+            pages = _render_sheet(doc, fonts, sheet.title, sheet.iter_rows(values_only=True))
+            if pages:
+                toc.append([1, sheet.title, first_page])
+                add_pages(pages)
+            if progress:
+                progress(done, len(sheets))
+
+        if doc.page_count == 0:
+            doc.new_page(width=PAGE_SIZE[0], height=PAGE_SIZE[1])
+        doc.set_toc(toc)
+        doc.save(output_path, garbage=1, deflate=True)
+    finally:
+        doc.close()
+        workbook.close()
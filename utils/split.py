@@ -1,25 +1,42 @@
-from PyPDF2 import PdfReader, PdfWriter
 from pathlib import Path
 
-def split_pdf_ranges(file, output_dir, ranges):
+from utils.pdfengine import get_engine
+
+def parse_ranges(text):
+    """Parse "1-3,5" into [(1, 3), (5, 5)]; raises ValueError on bad input."""
+    result = []
+    for part in text.split(","):
+        part = part.strip()
+        if "-" in part:
+            a, b = map(int, part.split("-"))
+            result.append((a, b))
+        else:
+            page = int(part)
+            result.append((page, page))
+    return result
+
+def iter_split_pdf_ranges(file, ranges, engine=None):
+    """
+    Split PDF into parts in memory and yield (filename, pdf_bytes) per range.
+    Ranges are checked against the page count before anything is produced.
+    """
+    return get_engine(engine).split(file, ranges)
+
+def split_pdf_ranges(file, output_dir, ranges, engine=None):
     """
     Split PDF into multiple files based on page ranges.
     ranges = [(1, 3), (5, 5)] will extract pages 1–3 and 5 into two separate files.
     Returns a list of split file paths.
     """
-    reader = PdfReader(file)
     output_dir = Path(output_dir)
     output_dir.mkdir(parents=True, exist_ok=True)
 
     output_files = []
 
-    for idx, (start, end) in enumerate(ranges, start=1):
-        writer = PdfWriter()
-        for i in range(start - 1, end):
-            writer.add_page(reader.pages[i])
-        output_path = output_dir / f"split_part_{idx}.pdf"
+    for name, data in iter_split_pdf_ranges(file, ranges, engine):
+        output_path = output_dir / name
         with open(output_path, 'wb') as f_out:
-            writer.write(f_out)
+            f_out.write(data)
         output_files.append(str(output_path))
 
     return output_files
@@ -0,0 +1,205 @@
+import os
+import time
+import uuid
+import heapq
+import shutil
+import threading
+
+TEMP_DIR = os.environ.get("TEMP_DIR", "temp")
+TEMP_TTL = int(os.environ.get("TEMP_TTL", 300))
+# Per process: every gunicorn worker tracks and caps only the files it created
+TEMP_QUOTA_MB = int(os.environ.get("TEMP_QUOTA_MB", 4096))
+TEMP_SWEEP_INTERVAL = int(os.environ.get("TEMP_SWEEP_INTERVAL", 30))
+
+
+def _size_of(path):
+    if os.path.isdir(path):
+        total = 0
+        for root, _, files in os.walk(path):
+            for name in files:
+                try:
+                    total += os.path.getsize(os.path.join(root, name))
+                except OSError:
+                    pass
+        return total
+    try:
+        return os.path.getsize(path)
+    except OSError:
+        return 0
+
+
+def _remove(path):
+    if os.path.isdir(path):
+        shutil.rmtree(path, ignore_errors=True)
+    else:
+        try:
+            os.remove(path)
+        except OSError:
+            pass
+
+
+class TempStorage:
+    """
+    Tracks every file and directory handed out under TEMP_DIR.
+
+    Expiry deadlines live in a heap, so a sweep only touches entries that
+    have actually expired. A byte quota is enforced by removing the
+    oldest unpinned entries first. Tracking is per process: each gunicorn
+    worker sweeps and caps its own entries, so the disk used by TEMP_DIR
+    can reach TEMP_QUOTA_MB times the number of workers (gunicorn.conf.py
+    divides the default between them). The sweeper thread is started
+    lazily in each process, so it also runs inside every gunicorn worker.
+    """
+
+    def __init__(self, root=TEMP_DIR, ttl=TEMP_TTL, quota_bytes=TEMP_QUOTA_MB * 1024 * 1024):
+        # Absolute, because Flask's send_file resolves relative paths against the app root
+        self.root = os.path.abspath(root)
+        self.ttl = ttl
+        self.quota_bytes = quota_bytes
+        self._lock = threading.Lock()
+        self._entries = {}  # path -> {"deadline", "size", "pinned", "created"}
+        self._heap = []     # (deadline, path)
+        self._total = 0
+        self._sweeper_pid = None
+        os.makedirs(self.root, exist_ok=True)
+        self._adopt_existing()
+
+    # -------------------- ALLOCATION --------------------
+
+    def allocate(self, name="", ttl=None, pinned=False):
+        """
+        Return a fresh path under the temp root that expires after ttl
+        seconds. Pinned paths are never evicted to meet the quota.
+        """
+        path = os.path.join(self.root, f"{uuid.uuid4().hex}_{name}")
+        self._register(path, ttl, pinned=pinned)
+        return path
+
+    def mkdtemp(self, prefix="", ttl=None, pinned=False):
+        """Create and register a fresh directory under the temp root."""
+        path = os.path.join(self.root, f"{prefix}{uuid.uuid4().hex}")
+        os.makedirs(path)
+        self._register(path, ttl, pinned=pinned)
+        return path
+
+    def scratch_dir(self):
+        """
+        Per-request working directory. It is pinned until release() is
+        called, but still carries a deadline as a safety net.
+        """
+        return self.mkdtemp(prefix="req_", ttl=max(self.ttl, 3600), pinned=True)
+
+    def account(self, path):
+        """Record the current on-disk size of a tracked path and enforce the quota."""
+        tracked = self._tracked_root(path)
+        if tracked is None:
+            return
+        size = _size_of(tracked)
+        with self._lock:
+            entry = self._entries.get(tracked)
+            if entry is None:
+                return
+            self._total += size - entry["size"]
+            entry["size"] = size
+            self._enforce_quota()
+
+    def release(self, path):
+        """Delete a tracked path right away (e.g. once a response has been sent)."""
+        with self._lock:
+            entry = self._entries.pop(path, None)
+            if entry:
+                self._total -= entry["size"]
+        _remove(path)
+
+    def stats(self):
+        with self._lock:
+            return {
+                "entries": len(self._entries),
+                "bytes": self._total,
+                "quota_bytes": self.quota_bytes,
+            }
+
+    # -------------------- EXPIRY --------------------
+
+    def expire(self, now=None):
+        """Remove every entry whose deadline has passed. Costs O(expired)."""
+        now = now or time.time()
+        expired = []
+        with self._lock:
+            while self._heap and self._heap[0][0] <= now:
+                deadline, path = heapq.heappop(self._heap)
+                entry = self._entries.get(path)
+                # Stale heap items are skipped; the entry was released or re-registered
+                if not entry or entry["deadline"] != deadline:
+                    continue
+                del self._entries[path]
+                self._total -= entry["size"]
+                expired.append(path)
+        for path in expired:
+            _remove(path)
+            print(f"[Cleanup] Deleted expired temp entry: {path}")
+        return len(expired)
+
+    def _register(self, path, ttl, pinned=False):
+        now = time.time()
+        deadline = now + (self.ttl if ttl is None else ttl)
+        with self._lock:
+            self._entries[path] = {"deadline": deadline, "size": 0, "pinned": pinned, "created": now}
+            heapq.heappush(self._heap, (deadline, path))
+        self._ensure_sweeper()
+
+    def _enforce_quota(self):
+        if self._total <= self.quota_bytes:
+            return
+        victims = sorted(
+            (e["created"], path) for path, e in self._entries.items() if not e["pinned"]
+        )
+        for _, path in victims:
+            if self._total <= self.quota_bytes:
+                break
+            entry = self._entries.pop(path)
+            self._total -= entry["size"]
+            _remove(path)
+            print(f"[Cleanup] Evicted temp entry over quota: {path}")
+
+    def _tracked_root(self, path):
+        path = os.path.normpath(path)
+        root = os.path.normpath(self.root)
+        if not path.startswith(root + os.sep):
+            return None
+        top = os.path.join(self.root, os.path.relpath(path, root).split(os.sep)[0])
+        return top if top in self._entries else None
+
+    def _adopt_existing(self):
+        # Leftovers from a previous run expire ttl seconds after they were last touched
+        now = time.time()
+        for entry in os.scandir(self.root):
+            try:
+                mtime = entry.stat().st_mtime
+            except OSError:
+                continue
+            size = _size_of(entry.path)
+            deadline = min(mtime + self.ttl, now + self.ttl)
+            self._entries[entry.path] = {"deadline": deadline, "size": size, "pinned": False, "created": mtime}
+            self._heap.append((deadline, entry.path))
+            self._total += size
+        heapq.heapify(self._heap)
+
+    def _ensure_sweeper(self):
+        # Threads do not survive fork, so each worker process starts its own
+        if self._sweeper_pid == os.getpid():
+            return
+        self._sweeper_pid = os.getpid()
+
+        def sweep():
+            while True:
+                time.sleep(TEMP_SWEEP_INTERVAL)
+                try:
+                    self.expire()
+                except Exception as e:
+                    print(f"[Cleanup Error] {e}")
+
+        threading.Thread(target=sweep, name="temp-sweeper", daemon=True).start()
+
+
+storage = TempStorage()
@@ -0,0 +1,176 @@
+import io
+import os
+import math
+
+from openpyxl import Workbook
+from openpyxl.cell.cell import ILLEGAL_CHARACTERS_RE
+
+from utils.render import open_pdf
+from utils.metrics import add_pages
+from utils.pool import POOL_WORKERS, parallelism, imap_bounded, source_path
+
+TABLE_WORKERS = int(os.environ.get("TABLE_WORKERS", POOL_WORKERS))
+TABLE_CHUNK_PAGES = int(os.environ.get("TABLE_CHUNK_PAGES", 16))
+TABLE_PARALLEL_MIN_PAGES = int(os.environ.get("TABLE_PARALLEL_MIN_PAGES", 24))
+
+# combined: every table on one sheet (the original output), page: a sheet
+# per page with tables, table: a sheet per table
+TABLE_LAYOUTS = ("combined", "page", "table")
+
+# Excel's hard limit; a combined sheet continues on a new sheet after it
+MAX_SHEET_ROWS = 1048576
+
+# -------------------- EXTRACTION --------------------
+
+def _fitz_tables(page):
+    # find_tables looks for ruled tables; without any vector graphics there
+    # is nothing to find, and this check is far cheaper than the search
+    if not page.get_cdrawings():
+        return []
+    return [table.extract() for table in page.find_tables().tables]
+
+
+def _plumber_tables(pdf, number):
+    return pdf.pages[number].extract_tables()
+
+
+def _extract_chunk(source, numbers, engine):
+    """Runs in a pool process (or inline for small documents); returns [(page_number, tables)]."""
+    if engine == "pdfplumber":
+        import pdfplumber
+        with pdfplumber.open(io.BytesIO(source) if isinstance(source, bytes) else source) as pdf:
+            return [(n, _plumber_tables(pdf, n)) for n in numbers]
+
+    doc = open_pdf(source)
+    results = []
+    try:
+        for n in numbers:
+            try:
+                tables = _fitz_tables(doc[n])
+            except Exception:
+                # Fall back for pages the fast path cannot parse
+                import pdfplumber
+                with pdfplumber.open(io.BytesIO(source) if isinstance(source, bytes) else source) as pdf:
+                    tables = _plumber_tables(pdf, n)
+            results.append((n, tables))
+    finally:
+        doc.close()
+    return results
+
+
+def iter_tables(source, engine="pymupdf", workers=None):
+    """
+    Yield (page_number, tables) for every page in order, where tables is a
+    list of row lists. Large documents are split into page chunks that run
+    on the shared process pool, with a bounded number of chunks in flight.
+    """
+    workers = parallelism(workers, TABLE_WORKERS)
+    doc = open_pdf(source)
+    page_count = doc.page_count
+    doc.close()
+    if isinstance(source, (bytearray, memoryview)):
+        source = bytes(source)
+
+    numbers = list(range(page_count))
+    if workers <= 1 or page_count < TABLE_PARALLEL_MIN_PAGES:
+        for result in _extract_chunk(source, numbers, engine):
+            add_pages(1)
+            yield result
+        return
+
+    chunk_size = max(TABLE_CHUNK_PAGES, math.ceil(page_count / (workers * 4)))
+    chunks = [numbers[i:i + chunk_size] for i in range(0, page_count, chunk_size)]
+
+    with source_path(source) as path:
+        for results in imap_bounded(_extract_chunk, [(path, chunk, engine) for chunk in chunks], workers):
+            add_pages(len(results))
+            yield from results
+
+
+# -------------------- XLSX --------------------
+
+def _clean_row(row):
+    return [ILLEGAL_CHARACTERS_RE.sub("", cell) if isinstance(cell, str) else cell for cell in row]
+
+
+class _SheetWriter:
+    """Appends rows to write-only sheets, starting a new sheet when one is full."""
+
+    def __init__(self, workbook):
+        self.workbook = workbook
+        self.sheet = None
+        self.rows = 0
+        self.title = None
+        self.part = 0
+
+    def start(self, title):
+        self.title = title
+        self.part = 1
+        self._new_sheet(title)
+
+    def _new_sheet(self, title):
+        self.sheet = self.workbook.create_sheet(title=title[:31])
+        self.rows = 0
+
+    def append(self, row):
+        if self.rows >= MAX_SHEET_ROWS:
+            self.part += 1
+            self._new_sheet(f"{self.title} ({self.part})")
+        self.sheet.append(_clean_row(row))
+        self.rows += 1
+
+
+def pdf_to_xlsx(input_path, output_path, layout="combined", progress=None):
+    """
+    Extract every table in a PDF into an XLSX workbook, writing rows as they
+    arrive so memory does not grow with the document. PyMuPDF's find_tables
+    is used first; when it finds no table anywhere, pdfplumber gets a pass.
+    progress(done, total) is called as pages complete.
+    """
+    if layout not in TABLE_LAYOUTS:
+        raise ValueError(f"Invalid layout: {layout}")
+
+    doc = open_pdf(input_path)
+    total = doc.page_count
+    doc.close()
+
+    workbook = Workbook(write_only=True)
+    writer = _SheetWriter(workbook)
+    found = 0
+    header = None
+
+    for engine in ("pymupdf", "pdfplumber"):
+        for done, (number, tables) in enumerate(iter_tables(input_path, engine=engine), start=1):
+            tables = [t for t in tables if t]
+            if progress:
+                progress(done, total)
+            if not tables:
+                continue
+
+            if layout == "page":
+                writer.start(f"Page {number + 1}")
+            for index, table in enumerate(tables, start=1):
+                found += 1
+                if layout == "table":
+                    writer.start(f"Page {number + 1} Table {index}")
+                elif layout == "combined":
+                    if writer.sheet is not None and table[0] == header:
+                        # Same columns as the table before (e.g. a table continued
+                        # on the next page): keep appending under one header
+                        table = table[1:]
+                    else:
+                        if writer.sheet is None:
+                            writer.start("Tables")
+                        else:
+                            writer.append([])
+                        header = table[0]
+                elif writer.rows:
+                    writer.append([])  # blank row between tables on a shared sheet
+                for row in table:
+                    writer.append(row)
+        if found:
+            break
+
+    if not found:
+        raise ValueError("No tables found in PDF.")
+    workbook.save(output_path)
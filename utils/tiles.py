@@ -0,0 +1,125 @@
+import os
+import math
+import zlib
+import struct
+import threading
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+from PIL import Image
+
+TILE_WORKERS = int(os.environ.get("TILE_WORKERS", os.cpu_count() or 1))
+# Target size of one output band; bands are full width
+TILE_BAND_MB = int(os.environ.get("TILE_BAND_MB", 4))
+TILE_PNG_LEVEL = int(os.environ.get("TILE_PNG_LEVEL", 3))
+
+# Source rows read beyond a band on each side; LANCZOS reaches 3 source
+# pixels when enlarging, plus one for rounding of the box edges
+SUPPORT_MARGIN = 4
+
+PNG_COLOR_TYPES = {"L": 0, "RGB": 2, "LA": 4, "RGBA": 6}
+
+_executor = None
+_executor_lock = threading.Lock()
+
+
+def _get_executor():
+    # Requests run on several threads; only one of them may create the pool
+    global _executor
+    with _executor_lock:
+        if _executor is None:
+            _executor = ThreadPoolExecutor(max_workers=TILE_WORKERS, thread_name_prefix="tiles")
+        return _executor
+
+
+def band_rows(width, height, channels):
+    return min(height, max(8, (TILE_BAND_MB * 1024 * 1024) // max(1, width * channels)))
+
+
+def band_memory(size, channels, workers=None):
+    """Bytes held by the bands in flight: resized, filtered and compressed rows."""
+    workers = workers or TILE_WORKERS
+    return band_rows(size[0], size[1], channels) * size[0] * channels * 3 * workers * 2
+
+
+def _chunk(kind, data):
+    return struct.pack(">I", len(data)) + kind + data + struct.pack(">I", zlib.crc32(kind + data))
+
+
+def _render_band(img, size, y0, y1, last):
+    """
+    Resize output rows y0..y1 from a strip of the source. resize(box=...)
+    places the filter exactly as a whole-image resize would, so bands join
+    without seams. Returns (filtered rows, raw deflate data).
+    """
+    scale_y = img.height / size[1]
+    top = max(0, math.floor(y0 * scale_y) - SUPPORT_MARGIN)
+    bottom = min(img.height, math.ceil(y1 * scale_y) + SUPPORT_MARGIN)
+    strip = img.crop((0, top, img.width, bottom))
+    band = strip.resize(
+        (size[0], y1 - y0), Image.LANCZOS,
+        box=(0, y0 * scale_y - top, img.width, y1 * scale_y - top)
+    )
+
+    # PNG "Sub" filter: every byte minus the same channel of the pixel to its left
+    pixels = np.asarray(band, dtype=np.uint8).reshape(y1 - y0, -1)
+    channels = len(band.getbands())
+    rows = np.empty((pixels.shape[0], pixels.shape[1] + 1), dtype=np.uint8)
+    rows[:, 0] = 1
+    rows[:, 1:channels + 1] = pixels[:, :channels]
+    np.subtract(pixels[:, channels:], pixels[:, :-channels], out=rows[:, channels + 1:])
+    raw = rows.tobytes()
+
+    # Each band is its own deflate segment, ending on a byte boundary, so the
+    # segments can be compressed in parallel and simply concatenated
+    compressor = zlib.compressobj(TILE_PNG_LEVEL, zlib.DEFLATED, -15)
+    data = compressor.compress(raw) + compressor.flush(zlib.Z_FINISH if last else zlib.Z_FULL_FLUSH)
+    return raw, data
+
+
+def resize_to_png(img, size, output_path, workers=None):
+    """
+    Resize img to size and write it as PNG band by band, so the full output
+    is never held in memory. Bands are resized and compressed on a thread
+    pool (Pillow and zlib release the GIL) and written in order.
+    """
+    if img.mode not in PNG_COLOR_TYPES:
+        img = img.convert("RGBA" if "A" in img.getbands() or "transparency" in img.info else "RGB")
+    img.load()
+    executor = _get_executor()
+    workers = min(workers or TILE_WORKERS, TILE_WORKERS)
+
+    width, height = size
+    channels = len(img.getbands())
+    rows = band_rows(width, height, channels)
+    bands = [(y, min(height, y + rows)) for y in range(0, height, rows)]
+
+    with open(output_path, "wb") as f:
+        f.write(b"\x89PNG\r\n\x1a\n")
+        f.write(_chunk(b"IHDR", struct.pack(">IIBBBBB", width, height, 8, PNG_COLOR_TYPES[img.mode], 0, 0, 0)))
+
+        adler = zlib.adler32(b"")
+        f.write(_chunk(b"IDAT", b"\x78\x5e"))  # zlib header for the segments below
+
+        pending = deque()
+
+        def write_next():
+            nonlocal adler
+            raw, data = pending.popleft().result()
+            adler = zlib.adler32(raw, adler)
+            f.write(_chunk(b"IDAT", data))
+
+        try:
+            for index, (y0, y1) in enumerate(bands):
+                pending.append(executor.submit(_render_band, img, size, y0, y1, index == len(bands) - 1))
+                if len(pending) >= workers * 2:
+                    write_next()
+            while pending:
+                write_next()
+        finally:
+            for future in pending:
+                future.cancel()
+
+        f.write(_chunk(b"IDAT", struct.pack(">I", adler)))
+        f.write(_chunk(b"IEND", b""))
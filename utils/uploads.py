@@ -0,0 +1,171 @@
+import io
+import os
+import uuid
+import hashlib
+
+import fitz
+
+from utils.storage import storage
+
+UPLOAD_MEMORY_MB = float(os.environ.get("UPLOAD_MEMORY_MB", 4))
+MAX_UPLOAD_MB = int(os.environ.get("MAX_UPLOAD_MB", 200))
+MAX_PDF_PAGES = int(os.environ.get("MAX_PDF_PAGES", 1000))
+
+MB = 1024 * 1024
+
+
+class UploadTooLarge(Exception):
+    pass
+
+
+class SpooledUpload:
+    """
+    Write target for one uploaded file. Data stays in memory up to
+    UPLOAD_MEMORY_MB and then moves to a named file under the temp root.
+    The sha256 digest and size are computed while the upload streams in.
+    """
+
+    def __init__(self, max_memory=int(UPLOAD_MEMORY_MB * MB), directory=None):
+        self.max_memory = max_memory
+        self.directory = directory or storage.root
+        self.path = None
+        self.size = 0
+        self._file = io.BytesIO()
+        self._hash = hashlib.sha256()
+
+    @property
+    def sha256(self):
+        return self._hash.hexdigest()
+
+    @property
+    def in_memory(self):
+        return self.path is None
+
+    def write(self, data):
+        self._hash.update(data)
+        self.size += len(data)
+        written = self._file.write(data)
+        if self.path is None and self.size > self.max_memory:
+            self._rollover()
+        return written
+
+    def _rollover(self):
+        path = os.path.join(self.directory, f"upload_{uuid.uuid4().hex}")
+        spilled = open(path, "w+b")
+        spilled.write(self._file.getbuffer())
+        self._file.close()
+        self._file = spilled
+        self.path = path
+
+    def getvalue(self):
+        """The upload as bytes; free when it never left memory."""
+        if self.path is None:
+            return self._file.getvalue()
+        with open(self.path, "rb") as f:
+            return f.read()
+
+    def close(self):
+        self._file.close()
+        if self.path:
+            try:
+                os.remove(self.path)
+            except OSError:
+                pass
+
+    def __getattr__(self, name):
+        # read/seek/tell/readline/... go to the current backing file
+        return getattr(self._file, name)
+
+    def __iter__(self):
+        return iter(self._file)
+
+
+def _spooled(file):
+    stream = getattr(file, "stream", file)
+    return stream if isinstance(stream, SpooledUpload) else None
+
+
+def upload_digest(file):
+    """sha256 computed during upload, or None if the stream was not spooled by us."""
+    spooled = _spooled(file)
+    return spooled.sha256 if spooled else None
+
+
+def upload_size(file):
+    spooled = _spooled(file)
+    if spooled:
+        return spooled.size
+    stream = file.stream
+    pos = stream.tell()
+    stream.seek(0, os.SEEK_END)
+    size = stream.tell()
+    stream.seek(pos)
+    return size
+
+
+def upload_source(file):
+    """
+    Hand an upload to a converter without another copy: the path of the
+    spooled file when it went to disk, otherwise its bytes. Both are
+    accepted by fitz (see render.open_pdf) and Pillow (see imgTools.open_image).
+    """
+    spooled = _spooled(file)
+    if spooled and not spooled.in_memory:
+        spooled.flush()
+        return spooled.path
+    if spooled:
+        return spooled.getvalue()
+    file.stream.seek(0)
+    return file.stream.read()
+
+
+def persist_upload(file, dest):
+    """
+    Put an upload at dest. A spooled file that already went to disk is
+    hard-linked into place instead of being copied.
+    """
+    spooled = _spooled(file)
+    if spooled and not spooled.in_memory:
+        spooled.flush()
+        try:
+            os.link(spooled.path, dest)
+            return dest
+        except OSError:
+            pass
+    file.stream.seek(0)
+    file.save(dest)
+    return dest
+
+
+def is_pdf_upload(file):
+    stream = file.stream
+    stream.seek(0)
+    head = stream.read(1024)
+    stream.seek(0)
+    return b"%PDF" in head
+
+
+def pdf_page_count(file):
+    """Page count of a PDF upload, or None when it is not a readable PDF."""
+    if not is_pdf_upload(file):
+        return None
+
+    source = upload_source(file)
+    try:
+        doc = fitz.open(source, filetype="pdf") if isinstance(source, str) else fitz.open(stream=source, filetype="pdf")
+    except Exception:
+        return None
+    try:
+        return doc.page_count
+    finally:
+        doc.close()
+
+
+def check_upload(file, max_mb=MAX_UPLOAD_MB, max_pages=MAX_PDF_PAGES):
+    """Raise UploadTooLarge when an upload is over the size or page limit."""
+    if max_mb and upload_size(file) > max_mb * MB:
+        raise UploadTooLarge(f"{file.filename} is larger than {max_mb} MB")
+    if max_pages:
+        pages = pdf_page_count(file)
+        if pages is not None and pages > max_pages:
+            raise UploadTooLarge(f"{file.filename} has {pages} pages, the limit is {max_pages}")
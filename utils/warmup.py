@@ -0,0 +1,106 @@
+import os
+import time
+
+from utils.models import registry
+
+# Models loaded before the server takes requests: "ocr:<lang>" (see
+# OCR_LANGUAGES) and "remove-bg". Empty disables preloading.
+PRELOAD_MODELS = [m.strip() for m in os.environ.get("PRELOAD_MODELS", "ocr:en").split(",") if m.strip()]
+
+
+def memory_usage():
+    """RSS of this process split into pages shared with other processes and private ones, in MB."""
+    usage = {}
+    try:
+        with open("/proc/self/smaps_rollup") as f:
+            for line in f:
+                name, _, value = line.partition(":")
+                if value.strip().endswith("kB"):
+                    usage[name] = int(value.split()[0]) / 1024
+    except (OSError, ValueError):
+        return {}
+    return {
+        "rss_mb": round(usage.get("Rss", 0), 1),
+        "pss_mb": round(usage.get("Pss", 0), 1),
+        "shared_mb": round(usage.get("Shared_Clean", 0) + usage.get("Shared_Dirty", 0), 1),
+        "private_mb": round(usage.get("Private_Clean", 0) + usage.get("Private_Dirty", 0), 1),
+    }
+
+
+def warm_runtime():
+    """Touch the PDF and image code paths once so their lazy setup happens now."""
+    import io
+    import fitz
+    from PIL import Image
+
+    doc = fitz.open()
+    page = doc.new_page()
+    page.insert_text((72, 72), "warmup")
+    page.get_pixmap(dpi=72).tobytes("png")
+    page.get_text()
+    doc.tobytes(garbage=3, deflate=True)
+    doc.close()
+
+    img = Image.new("RGB", (64, 64))
+    img.resize((128, 128), Image.LANCZOS).save(io.BytesIO(), "JPEG")
+
+
+def _load(name):
+    if name.startswith("ocr:"):
+        from utils.imgTools import get_reader
+        get_reader(name[4:])
+        return f"easyocr:{name[4:]}"
+    if name == "remove-bg":
+        from utils.remover import get_session, REMBG_MODEL
+        get_session()
+        return f"rembg:{REMBG_MODEL}"
+    raise ValueError(f"Unknown model in PRELOAD_MODELS: {name}")
+
+
+def preload_models(names, pin=True):
+    """Load the named models into the registry; returns the registry keys loaded."""
+    loaded = []
+    for name in names:
+        started = time.perf_counter()
+        try:
+            key = _load(name)
+        except Exception as e:
+            # The server still works without it; the model loads on first use
+            print(f"[Warmup] Could not preload {name}: {e}")
+            continue
+        if pin:
+            registry.pin(key)
+        loaded.append(key)
+        print(f"[Warmup] {key} ready in {time.perf_counter() - started:.1f}s")
+    return loaded
+
+
+def fork_safe(name):
+    # onnxruntime starts its thread pools when a session is created and those
+    # threads do not survive fork, so rembg sessions are made in each worker
+    return name != "remove-bg"
+
+
+def warm_up(names=None):
+    """
+    Warm the runtime and load models in this process. Returns a report with
+    the time taken, the models loaded and the memory used afterwards.
+    """
+    started = time.perf_counter()
+    warm_runtime()
+    models = preload_models(PRELOAD_MODELS if names is None else names)
+    return {
+        "seconds": round(time.perf_counter() - started, 2),
+        "models": models,
+        "memory": memory_usage(),
+    }
+
+
+def after_fork():
+    """Per-worker setup for state that does not carry over a fork."""
+    import sys
+    if "torch" in sys.modules:
+        # torch's intra-op thread count is per process
+        from utils.imgTools import OCR_TORCH_THREADS
+        from utils.scheduler import threads_per_slot
+        sys.modules["torch"].set_num_threads(OCR_TORCH_THREADS or threads_per_slot())
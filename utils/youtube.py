@@ -1,21 +1,171 @@
 import os
-import yt_dlp
+import json
+import fcntl
+import shutil
+import threading
 
-def download_youtube_mp3(url, output_dir):
-    os.makedirs(output_dir, exist_ok=True)
+from utils.cache import result_cache, make_key
+from utils.storage import storage
 
-    ydl_opts = {
-        "format": "bestaudio/best",
-        "outtmpl": os.path.join(output_dir, "%(title)s.%(ext)s"),
-        "quiet": True
-    }
+AUDIO_BITRATE = os.environ.get("AUDIO_BITRATE", "192")
 
-    with yt_dlp.YoutubeDL(ydl_opts) as ydl:
-        info = ydl.extract_info(url, download=True)
-        original_path = ydl.prepare_filename(info)
 
-        base, _ = os.path.splitext(original_path)
-        mp3_path = base + ".mp3"
-        os.rename(original_path, mp3_path)
+class YtDlpExtractor:
+    """Downloads with yt-dlp and transcodes to MP3 with its FFmpeg post-processor."""
 
-        return mp3_path, info.get("title", "audio")
+    def video_id(self, url):
+        """Cache id for url without touching the network, or None when it cannot be told offline."""
+        from yt_dlp.extractor.youtube import YoutubeIE
+        if YoutubeIE.suitable(url):
+            video_id = YoutubeIE.get_temp_id(url)
+            if video_id:
+                return f"{YoutubeIE.ie_key()}-{video_id}"
+        return None
+
+    def download(self, url, output_dir, known=None):
+        """
+        Download url as MP3 into output_dir and return (cache id, mp3 path, title).
+        known(cache_id) is checked after the metadata lookup; when it returns
+        True nothing is downloaded and the path is None.
+        """
+        import yt_dlp
+
+        ydl_opts = {
+            "format": "bestaudio/best",
+            "outtmpl": os.path.join(output_dir, "%(id)s.%(ext)s"),
+            "quiet": True,
+            "noplaylist": True,
+            "postprocessors": [{
+                "key": "FFmpegExtractAudio",
+                "preferredcodec": "mp3",
+                "preferredquality": AUDIO_BITRATE,
+            }],
+        }
+        with yt_dlp.YoutubeDL(ydl_opts) as ydl:
+            info = ydl.extract_info(url, download=False)
+            cache_id = f"{info.get('extractor_key', 'video')}-{info['id']}"
+            title = info.get("title", "audio")
+            if known and known(cache_id):
+                return cache_id, None, title
+            info = ydl.process_ie_result(info, download=True)
+            base, _ = os.path.splitext(ydl.prepare_filename(info))
+            return cache_id, base + ".mp3", title
+
+
+class AudioCache:
+    """
+    MP3s keyed by extractor video id, stored in the size-capped LRU result
+    cache next to a small JSON entry with the title. Concurrent requests
+    for the same id share one download and one transcode: threads in a
+    process wait on the same flight, and gunicorn workers serialize on a
+    lock file and then find the cached result.
+    """
+
+    def __init__(self, extractor=None, cache=result_cache):
+        self.extractor = extractor or YtDlpExtractor()
+        self.cache = cache
+        self._lock_dir = os.path.join(cache.directory, ".locks")
+        os.makedirs(self._lock_dir, exist_ok=True)
+        self._lock = threading.Lock()
+        self._flights = {}  # cache id -> _Flight
+
+    @staticmethod
+    def key(cache_id):
+        # Ids are case sensitive, so they go in as digests rather than (lower-cased) params
+        return make_key("youtube-mp3", [cache_id])
+
+    def lookup(self, cache_id):
+        """Return (mp3 path, title, key) when cached, else None."""
+        key = self.key(cache_id)
+        path = self.cache.get(key)
+        meta = self.cache.get(make_key("youtube-mp3-meta", [cache_id]))
+        if not path or not meta:
+            return None
+        with open(meta, encoding="utf-8") as f:
+            return path, json.load(f).get("title", "audio"), key
+
+    def fetch(self, url):
+        """Return (mp3 path, title, key), downloading at most once per video id."""
+        cache_id = self.extractor.video_id(url)
+        if not cache_id:
+            # The id is only known from the metadata; the extractor checks the
+            # cache before it downloads anything
+            return self._download(url, None)
+
+        hit = self.lookup(cache_id)
+        if hit:
+            return hit
+        return self._single_flight(cache_id, lambda: self._locked_download(url, cache_id))
+
+    def _single_flight(self, cache_id, work):
+        with self._lock:
+            flight = self._flights.get(cache_id)
+            leader = flight is None
+            if leader:
+                flight = self._flights[cache_id] = _Flight()
+        if not leader:
+            return flight.wait()
+        try:
+            flight.result = work()
+        except BaseException as e:
+            flight.error = e
+            raise
+        finally:
+            with self._lock:
+                self._flights.pop(cache_id, None)
+            flight.done.set()
+        return flight.result
+
+    def _locked_download(self, url, cache_id):
+        with open(os.path.join(self._lock_dir, f"{cache_id}.lock"), "w") as lock:
+            fcntl.flock(lock, fcntl.LOCK_EX)
+            # Another worker may have finished it while we waited for the lock
+            hit = self.lookup(cache_id)
+            if hit:
+                return hit
+            return self._download(url, cache_id)
+
+    def _download(self, url, cache_id):
+        work_dir = storage.mkdtemp(prefix="audio_", ttl=3600)
+        try:
+            resolved, mp3_path, title = self.extractor.download(
+                url, work_dir, known=None if cache_id else self.lookup
+            )
+            hit = self.lookup(resolved) if mp3_path is None else None
+            if mp3_path is None and hit is None:
+                # Evicted between the check and now
+                resolved, mp3_path, title = self.extractor.download(url, work_dir)
+            return hit or self._store(resolved, mp3_path, title)
+        finally:
+            storage.release(work_dir)
+
+    def _store(self, cache_id, mp3_path, title):
+        key = self.key(cache_id)
+        self.cache.put_bytes(make_key("youtube-mp3-meta", [cache_id]), json.dumps({"title": title}).encode("utf-8"))
+        path = self.cache.put(key, mp3_path)
+        if path is None:
+            # Cache disabled: hand out a copy that outlives the work directory
+            path = storage.allocate(f"{cache_id}.mp3")
+            shutil.copyfile(mp3_path, path)
+        return path, title, key
+
+
+class _Flight:
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+
+    def wait(self):
+        self.done.wait()
+        if self.error is not None:
+            raise self.error
+        return self.result
+
+
+audio_cache = AudioCache()
+
+
+def download_youtube_mp3(url):
+    """Return (mp3 path, title, cache key) for a video, from the cache when it was fetched before."""
+    return audio_cache.fetch(url)
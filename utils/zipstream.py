@@ -0,0 +1,46 @@
+import zipfile
+
+# Fixed timestamp so the same entries always produce the same archive bytes
+ZIP_DATE_TIME = (1980, 1, 1, 0, 0, 0)
+
+
+class _ChunkWriter:
+    """
+    Write-only sink for ZipFile. It has no seek(), so ZipFile writes data
+    descriptors instead of rewinding, and the bytes can be sent as they come.
+    """
+
+    def __init__(self):
+        self._chunks = []
+        self._offset = 0
+
+    def write(self, data):
+        self._chunks.append(bytes(data))
+        self._offset += len(data)
+        return len(data)
+
+    def tell(self):
+        return self._offset
+
+    def flush(self):
+        pass
+
+    def pop(self):
+        data = b"".join(self._chunks)
+        self._chunks.clear()
+        return data
+
+
+def stream_zip(entries, compression=zipfile.ZIP_STORED):
+    """
+    Build a ZIP archive from (name, data) pairs and yield it chunk by chunk.
+    Only the current entry is held in memory, and nothing touches the disk.
+    """
+    writer = _ChunkWriter()
+    with zipfile.ZipFile(writer, "w", compression) as zipf:
+        for name, data in entries:
+            info = zipfile.ZipInfo(name, date_time=ZIP_DATE_TIME)
+            info.compress_type = compression
+            zipf.writestr(info, data)
+            yield writer.pop()
+    yield writer.pop()